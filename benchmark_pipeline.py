@@ -0,0 +1,236 @@
+"""
+Training Pipeline Benchmarks
+============================
+
+Times each stage of ``train_erm_model.py`` on synthetic patient datasets of
+increasing size and keeps a JSON history so slowdowns are caught before they
+reach the nightly retrain.
+
+For every (stage, size) the harness records wall time, peak RSS during the
+stage and throughput (rows/s), and flags a regression when wall time exceeds
+the median of the previous runs by more than ``--threshold``.
+
+Usage:
+    python benchmark_pipeline.py --sizes 5k,50k --stages load,split,preprocess
+    python benchmark_pipeline.py --sizes 5k,50k,500k,5M
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from clinical_features import SYMPTOM_VOCABULARY, engineer_clinical_features
+from instrumentation import PeakRSS
+import train_erm_model as pipeline
+
+DEFAULT_SIZES = '5k,50k,500k,5M'
+STAGES = ('load', 'split', 'preprocess', 'train', 'evaluate')
+BENCH_DIR = 'benchmarks'
+HISTORY_FILE = os.path.join(BENCH_DIR, 'history.json')
+CONDITIONS = ['None', 'Hypertension', 'Diabetes', 'Heart Disease', 'Asthma']
+CONDITION_WEIGHTS = [0.43, 0.17, 0.14, 0.14, 0.12]
+
+
+def parse_size(text):
+    """'5k' → 5000, '5M' → 5000000."""
+    text = text.strip().lower()
+    scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip('km')) * scale)
+
+
+def generate_synthetic_patients(path, n_rows, seed=0, chunk_rows=500_000):
+    """
+    Write a synthetic CSV shaped like patient_dataset_5000_realistic.csv.
+
+    Rows are generated and written in chunks so multi-million-row files do
+    not need to be held in memory.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(SYMPTOM_VOCABULARY, dtype=object)
+    with open(path, 'w', newline='') as f:
+        for start in range(0, n_rows, chunk_rows):
+            n = min(chunk_rows, n_rows - start)
+            n_symptoms = rng.integers(1, 4, size=n)
+            picks = np.argsort(rng.random((n, len(vocabulary))), axis=1)[:, :3]
+            symptoms = [', '.join(vocabulary[row[:k]]) for row, k in zip(picks, n_symptoms)]
+            systolic = rng.integers(90, 181, size=n)
+            diastolic = rng.integers(60, 121, size=n)
+            chunk = pd.DataFrame({
+                'Patient_ID': [f"RP{i:08d}" for i in range(start + 1, start + n + 1)],
+                'Age': np.clip(rng.normal(45, 18, size=n).round(), 1, 90).astype(int),
+                'Gender': rng.choice(['Male', 'Female'], size=n),
+                'Symptoms': symptoms,
+                'Blood Pressure': [f"{s}/{d}" for s, d in zip(systolic, diastolic)],
+                'Heart Rate': rng.integers(60, 131, size=n),
+                'Temperature': (rng.integers(365, 401, size=n) / 10).round(1),
+                'Pre-Existing Conditions': rng.choice(CONDITIONS, size=n, p=CONDITION_WEIGHTS),
+            })
+            chunk.to_csv(f, header=start == 0, index=False)
+    return path
+
+
+def _measure(name, n_rows, fn, results, verbose):
+    """Run one stage quietly and append its measurement."""
+    with PeakRSS() as rss, contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        value = fn()
+        wall = time.perf_counter() - start
+    results.append({
+        'stage': name,
+        'rows': n_rows,
+        'wall_seconds': round(wall, 4),
+        'peak_rss_mb': round(rss.peak_bytes / 1024 ** 2, 1),
+        'rows_per_second': round(n_rows / wall, 1) if wall > 0 else None,
+    })
+    if verbose:
+        r = results[-1]
+        print(f"  {name:32s} {r['wall_seconds']:9.3f}s  {r['peak_rss_mb']:9.1f} MB  "
+              f"{r['rows_per_second'] or 0:12,.0f} rows/s")
+    return value
+
+
+def run_pipeline_stages(csv_path, n_rows, stages, cores=None, verbose=True):
+    """
+    Run the selected pipeline stages on one dataset and measure each.
+
+    Later stages need the outputs of earlier ones, so prerequisites always
+    run; only the selected stages are recorded.
+    """
+    results = []
+
+    def record(name, fn):
+        if name.split(':')[0] in stages:
+            return _measure(name, n_rows, fn, results, verbose)
+        return fn()
+
+    df, target = record('load', lambda: pipeline.load_and_explore_data(csv_path, use_cache=False))
+    df = engineer_clinical_features(df)
+    X_train, X_val, X_test, y_train, y_val, y_test = record(
+        'split', lambda: pipeline.split_data(df, target))
+
+    def preprocess():
+        num, cat = pipeline.identify_feature_types(X_train, X_val, X_test)
+        pre = pipeline.create_preprocessing_pipeline(X_train, num, cat)
+        return pre.fit_transform(X_train), pre.transform(X_val), pre.transform(X_test)
+
+    Xt_train, Xt_val, Xt_test = record('preprocess', preprocess)
+    if 'train' not in stages and 'evaluate' not in stages:
+        return results
+
+    planner = pipeline.ParallelismPlanner(cores=cores)
+    class_weight = pipeline.detect_class_weight(y_train, verbose=False)
+    best = None
+    for _, model_name, model, grid in pipeline.build_model_specs(y_train, class_weight):
+        search, resource_name = pipeline.DEFAULT_SEARCH_STRATEGIES[model_name]
+        fitted, val_acc = record(f"train:{model_name}", lambda: pipeline.train_model_with_erm(
+            model, Xt_train, y_train, Xt_val, y_val, grid, model_name,
+            search=search, resource=resource_name, planner=planner))
+        if best is None or val_acc > best[2]:
+            best = (model_name, fitted, val_acc)
+
+    # evaluate_best_model writes its PNGs to the working directory; keep them out of the repo root
+    with contextlib.chdir(BENCH_DIR):
+        record('evaluate', lambda: pipeline.evaluate_best_model(
+            best[1], best[0], Xt_train, Xt_val, Xt_test, y_train, y_val, y_test, [], plots='sync'))
+    return results
+
+
+def load_history(path=HISTORY_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def find_regressions(history, results, threshold, window=5):
+    """
+    Compare results against the median of the last ``window`` runs.
+
+    Returns:
+        List of (stage, rows, baseline_seconds, current_seconds)
+    """
+    regressions = []
+    for r in results:
+        previous = [p['wall_seconds'] for run in history[-window:] for p in run['results']
+                    if p['stage'] == r['stage'] and p['rows'] == r['rows']]
+        if not previous:
+            continue
+        baseline = float(np.median(previous))
+        if r['wall_seconds'] > baseline * (1 + threshold):
+            regressions.append((r['stage'], r['rows'], baseline, r['wall_seconds']))
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ERM training pipeline stages")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="Comma-separated dataset sizes (e.g. 5k,50k)")
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help=f"Comma-separated stages to record ({', '.join(STAGES)})")
+    parser.add_argument('--cores', type=int, default=None, help="Core budget for training stages")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Flag a regression when wall time exceeds the baseline by this fraction")
+    parser.add_argument('--history', default=HISTORY_FILE, help="JSON history file")
+    parser.add_argument('--no-record', action='store_true', help="Do not append this run to the history")
+    args = parser.parse_args(argv)
+
+    stages = set(args.stages.split(','))
+    unknown = stages - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {sorted(unknown)}")
+
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    history = load_history(args.history)
+    results = []
+    for size in args.sizes.split(','):
+        n_rows = parse_size(size)
+        csv_path = os.path.join(BENCH_DIR, f"synthetic_{n_rows}.csv")
+        if not os.path.exists(csv_path):
+            print(f"Generating {n_rows:,} synthetic patients → {csv_path}")
+            generate_synthetic_patients(csv_path, n_rows)
+        print(f"\n{'─' * 80}\nDataset: {n_rows:,} rows\n{'─' * 80}")
+        results.extend(run_pipeline_stages(csv_path, n_rows, stages, cores=args.cores))
+
+    regressions = find_regressions(history, results, args.threshold)
+    if regressions:
+        print(f"\n⚠ {len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for stage, rows, baseline, current in regressions:
+            print(f"  {stage:32s} {rows:>10,} rows: {baseline:.3f}s → {current:.3f}s "
+                  f"(+{(current / baseline - 1) * 100:.0f}%)")
+    else:
+        print("\n✓ No regressions against history")
+
+    if not args.no_record:
+        history.append({
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': _git_commit(),
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'results': results,
+        })
+        with open(args.history, 'w') as f:
+            json.dump(history, f, indent=2)
+        print(f"✓ Results appended to {args.history}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+Clinical Feature Extraction
+===========================
+
+Vectorized feature engineering for the raw patient columns:
+
+- ``Blood Pressure`` ("104/68") is parsed into numeric systolic and
+  diastolic columns instead of being one-hot encoded as a whole string.
+- ``Symptoms`` ("Body Ache, Fever, Fatigue") becomes a multi-hot matrix
+  over a fixed symptom vocabulary plus a symptom count, instead of one
+  category per distinct symptom combination.
+
+All operations are batched pandas string ops; they run over the distinct
+values of a column and are gathered back by code, with no per-row Python
+loops.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# Fixed vocabulary so the feature layout does not depend on which rows are seen
+SYMPTOM_VOCABULARY = [
+    'Abdominal Pain',
+    'Body Ache',
+    'Chest Pain',
+    'Cough',
+    'Diarrhea',
+    'Dizziness',
+    'Fatigue',
+    'Fever',
+    'Headache',
+    'Nausea',
+    'Shortness of Breath',
+    'Sore Throat',
+    'Vomiting',
+    'Weakness',
+]
+
+BP_PATTERN = r'^\s*(\d{2,3})\s*/\s*(\d{2,3})\s*$'
+
+# Bump when the engineered columns change (keys the dataset cache)
+FEATURES_VERSION = 1
+
+
+def symptom_column(symptom):
+    """Feature column name for one symptom."""
+    return f"Symptom_{symptom}"
+
+
+def raw_column(feature):
+    """The raw patient column an engineered column is derived from."""
+    if feature in ('Systolic BP', 'Diastolic BP'):
+        return 'Blood Pressure'
+    if feature.startswith('Symptom_') or feature == 'Symptom Count':
+        return 'Symptoms'
+    return feature
+
+
+def _per_unique(series, encode):
+    """
+    Apply a column encoder to the distinct values only, then gather by code.
+
+    Patient columns repeat heavily (a few thousand BP readings, ~100 symptom
+    combinations), so encoding the uniques and indexing is much cheaper than
+    running string ops over every row. Missing values map to an all-NaN /
+    all-zero row produced by ``encode`` for an empty input string.
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    table = encode(pd.Series(list(uniques) + [''], dtype=object))
+    # Code -1 (missing) picks the trailing row encoded from ''
+    rows = table.to_numpy()[np.where(codes < 0, len(uniques), codes)]
+    return pd.DataFrame(rows, index=series.index, columns=table.columns).astype(table.dtypes.to_dict())
+
+
+def _split_bp_strings(bp):
+    parts = bp.astype(str).str.extract(BP_PATTERN)
+    parts.columns = ['Systolic BP', 'Diastolic BP']
+    return parts.apply(pd.to_numeric, errors='coerce').astype(np.float32)
+
+
+def split_blood_pressure(bp):
+    """
+    Parse "systolic/diastolic" strings into two numeric columns.
+
+    Malformed or missing readings become NaN (imputed downstream).
+
+    Returns:
+        DataFrame with 'Systolic BP' and 'Diastolic BP' (float32)
+    """
+    return _per_unique(bp, _split_bp_strings)
+
+
+def _encode_symptom_strings(symptoms, vocabulary):
+    normalized = symptoms.astype(str).str.replace(r'\s*,\s*', ',', regex=True).str.strip()
+    dummies = normalized.str.get_dummies(sep=',')
+
+    known = [s for s in vocabulary if s in dummies.columns]
+    encoded = pd.DataFrame(0, index=symptoms.index, columns=vocabulary, dtype=np.int8)
+    encoded[known] = dummies[known].to_numpy(dtype=np.int8)
+    encoded.columns = [symptom_column(s) for s in vocabulary]
+
+    total = dummies.sum(axis=1).astype(np.int8)
+    in_vocabulary = encoded.sum(axis=1).astype(np.int8)
+    encoded['Symptom Count'] = total
+    encoded['Symptom_Other'] = total - in_vocabulary
+    return encoded
+
+
+def encode_symptoms(symptoms, vocabulary=SYMPTOM_VOCABULARY):
+    """
+    Multi-hot encode comma-separated symptom lists over a fixed vocabulary.
+
+    Returns:
+        DataFrame with one int8 column per vocabulary symptom, plus
+        'Symptom Count' (all listed symptoms) and 'Symptom_Other'
+        (symptoms outside the vocabulary)
+    """
+    return _per_unique(symptoms, lambda uniques: _encode_symptom_strings(uniques, vocabulary))
+
+
+def engineer_clinical_features(df):
+    """
+    Replace the raw 'Blood Pressure' and 'Symptoms' columns with numeric features.
+
+    Columns other than those two are kept unchanged and in place, so the
+    target column and ID columns are unaffected.
+
+    Args:
+        df: Patient DataFrame
+
+    Returns:
+        DataFrame with engineered columns
+    """
+    parts = []
+    for col in df.columns:
+        if col == 'Blood Pressure':
+            parts.append(split_blood_pressure(df[col]))
+        elif col == 'Symptoms':
+            parts.append(encode_symptoms(df[col]))
+        else:
+            parts.append(df[[col]])
+    return pd.concat(parts, axis=1)
+
+
+_BP_REGEX = re.compile(BP_PATTERN)
+
+
+def engineer_record(record):
+    """
+    Single-record equivalent of ``engineer_clinical_features``.
+
+    Works on a plain dict without building a DataFrame, for low-latency
+    scoring. Produces exactly the same engineered columns.
+    """
+    out = {k: v for k, v in record.items() if k not in ('Blood Pressure', 'Symptoms')}
+
+    if 'Blood Pressure' in record:
+        match = _BP_REGEX.match(str(record['Blood Pressure'] or ''))
+        out['Systolic BP'] = float(match.group(1)) if match else np.nan
+        out['Diastolic BP'] = float(match.group(2)) if match else np.nan
+
+    if 'Symptoms' in record:
+        raw = record['Symptoms']
+        listed = {s.strip() for s in str(raw).split(',')} - {''} if isinstance(raw, str) else set()
+        in_vocabulary = 0
+        for symptom in SYMPTOM_VOCABULARY:
+            present = int(symptom in listed)
+            out[symptom_column(symptom)] = present
+            in_vocabulary += present
+        out['Symptom Count'] = len(listed)
+        out['Symptom_Other'] = len(listed) - in_vocabulary
+    return out
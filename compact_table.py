@@ -0,0 +1,365 @@
+"""
+Compact Patient Table
+=====================
+
+A compact in-memory representation of the patient frame, converted to and
+from the pandas DataFrame the scripts use:
+
+- low-cardinality text and categoricals: dictionary codes in the narrowest
+  integer type plus one copy of each distinct value;
+- vitals: the narrowest integer type holding their range (int8 age, int16
+  heart rate), float32 temperature;
+- ``Patient_ID`` ("RP00001"): a shared prefix and a uint32 number;
+- ``Blood Pressure`` ("104/68"): two uint8 readings;
+- ``Symptoms`` ("Body Ache, Fever, Fatigue"): a bitset over the symptom
+  vocabulary plus a one-byte code for the order the symptoms were listed in,
+  so bit tests answer "has symptom X" and the original string round-trips.
+
+Every special encoding is checked against the distinct values it replaces;
+a column whose values it cannot reproduce exactly falls back to dictionary
+codes. Missing values are kept via masks / sentinel codes.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from clinical_features import SYMPTOM_VOCABULARY
+
+# Symptom order codes: the order of up to 5 listed symptoms fits in a byte (5! = 120)
+MAX_ORDERED_SYMPTOMS = 5
+_ORDER_EXCEPTION = 254
+_ORDER_MISSING = 255
+
+# Rows allowed to keep their raw symptom string before the column falls back to codes
+_MAX_EXCEPTION_RATE = 0.01
+
+
+def _narrow_int(low, high, unsigned=False):
+    """Smallest integer dtype holding [low, high]."""
+    for dtype in ((np.uint8, np.uint16, np.uint32, np.uint64) if unsigned else
+                  (np.int8, np.int16, np.int32, np.int64)):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    raise OverflowError(f"No integer dtype holds [{low}, {high}]")
+
+
+def _restore(values, dtype):
+    """Build a column of the original dtype from object/NaN values."""
+    if isinstance(dtype, pd.CategoricalDtype):
+        return pd.Categorical(values, dtype=dtype)
+    return pd.array(values, dtype=dtype)
+
+
+# ----------------------------------------------------------------------------
+# Dictionary codes (categoricals, low-cardinality text, fallback)
+# ----------------------------------------------------------------------------
+
+def _encode_dictionary(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, values = series.cat.codes.to_numpy(), np.asarray(series.cat.categories, dtype=object)
+    else:
+        codes, values = pd.factorize(series, use_na_sentinel=True)
+        values = np.asarray(values, dtype=object)
+    return {'kind': 'dictionary', 'codes': codes.astype(_narrow_int(-1, max(len(values), 1))),
+            'values': values}
+
+
+def _decode_dictionary(column, dtype):
+    codes, values = column['codes'], column['values']
+    if isinstance(dtype, pd.CategoricalDtype):
+        return pd.Categorical.from_codes(codes.astype(np.int64), dtype=dtype)
+    decoded = values.take(np.where(codes < 0, 0, codes)) if len(values) else np.full(len(codes), np.nan, object)
+    decoded[codes < 0] = np.nan
+    return _restore(decoded, dtype)
+
+
+# ----------------------------------------------------------------------------
+# Numbers
+# ----------------------------------------------------------------------------
+
+def _encode_integer(series):
+    mask = series.isna().to_numpy()
+    values = series.to_numpy(dtype=np.float64, na_value=0)
+    present = values[~mask]
+    low, high = (int(present.min()), int(present.max())) if present.size else (0, 0)
+    return {'kind': 'integer', 'data': values.astype(_narrow_int(low, high)),
+            'mask': mask if mask.any() else None}
+
+
+def _decode_integer(column, dtype):
+    data = column['data'].astype(dtype.numpy_dtype if hasattr(dtype, 'numpy_dtype') else dtype)
+    if column['mask'] is None:
+        return pd.array(data, dtype=dtype)
+    values = data.astype(object)
+    values[column['mask']] = pd.NA if hasattr(dtype, 'numpy_dtype') else np.nan
+    return pd.array(values, dtype=dtype)
+
+
+def _encode_float(series, force_float32=False):
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    narrow = values.astype(np.float32)
+    if force_float32 or np.array_equal(narrow.astype(np.float64), values, equal_nan=True):
+        return {'kind': 'float', 'data': narrow}
+    return {'kind': 'float', 'data': values}
+
+
+def _decode_float(column, dtype):
+    return pd.array(column['data'], dtype=dtype)
+
+
+# ----------------------------------------------------------------------------
+# Patient IDs: prefix + zero-padded number
+# ----------------------------------------------------------------------------
+
+def _encode_ids(series):
+    mask = series.isna().to_numpy()
+    parts = series[~mask].astype(str).str.extract(r'^(\D*)(\d+)$')
+    if parts.isna().any().any() or parts[0].nunique() > 1 or parts[1].str.len().nunique() > 1:
+        return None
+    if parts.empty:
+        return None
+    numbers = parts[1].astype(np.int64).to_numpy()
+    if numbers.max() > np.iinfo(np.uint32).max:
+        return None
+    data = np.zeros(len(series), dtype=np.uint32)
+    data[~mask] = numbers
+    return {'kind': 'id', 'prefix': parts[0].iloc[0], 'width': len(parts[1].iloc[0]),
+            'data': data, 'mask': mask if mask.any() else None}
+
+
+def _decode_ids(column, dtype):
+    prefix, width = column['prefix'], column['width']
+    text = pd.Series(column['data']).astype(str).str.zfill(width).radd(prefix).to_numpy(dtype=object)
+    if column['mask'] is not None:
+        text[column['mask']] = np.nan
+    return _restore(text, dtype)
+
+
+# ----------------------------------------------------------------------------
+# Blood pressure: two small integers
+# ----------------------------------------------------------------------------
+
+def _encode_blood_pressure(series):
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    parts = pd.Series(uniques, dtype=object).astype(str).str.extract(r'^(\d{1,3})/(\d{1,3})$')
+    if parts.isna().any().any():
+        return None
+    readings = parts.astype(np.int64).to_numpy()
+    rendered = [f"{s}/{d}" for s, d in readings]
+    if rendered != [str(u) for u in uniques]:
+        return None  # leading zeros or other non-canonical spellings
+    dtype = _narrow_int(0, int(readings.max()) if readings.size else 0, unsigned=True)
+    rows = readings.astype(dtype)[np.where(codes < 0, 0, codes)] if readings.size else \
+        np.zeros((len(series), 2), dtype=dtype)
+    mask = codes < 0
+    return {'kind': 'blood_pressure', 'systolic': np.ascontiguousarray(rows[:, 0]),
+            'diastolic': np.ascontiguousarray(rows[:, 1]), 'mask': mask if mask.any() else None}
+
+
+def _decode_blood_pressure(column, dtype):
+    pairs = pd.DataFrame({'s': column['systolic'], 'd': column['diastolic']})
+    codes, uniques = pd.factorize(pd.MultiIndex.from_frame(pairs))
+    table = np.array([f"{s}/{d}" for s, d in uniques], dtype=object)
+    text = table[codes] if len(table) else np.empty(0, dtype=object)
+    if column['mask'] is not None:
+        text[column['mask']] = np.nan
+    return _restore(text, dtype)
+
+
+# ----------------------------------------------------------------------------
+# Symptoms: vocabulary bitset + listing-order code
+# ----------------------------------------------------------------------------
+
+def _lehmer(permutation):
+    """Index of a permutation of range(k) in lexicographic order."""
+    k, code = len(permutation), 0
+    for i, p in enumerate(permutation):
+        code += sum(q < p for q in permutation[i + 1:]) * math.factorial(k - 1 - i)
+    return code
+
+
+def _from_lehmer(code, k):
+    remaining, permutation = list(range(k)), []
+    for i in range(k):
+        index, code = divmod(code, math.factorial(k - 1 - i))
+        permutation.append(remaining.pop(index))
+    return permutation
+
+
+def _symptom_code(text, position):
+    """(bits, order code) of one symptom string, or None if it does not round-trip."""
+    parts = text.split(', ') if text else []
+    if (len(parts) > MAX_ORDERED_SYMPTOMS or len(set(parts)) != len(parts)
+            or any(p not in position for p in parts)):
+        return None
+    indices = [position[p] for p in parts]
+    members = sorted(indices)
+    bits = sum(1 << i for i in indices)
+    return bits, _lehmer([members.index(i) for i in indices])
+
+
+def _encode_symptoms(series, vocabulary):
+    position = {symptom: i for i, symptom in enumerate(vocabulary)}
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    encoded = [_symptom_code(str(u), position) for u in uniques]
+
+    bits_dtype = _narrow_int(0, (1 << len(vocabulary)) - 1, unsigned=True)
+    table_bits = np.array([e[0] if e else 0 for e in encoded] + [0], dtype=bits_dtype)
+    table_order = np.array([e[1] if e else _ORDER_EXCEPTION for e in encoded] + [_ORDER_MISSING],
+                           dtype=np.uint8)
+    rows = np.where(codes < 0, len(uniques), codes)
+    order = table_order[rows]
+
+    exception_rows = np.flatnonzero(order == _ORDER_EXCEPTION)
+    if len(exception_rows) > _MAX_EXCEPTION_RATE * len(series):
+        return None
+    exceptions = dict(zip(exception_rows.tolist(), (str(uniques[codes[r]]) for r in exception_rows)))
+    return {'kind': 'symptoms', 'vocabulary': list(vocabulary), 'bits': table_bits[rows],
+            'order': order, 'exceptions': exceptions}
+
+
+def _decode_symptoms(column, dtype):
+    vocabulary = column['vocabulary']
+    pairs = pd.DataFrame({'b': column['bits'], 'o': column['order']})
+    codes, uniques = pd.factorize(pd.MultiIndex.from_frame(pairs))
+    table = []
+    for bits, order in uniques:
+        if order == _ORDER_MISSING or order == _ORDER_EXCEPTION:
+            table.append(np.nan)
+            continue
+        members = [i for i in range(len(vocabulary)) if bits >> i & 1]
+        permutation = _from_lehmer(int(order), len(members))
+        table.append(', '.join(vocabulary[members[p]] for p in permutation))
+    text = np.array(table, dtype=object)[codes] if table else np.empty(0, dtype=object)
+    for row, value in column['exceptions'].items():
+        text[row] = value
+    return _restore(text, dtype)
+
+
+_DECODERS = {
+    'dictionary': _decode_dictionary,
+    'integer': _decode_integer,
+    'float': _decode_float,
+    'id': _decode_ids,
+    'blood_pressure': _decode_blood_pressure,
+    'symptoms': _decode_symptoms,
+}
+
+
+def _encode_column(name, series, vocabulary):
+    dtype = series.dtype
+    special = None
+    if name == 'Patient_ID':
+        special = _encode_ids(series)
+    elif name == 'Blood Pressure':
+        special = _encode_blood_pressure(series)
+    elif name == 'Symptoms':
+        special = _encode_symptoms(series, vocabulary)
+    if special is not None:
+        return special
+
+    if isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(dtype) or dtype == object:
+        return _encode_dictionary(series)
+    if pd.api.types.is_bool_dtype(dtype):
+        return {'kind': 'raw', 'data': series.to_numpy()}
+    if pd.api.types.is_integer_dtype(dtype):
+        return _encode_integer(series)
+    if pd.api.types.is_float_dtype(dtype):
+        # Temperature is float32 in the ingest schema as well
+        return _encode_float(series, force_float32=name == 'Temperature')
+    return {'kind': 'raw', 'data': series.to_numpy()}
+
+
+def _column_nbytes(column):
+    total = 0
+    for key, value in column.items():
+        if isinstance(value, np.ndarray):
+            total += value.nbytes
+            if value.dtype == object:
+                total += sum(len(str(v)) + 49 for v in value)  # CPython str object overhead
+        elif key == 'exceptions':
+            total += sum(8 + len(v) + 49 for v in value.values())
+    return total
+
+
+class CompactPatientTable:
+    """
+    Column-encoded patient table.
+
+    Build with ``from_frame`` and convert back with ``to_frame``; the
+    round trip restores the original values and dtypes (a float64
+    Temperature comes back as its float32 value).
+    """
+
+    def __init__(self, columns, dtypes, index):
+        self.columns = columns
+        self.dtypes = dtypes
+        self.index = index
+
+    @classmethod
+    def from_frame(cls, df, vocabulary=SYMPTOM_VOCABULARY):
+        columns = {col: _encode_column(col, df[col], vocabulary) for col in df.columns}
+        return cls(columns, df.dtypes.to_dict(), df.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def to_frame(self):
+        data = {}
+        for col, column in self.columns.items():
+            if column['kind'] == 'raw':
+                data[col] = column['data']
+            else:
+                data[col] = _DECODERS[column['kind']](column, self.dtypes[col])
+        return pd.DataFrame(data, index=self.index)
+
+    def symptom_mask(self, symptom):
+        """Boolean array: which patients list ``symptom`` (a bit test on the bitset)."""
+        column = self.columns['Symptoms']
+        if column['kind'] != 'symptoms':
+            frame = self.to_frame()
+            return frame['Symptoms'].str.split(', ').apply(lambda s: isinstance(s, list) and symptom in s)
+        bit = column['vocabulary'].index(symptom)
+        return (column['bits'] >> bit & 1).astype(bool)
+
+    def memory_usage(self):
+        """Bytes per column, including the distinct values of dictionary columns."""
+        return pd.Series({col: _column_nbytes(column) for col, column in self.columns.items()},
+                         dtype='int64')
+
+    @property
+    def nbytes(self):
+        return int(self.memory_usage().sum())
+
+    def encodings(self):
+        """Encoding and storage dtype per column."""
+        summary = {}
+        for col, column in self.columns.items():
+            arrays = [v for k, v in column.items() if isinstance(v, np.ndarray) and k != 'values'
+                      and k != 'mask']
+            summary[col] = f"{column['kind']} ({', '.join(str(a.dtype) for a in arrays)})"
+        return pd.Series(summary)
+
+
+def memory_report(frames):
+    """
+    Per-column footprint of several representations of the same rows.
+
+    Args:
+        frames: {label: DataFrame or CompactPatientTable}
+
+    Returns:
+        DataFrame of bytes per column (plus a 'TOTAL' row), one column per label
+    """
+    usage = {}
+    for label, frame in frames.items():
+        if isinstance(frame, CompactPatientTable):
+            usage[label] = frame.memory_usage()
+        else:
+            usage[label] = frame.memory_usage(deep=True, index=False)
+    report = pd.DataFrame(usage)
+    report.loc['TOTAL'] = report.sum()
+    return report
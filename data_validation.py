@@ -0,0 +1,324 @@
+"""
+Data-Quality Validation
+=======================
+
+Declarative rules for the patient columns, compiled into one vectorized
+pass per chunk:
+
+- ``Required``: missing-value policy (NaN, empty or whitespace-only values
+  violate it);
+- ``Range``: numeric bounds on vitals and age (values that do not parse as
+  numbers violate it too);
+- ``Pattern``: a regular expression the whole value must match (the
+  ``systolic/diastolic`` blood pressure format);
+- ``Vocabulary``: allowed values, or allowed items of a separated list
+  (the symptom vocabulary).
+
+``Validator`` gives every rule one bit and returns a per-row violation
+bitmask. Text rules are evaluated on the distinct values of a chunk only
+(factorized once per column and shared by that column's rules) and
+gathered back by code, so repetitive columns cost a few thousand string
+checks per chunk rather than one per row. ``ValidationReport`` accumulates
+counts and example rows across chunks.
+
+Every ingest validates: ``ingest.StreamingProfile`` runs the default rules
+on each chunk it profiles and keeps the report. For a standalone check
+that also writes the bitmasks:
+    python data_validation.py patient_dataset_5000_realistic.csv --masks masks.npy
+"""
+
+import argparse
+import re
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from clinical_features import BP_PATTERN, SYMPTOM_VOCABULARY
+
+MAX_EXAMPLES = 5
+
+
+def _numeric(series):
+    """Float values of a column; values that do not parse become NaN."""
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return series.to_numpy(dtype=np.float64, na_value=np.nan)
+    return pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _check_present(rule, series):
+    """Run a text rule on the non-missing values of a non-text column."""
+    out = np.zeros(len(series), dtype=bool)
+    present = series.notna().to_numpy()
+    out[present] = rule.check_values(pd.Series(series[present].astype(str).to_numpy(), dtype='string'))
+    return out
+
+
+@dataclass(frozen=True)
+class Required:
+    """The column must have a non-blank value."""
+    column: str
+
+    @property
+    def name(self):
+        return f"{self.column}: missing"
+
+    def check_numeric(self, values, series):
+        return series.isna().to_numpy()
+
+    def check_values(self, uniques):
+        return uniques.str.strip().eq('').to_numpy()
+
+    def check_missing(self):
+        return True
+
+
+@dataclass(frozen=True)
+class Range:
+    """Numeric values must lie in [low, high]; missing values are left to ``Required``."""
+    column: str
+    low: float
+    high: float
+
+    @property
+    def name(self):
+        return f"{self.column}: outside [{self.low:g}, {self.high:g}]"
+
+    def check_numeric(self, values, series):
+        with np.errstate(invalid='ignore'):
+            out = (values < self.low) | (values > self.high)
+        # Present but unparseable ('abc', '98.6F') is out of range too
+        return out | (np.isnan(values) & series.notna().to_numpy())
+
+    def check_values(self, uniques):
+        values = pd.to_numeric(uniques, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        blank = uniques.str.strip().eq('').to_numpy()
+        with np.errstate(invalid='ignore'):
+            return ~blank & (np.isnan(values) | (values < self.low) | (values > self.high))
+
+    def check_missing(self):
+        return False
+
+
+@dataclass(frozen=True)
+class Pattern:
+    """The whole value must match ``regex``."""
+    column: str
+    regex: str
+
+    @property
+    def name(self):
+        return f"{self.column}: malformed"
+
+    def check_numeric(self, values, series):
+        return _check_present(self, series)
+
+    def check_values(self, uniques):
+        blank = uniques.str.strip().eq('').to_numpy()
+        return ~blank & ~uniques.str.fullmatch(self.regex).to_numpy(dtype=bool, na_value=False)
+
+    def check_missing(self):
+        return False
+
+
+@dataclass(frozen=True)
+class Vocabulary:
+    """Values (or every ``sep``-separated item) must come from ``allowed``."""
+    column: str
+    allowed: tuple
+    sep: str = None
+
+    @property
+    def name(self):
+        return f"{self.column}: unknown value"
+
+    def check_numeric(self, values, series):
+        return series.notna().to_numpy() & ~series.isin(self.allowed).to_numpy()
+
+    def check_values(self, uniques):
+        if self.sep is None:
+            values = uniques.str.strip()
+            return (values.ne('') & ~values.isin(list(self.allowed))).to_numpy()
+        items = uniques.str.split(re.escape(self.sep), regex=True).explode().str.strip()
+        unknown = (items.ne('') & ~items.isin(list(self.allowed))).groupby(level=0).any()
+        return unknown.reindex(uniques.index, fill_value=False).to_numpy()
+
+    def check_missing(self):
+        return False
+
+
+# Missing-value policy: columns a patient record must carry
+# ('Pre-Existing Conditions' is blank for patients without one)
+MISSING_POLICY = {
+    'Patient_ID': 'required',
+    'Age': 'required',
+    'Gender': 'required',
+    'Symptoms': 'required',
+    'Blood Pressure': 'required',
+    'Heart Rate': 'required',
+    'Temperature': 'required',
+    'Pre-Existing Conditions': 'optional',
+}
+
+DEFAULT_RULES = [
+    *(Required(column) for column, policy in MISSING_POLICY.items() if policy == 'required'),
+    Range('Age', 0, 120),
+    Range('Heart Rate', 30, 220),
+    Range('Temperature', 34.0, 43.0),
+    Pattern('Blood Pressure', BP_PATTERN),
+    Vocabulary('Symptoms', tuple(SYMPTOM_VOCABULARY), sep=','),
+]
+
+
+class Validator:
+    """
+    Rules compiled into a per-row bitmask (bit ``i`` set: rule ``i`` violated).
+
+    Args:
+        rules: Rule list (at most 64)
+    """
+
+    def __init__(self, rules=DEFAULT_RULES):
+        if len(rules) > 64:
+            raise ValueError(f"At most 64 rules fit in the bitmask, got {len(rules)}")
+        self.rules = list(rules)
+        self.dtype = np.uint32 if len(self.rules) <= 32 else np.uint64
+        self.by_column = {}
+        for bit, rule in enumerate(self.rules):
+            self.by_column.setdefault(rule.column, []).append((bit, rule))
+
+    def mask(self, frame):
+        """Violation bitmask of every row of ``frame`` (rules on absent columns are skipped)."""
+        mask = np.zeros(len(frame), dtype=self.dtype)
+        for column, rules in self.by_column.items():
+            if column not in frame:
+                continue
+            series = frame[column]
+            if pd.api.types.is_numeric_dtype(series.dtype):
+                values = _numeric(series)
+                for bit, rule in rules:
+                    mask |= rule.check_numeric(values, series).astype(self.dtype) << self.dtype(bit)
+                continue
+            # Text: every rule of the column runs on the distinct values, gathered by code
+            codes, uniques = pd.factorize(series, use_na_sentinel=True)
+            uniques = pd.Series(np.asarray(uniques, dtype=object), dtype='string')
+            table = np.zeros(len(uniques) + 1, dtype=self.dtype)
+            for bit, rule in rules:
+                table[:-1] |= rule.check_values(uniques).astype(self.dtype) << self.dtype(bit)
+                table[-1] |= self.dtype(rule.check_missing()) << self.dtype(bit)
+            mask |= table[codes]  # code -1 (missing) picks the trailing entry
+        return mask
+
+    def validate(self, frame, report=None, offset=0):
+        """Mask ``frame`` and add it to ``report`` (created if None); returns (mask, report)."""
+        report = report if report is not None else ValidationReport(self.rules)
+        mask = self.mask(frame)
+        report.update(mask, frame, offset)
+        return mask, report
+
+
+class ValidationReport:
+    """Violation counts and example rows, accumulated over chunks."""
+
+    def __init__(self, rules, max_examples=MAX_EXAMPLES):
+        self.rules = list(rules)
+        self.max_examples = max_examples
+        self.rows = 0
+        self.rows_with_violations = 0
+        self.counts = np.zeros(len(self.rules), dtype=np.int64)
+        self.examples = [[] for _ in self.rules]
+        self.missing_columns = set()
+
+    def update(self, mask, frame, offset=0):
+        self.rows += len(mask)
+        flagged = np.flatnonzero(mask)
+        self.rows_with_violations += len(flagged)
+        self.missing_columns |= {rule.column for rule in self.rules if rule.column not in frame}
+        if not len(flagged):
+            return self
+        bits = mask[flagged]
+        for i, rule in enumerate(self.rules):
+            hit = flagged[(bits >> bits.dtype.type(i)) & 1 == 1]
+            self.counts[i] += len(hit)
+            room = self.max_examples - len(self.examples[i])
+            if room > 0 and len(hit):
+                values = frame[rule.column].iloc[hit[:room]]
+                self.examples[i].extend((offset + int(r), v) for r, v in zip(hit[:room], values.tolist()))
+        return self
+
+    @property
+    def ok(self):
+        return self.rows_with_violations == 0 and not self.missing_columns
+
+    def summary(self):
+        """One row per rule: violations, share of rows and example (row, value) pairs."""
+        return pd.DataFrame({
+            'rule': [rule.name for rule in self.rules],
+            'violations': self.counts,
+            'pct': self.counts / max(self.rows, 1) * 100,
+            'examples': self.examples,
+        })
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'rows_with_violations': self.rows_with_violations,
+            'missing_columns': sorted(self.missing_columns),
+            'rules': {rule.name: int(n) for rule, n in zip(self.rules, self.counts)},
+        }
+
+    def format(self):
+        """Text report for the console."""
+        lines = [f"{self.rows} rows, {self.rows_with_violations} with violations "
+                 f"({self.rows_with_violations / max(self.rows, 1) * 100:.2f}%)"]
+        if self.missing_columns:
+            lines.append(f"  Columns not in the data (rules skipped): {sorted(self.missing_columns)}")
+        width = max(len(rule.name) for rule in self.rules)
+        for rule, n, examples in zip(self.rules, self.counts, self.examples):
+            mark = '✓' if n == 0 else '✗'
+            shown = ', '.join(f"row {r}: {v!r}" for r, v in examples[:3])
+            lines.append(f"  {mark} {rule.name:{width}s} {n:8d}" + (f"   e.g. {shown}" if shown else ""))
+        return '\n'.join(lines)
+
+
+def validate_csv(path, rules=DEFAULT_RULES, chunksize=None, mask_path=None):
+    """
+    Validate a patient CSV chunk by chunk.
+
+    Args:
+        mask_path: Optional .npy file receiving the per-row bitmask (kept in
+                   memory until written: 4 bytes per row for up to 32 rules)
+
+    Returns:
+        ValidationReport
+    """
+    from ingest import DEFAULT_CHUNKSIZE, iter_raw_chunks
+
+    validator = Validator(rules)
+    report = ValidationReport(validator.rules)
+    masks = []
+    # Validate the values as read: coercion would hide unparseable and out-of-range numbers
+    for chunk in iter_raw_chunks(path, chunksize or DEFAULT_CHUNKSIZE):
+        mask, _ = validator.validate(chunk, report, offset=report.rows)
+        if mask_path is not None:
+            masks.append(mask)
+    if mask_path is not None:
+        np.save(mask_path, np.concatenate(masks) if masks else np.zeros(0, dtype=validator.dtype))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate a patient CSV against the data-quality rules")
+    parser.add_argument('path', help="Patient CSV")
+    parser.add_argument('--chunksize', type=int, default=None, help="Rows per chunk")
+    parser.add_argument('--masks', default=None, help="Write the per-row violation bitmask to this .npy")
+    args = parser.parse_args(argv)
+    report = validate_csv(args.path, chunksize=args.chunksize, mask_path=args.masks)
+    print(report.format())
+    if args.masks:
+        print(f"✓ Violation bitmask written to: {args.masks} (bit i = rule i above)")
+    return 0 if report.ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,451 @@
+"""
+Columnar Dataset Cache
+======================
+
+Caches the parsed, typed patient dataset as one memory-mapped ``.npy`` file
+per column, keyed by a content hash of the source CSV. Later runs skip the
+text parse entirely and map the columns straight from disk:
+
+- numeric columns are returned as views on the memory map (zero-copy),
+- nullable integers are stored as values + mask,
+- categorical and string columns are dictionary-encoded (codes + values).
+
+The streaming profile from ``ingest`` is stored alongside, so exploration
+scripts can start from the cache as well.
+
+The content hash is built from per-block digests, which are remembered
+per source file with its size and modification time: an unchanged file is
+not re-hashed on the next run. Because of the block digests, a file that was
+appended to can be re-keyed by hashing only its last partial block and the
+new bytes (see ``incremental.find_appended_rows``), and the cached columns
+of the previous version are extended in place rather than rewritten.
+"""
+
+import hashlib
+import io
+import json
+import os
+import pickle
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+from ingest import concat_chunks, load_patient_data, profile_csv
+
+CACHE_DIR = '.dataset_cache'
+
+# Bump when the cached layout or the cached columns change
+CACHE_VERSION = 3
+
+
+# Bytes per hashed block of a source file
+DIGEST_BLOCK = 1 << 20
+
+# Block digests of each source file, keyed by path and stamped with size and mtime
+DIGEST_INDEX = 'digests.json'
+
+
+def block_digests(path, start=0, end=None, block_size=DIGEST_BLOCK):
+    """
+    BLAKE2b digests of the ``block_size`` blocks of a file between byte
+    offsets ``start`` (a block boundary) and ``end`` (default: end of file);
+    the last block may be partial.
+    """
+    blocks = []
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = np.inf if end is None else end - start
+        while remaining > 0:
+            block = f.read(int(min(block_size, remaining)))
+            if not block:
+                break
+            blocks.append(hashlib.blake2b(block, digest_size=16).hexdigest())
+            remaining -= len(block)
+    return blocks
+
+
+def combine_digests(blocks):
+    """Content hash of a file from its block digests."""
+    return hashlib.blake2b(b''.join(bytes.fromhex(b) for b in blocks), digest_size=16).hexdigest()
+
+
+def file_digest(path):
+    """Content hash of a file (BLAKE2b over the digests of its 1 MB blocks)."""
+    return combine_digests(block_digests(path))
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _read_index(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, DIGEST_INDEX)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def record_source_blocks(path, blocks, cache_dir=CACHE_DIR):
+    """Remember the block digests of ``path`` as it is now (size and mtime)."""
+    index = _read_index(cache_dir)
+    index[os.path.abspath(path)] = {'stamp': _stamp(path), 'blocks': blocks}
+    os.makedirs(cache_dir, exist_ok=True)
+    target = os.path.join(cache_dir, DIGEST_INDEX)
+    tmp = f"{target}.tmp-{os.getpid()}"
+    with open(tmp, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp, target)
+
+
+def source_blocks(path, cache_dir=CACHE_DIR):
+    """
+    Block digests of a source file, hashed only when its size or mtime
+    changed since they were last recorded.
+    """
+    entry = _read_index(cache_dir).get(os.path.abspath(path))
+    if entry is not None and entry['stamp'] == _stamp(path):
+        return entry['blocks']
+    blocks = block_digests(path)
+    record_source_blocks(path, blocks, cache_dir)
+    return blocks
+
+
+def cache_path(path, cache_dir=CACHE_DIR, digest=None):
+    """Cache directory for a source CSV (content hash + cache version)."""
+    digest = digest or combine_digests(source_blocks(path, cache_dir))
+    return os.path.join(cache_dir, f"{digest}-v{CACHE_VERSION}")
+
+
+def _encode_column(series, directory, name):
+    """Write one column; return its metadata entry."""
+    stem = os.path.join(directory, name)
+    dtype = series.dtype
+
+    if isinstance(dtype, pd.CategoricalDtype):
+        np.save(stem + '.codes.npy', series.cat.codes.to_numpy())
+        np.save(stem + '.values.npy', np.asarray(dtype.categories, dtype=str))
+        return {'kind': 'category', 'ordered': bool(dtype.ordered)}
+
+    if isinstance(series.array, (pd.arrays.IntegerArray, pd.arrays.FloatingArray, pd.arrays.BooleanArray)):
+        # Nullable integer / float / boolean arrays: values (0 where missing) + mask
+        np.save(stem + '.data.npy', series.to_numpy(dtype=dtype.numpy_dtype, na_value=0))
+        np.save(stem + '.mask.npy', series.isna().to_numpy())
+        return {'kind': 'masked', 'dtype': str(dtype)}
+
+    if pd.api.types.is_string_dtype(dtype) or dtype == object:
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        np.save(stem + '.codes.npy', codes.astype(np.int32))
+        np.save(stem + '.values.npy', np.asarray(uniques, dtype=str))
+        return {'kind': 'str', 'dtype': str(dtype)}
+
+    np.save(stem + '.npy', series.to_numpy())
+    return {'kind': 'numpy'}
+
+
+def _decode_column(meta, directory, name):
+    stem = os.path.join(directory, name)
+    kind = meta['kind']
+
+    if kind == 'numpy':
+        return np.load(stem + '.npy', mmap_mode='r')
+
+    if kind == 'masked':
+        data = np.load(stem + '.data.npy', mmap_mode='r')
+        mask = np.load(stem + '.mask.npy', mmap_mode='r')
+        array_type = pd.api.types.pandas_dtype(meta['dtype']).construct_array_type()
+        return array_type(data, mask)
+
+    codes = np.load(stem + '.codes.npy', mmap_mode='r')
+    values = np.load(stem + '.values.npy')
+    if kind == 'category':
+        return pd.Categorical.from_codes(codes, categories=values, ordered=meta['ordered'])
+
+    # Strings: decode through the dictionary, keeping missing entries as NaN
+    decoded = values.astype(object).take(np.where(codes < 0, 0, codes))
+    decoded[codes < 0] = np.nan
+    return pd.array(decoded, dtype=meta['dtype'])
+
+
+def save_frame(df, directory, profile=None, source=None):
+    """
+    Write a DataFrame (and optional profile) as a columnar cache directory.
+
+    The directory is written under a temporary name and renamed into place,
+    so an interrupted run never leaves a half-written cache behind.
+    """
+    tmp = f"{directory}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    columns = {}
+    for i, col in enumerate(df.columns):
+        columns[col] = {'file': f"c{i}", **_encode_column(df[col], tmp, f"c{i}")}
+    meta = {
+        'version': CACHE_VERSION,
+        'source': source,
+        'rows': len(df),
+        'columns': columns,
+        'order': list(df.columns),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    if profile is not None:
+        with open(os.path.join(tmp, 'profile.pkl'), 'wb') as f:
+            pickle.dump(profile, f)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp, directory)
+
+
+def load_frame(directory):
+    """Load a cached DataFrame, memory-mapping its columns."""
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+    data = {col: _decode_column(meta['columns'][col], directory, meta['columns'][col]['file'])
+            for col in meta['order']}
+    return pd.DataFrame(data, copy=False)
+
+
+def _load_profile(directory):
+    path = os.path.join(directory, 'profile.pkl')
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def cached_patient_data(path, cache_dir=CACHE_DIR, verbose=True):
+    """
+    Load the typed patient dataset and its profile, using the columnar cache.
+
+    Returns:
+        df: Typed DataFrame (memory-mapped when served from the cache)
+        profile: StreamingProfile of the dataset
+    """
+    directory = cache_path(path, cache_dir)
+    if os.path.exists(os.path.join(directory, 'meta.json')):
+        profile = _load_profile(directory)
+        if profile is not None:
+            if verbose:
+                print(f"✓ Dataset cache hit: {directory}")
+            return load_frame(directory), profile
+
+    df, profile = load_patient_data(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    save_frame(df, directory, profile=profile, source=os.path.abspath(path))
+    if verbose:
+        print(f"✓ Dataset cache written: {directory}")
+    return df, profile
+
+
+def cached_table(path, name, build, cache_dir=CACHE_DIR, verbose=True, digest=None):
+    """
+    Memoise a table derived from a source CSV (e.g. engineered features).
+
+    The table is stored as a sibling of the dataset cache, keyed by the same
+    content hash plus ``name`` (which should carry the builder's version).
+
+    Args:
+        path: Source CSV path
+        name: Table name, e.g. 'clinical-v1'
+        build: Zero-argument callable producing the DataFrame on a miss
+        digest: Content hash of ``path`` when the caller already knows it
+
+    Returns:
+        DataFrame (memory-mapped when served from the cache)
+    """
+    directory = f"{cache_path(path, cache_dir, digest)}-{name}"
+    if os.path.exists(os.path.join(directory, 'meta.json')):
+        if verbose:
+            print(f"✓ Feature cache hit: {directory}")
+        return load_frame(directory)
+
+    df = build()
+    os.makedirs(cache_dir, exist_ok=True)
+    save_frame(df, directory, source=os.path.abspath(path))
+    if verbose:
+        print(f"✓ Feature cache written: {directory}")
+    return df
+
+
+def _append_npy(filename, values):
+    """
+    Append values to a 1-D .npy file in place.
+
+    numpy reserves header room for the length to grow, so only the new
+    bytes and the header are written. Returns False, leaving the file
+    untouched, when the dtypes differ or the header would change size.
+    """
+    values = np.ascontiguousarray(values)
+    fmt = np.lib.format
+    with open(filename, 'r+b') as f:
+        version = fmt.read_magic(f)
+        read, write = ((fmt.read_array_header_1_0, fmt.write_array_header_1_0) if version == (1, 0)
+                       else (fmt.read_array_header_2_0, fmt.write_array_header_2_0))
+        shape, fortran_order, dtype = read(f)
+        if len(shape) != 1 or dtype != values.dtype:
+            return False
+        header = io.BytesIO()
+        write(header, {'descr': fmt.dtype_to_descr(dtype), 'fortran_order': fortran_order,
+                       'shape': (shape[0] + len(values),)})
+        if header.tell() != f.tell():
+            return False
+        # Data first: until the header is rewritten the file still reads as before
+        f.seek(0, os.SEEK_END)
+        f.write(values.tobytes())
+        f.seek(0)
+        f.write(header.getvalue())
+    return True
+
+
+def _append_column(meta, directory, name, series):
+    """Append rows to one cached column in place; False if its encoding cannot take them."""
+    stem = os.path.join(directory, name)
+    kind = meta['kind']
+
+    if kind == 'numpy':
+        return _append_npy(stem + '.npy', series.to_numpy())
+
+    if kind == 'masked':
+        if str(series.dtype) != meta['dtype']:
+            return False
+        data = series.to_numpy(dtype=series.dtype.numpy_dtype, na_value=0)
+        mask = series.isna().to_numpy()
+        if np.load(stem + '.mask.npy', mmap_mode='r').dtype != mask.dtype:
+            return False
+        return _append_npy(stem + '.data.npy', data) and _append_npy(stem + '.mask.npy', mask)
+
+    values_path = stem + '.values.npy'
+    if kind == 'category':
+        if meta['ordered'] or not isinstance(series.dtype, pd.CategoricalDtype):
+            return False
+        known = np.load(values_path)
+        # New categories go after the known ones, so the stored codes stay valid
+        added = series.cat.categories.difference(pd.Index(known), sort=False)
+        categories = np.concatenate([known, np.asarray(added, dtype=str)])
+        codes = pd.Categorical(series.astype(object), categories=categories).codes
+        if not _append_npy(stem + '.codes.npy', codes):
+            return False
+        if len(added):
+            np.save(values_path, categories)
+        return True
+
+    # Strings: the new rows get their own dictionary entries after the stored
+    # ones (a repeated entry decodes the same), so the stored codes stay valid
+    known = np.load(values_path, mmap_mode='r')
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    codes = np.where(codes < 0, codes, codes + len(known)).astype(np.int32)
+    uniques = np.asarray(uniques, dtype=str)
+    if not _append_npy(stem + '.codes.npy', codes):
+        return False
+    if uniques.dtype.itemsize <= known.dtype.itemsize:
+        return _append_npy(values_path, uniques.astype(known.dtype))
+    np.save(values_path, np.concatenate([np.asarray(known), uniques]))  # wider strings: rewrite the dictionary
+    return True
+
+
+def _extend(base, directory, rows, profile=None, source=None):
+    """
+    Turn the ``base`` cache into the cache of ``directory`` by appending ``rows``.
+
+    The base directory is taken over (its source version no longer exists)
+    and each column file is extended in place; only a column whose encoding
+    cannot take the new rows (e.g. a categorical outgrowing its code width)
+    is re-encoded. The directory only gets its ``meta.json`` back, under
+    the final name, once every column is written.
+    """
+    tmp = f"{directory}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.replace(base, tmp)
+    with open(os.path.join(tmp, 'meta.json')) as f:
+        meta = json.load(f)
+    os.remove(os.path.join(tmp, 'meta.json'))
+
+    rows = rows.reset_index(drop=True)
+    for col in meta['order']:
+        entry = meta['columns'][col]
+        if _append_column(entry, tmp, entry['file'], rows[col]):
+            continue
+        stored = _decode_column(entry, tmp, entry['file'])
+        combined = concat_chunks([pd.DataFrame({col: pd.Series(stored).copy()}), rows[[col]]])[col]
+        meta['columns'][col] = {'file': entry['file'], **_encode_column(combined, tmp, entry['file'])}
+
+    meta.update(rows=meta['rows'] + len(rows), source=source,
+                created=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    if profile is not None:
+        with open(os.path.join(tmp, 'profile.pkl'), 'wb') as f:
+            pickle.dump(profile, f)
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp, directory)
+    return load_frame(directory)
+
+
+def extend_cached_data(path, base_digest, digest, rows, cache_dir=CACHE_DIR, raw=None):
+    """
+    Cache an appended-to CSV from the cache of its previous version.
+
+    The previous columns are extended in place with the typed appended
+    ``rows`` and the stored profile is updated with them, so the grown file
+    is never re-parsed and the stored rows are never rewritten.
+
+    Args:
+        path: Source CSV path (already containing the appended rows)
+        base_digest: Content hash of the previous version of the file
+        digest: Content hash of the current file
+        rows: Typed DataFrame of the appended rows
+        raw: The same rows as read (validated instead of ``rows`` when given)
+
+    Returns:
+        (df, profile) for the whole file, or None if the previous version is not cached
+    """
+    base = cache_path(path, cache_dir, base_digest)
+    profile = _load_profile(base)
+    if profile is None or not os.path.exists(os.path.join(base, 'meta.json')):
+        return None
+    profile.update(rows, raw)
+    df = _extend(base, cache_path(path, cache_dir, digest), rows, profile=profile,
+                 source=os.path.abspath(path))
+    return df, profile
+
+
+def extend_cached_table(path, base_digest, digest, name, rows, cache_dir=CACHE_DIR):
+    """
+    ``cached_table`` counterpart of ``extend_cached_data``: append derived rows
+    (e.g. engineered features of the appended rows) to a previous table.
+
+    Returns:
+        DataFrame for the whole file, or None if the previous table is not cached
+    """
+    base = f"{cache_path(path, cache_dir, base_digest)}-{name}"
+    if not os.path.exists(os.path.join(base, 'meta.json')):
+        return None
+    return _extend(base, f"{cache_path(path, cache_dir, digest)}-{name}", rows,
+                   source=os.path.abspath(path))
+
+
+def cached_profile(path, cache_dir=CACHE_DIR):
+    """
+    Return the dataset profile, from the cache when available.
+
+    On a miss the profile is computed by streaming the CSV (bounded memory)
+    and stored on its own; the columns are cached by the next training run.
+    """
+    directory = cache_path(path, cache_dir)
+    profile = _load_profile(directory)
+    if profile is not None:
+        return profile
+
+    profile = profile_csv(path)
+    os.makedirs(directory, exist_ok=True)
+    tmp = os.path.join(directory, f"profile.pkl.tmp-{os.getpid()}")
+    with open(tmp, 'wb') as f:
+        pickle.dump(profile, f)
+    os.replace(tmp, os.path.join(directory, 'profile.pkl'))
+    return profile
@@ -0,0 +1,405 @@
+"""
+Distributed Hyperparameter Search
+=================================
+
+Runs the CV fits of a grid search on worker processes that may live on
+several machines, coordinated through a plain directory (a local disk for
+workers on one host, or a shared NFS/SMB mount for several nodes). No
+broker is needed:
+
+- the coordinator writes the estimator and the cached feature matrices
+  once to ``shared/`` and one task file per (configuration, fold) to
+  ``tasks/``;
+- a worker claims a task by atomically renaming it into ``claimed/``,
+  memory-maps the shared matrices, fits and scores the fold, and writes its
+  result to ``results/``;
+- the coordinator requeues claims whose worker stopped heart-beating and
+  aggregates the results into the usual ``best_params_`` / ``best_score_``
+  / ``cv_results_``.
+
+Workers on other nodes:
+    python distributed_search.py --queue /mnt/shared/erm-queue --threads 4
+
+Coordinator (the training pipeline):
+    python train_erm_model.py --search-queue /mnt/shared/erm-queue --local-workers 2
+"""
+
+import argparse
+import contextlib
+import dataclasses
+import os
+import pickle
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import uuid
+import warnings
+from typing import Optional
+
+import joblib
+import numpy as np
+from sklearn.base import clone
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import ParameterGrid
+from threadpoolctl import threadpool_limits
+
+
+@dataclasses.dataclass
+class QueueConfig:
+    """
+    Where and how a distributed search runs.
+
+    Attributes:
+        directory: Queue directory shared by the coordinator and all workers
+        local_workers: Worker processes the coordinator starts on its own host
+        lease_seconds: A claimed task is requeued when its worker has not
+                       heart-beaten for this long (crashed or lost node)
+        timeout: Maximum seconds to wait for all results (None: no limit)
+        idle_timeout: Fail when no task has been claimed or finished for this
+                      long, i.e. no worker is attached to the queue
+    """
+    directory: str
+    local_workers: int = 0
+    lease_seconds: float = 120.0
+    timeout: Optional[float] = None
+    idle_timeout: float = 300.0
+
+
+def start_local_workers(queue):
+    """Start ``queue.local_workers`` worker processes on this host."""
+    command = [sys.executable, os.path.abspath(__file__), '--queue', queue.directory,
+               '--lease-seconds', str(queue.lease_seconds), '--threads', '1']
+    return [subprocess.Popen(command, stdout=subprocess.DEVNULL) for _ in range(queue.local_workers)]
+
+
+def stop_local_workers(workers):
+    for w in workers:
+        w.terminate()
+    for w in workers:
+        w.wait()
+
+
+@contextlib.contextmanager
+def local_worker_pool(queue):
+    """
+    Keep the local workers of ``queue`` running across several searches.
+
+    Yields a QueueConfig for the searches; they use the pool instead of
+    starting (and importing) their own workers per search.
+    """
+    workers = start_local_workers(queue)
+    try:
+        yield dataclasses.replace(queue, local_workers=0)
+    finally:
+        stop_local_workers(workers)
+
+
+def _tmp_path(path):
+    return f"{path}.tmp-{socket.gethostname()}-{os.getpid()}"
+
+
+def _atomic_dump(obj, path):
+    tmp = _tmp_path(path)
+    with open(tmp, 'wb') as f:
+        pickle.dump(obj, f)
+    os.replace(tmp, path)
+
+
+class WorkQueue:
+    """
+    File-based task queue; every state change is an atomic rename or replace.
+
+    Args:
+        directory: Queue root, created if missing
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        for sub in ('tasks', 'claimed', 'results', 'shared'):
+            os.makedirs(os.path.join(directory, sub), exist_ok=True)
+
+    def _path(self, sub, name):
+        return os.path.join(self.directory, sub, name)
+
+    def put_shared(self, search_id, name, obj):
+        """Store an object for the workers of one search (arrays are memory-mappable)."""
+        os.makedirs(self._path('shared', search_id), exist_ok=True)
+        path = self._path('shared', os.path.join(search_id, f"{name}.joblib"))
+        joblib.dump(obj, _tmp_path(path))
+        os.replace(_tmp_path(path), path)
+
+    def get_shared(self, search_id, name):
+        return joblib.load(self._path('shared', os.path.join(search_id, f"{name}.joblib")),
+                           mmap_mode='r')
+
+    def submit(self, task_id, task):
+        _atomic_dump(task, self._path('tasks', f"{task_id}.task"))
+
+    def claim(self):
+        """Claim the next pending task; returns (task_id, task) or None when the queue is empty."""
+        for name in sorted(os.listdir(self._path('tasks', ''))):
+            if not name.endswith('.task'):
+                continue
+            pending, claimed = self._path('tasks', name), self._path('claimed', name)
+            try:
+                # Touch first: the rename keeps the mtime, and a claim arriving with the
+                # pending file's old mtime would look stale to requeue_stale
+                os.utime(pending)
+                os.rename(pending, claimed)
+                with open(claimed, 'rb') as f:
+                    return name[:-len('.task')], pickle.load(f)
+            except FileNotFoundError:
+                continue  # lost the claim: another worker got there first, or it was requeued
+        return None
+
+    def counts(self):
+        """(pending, claimed) task counts."""
+        return tuple(sum(name.endswith('.task') for name in os.listdir(self._path(sub, '')))
+                     for sub in ('tasks', 'claimed'))
+
+    def heartbeat(self, task_id):
+        try:
+            os.utime(self._path('claimed', f"{task_id}.task"))
+        except FileNotFoundError:
+            pass
+
+    def complete(self, task_id, result):
+        _atomic_dump(result, self._path('results', f"{task_id}.result"))
+        try:
+            os.remove(self._path('claimed', f"{task_id}.task"))
+        except FileNotFoundError:
+            pass
+
+    def requeue_stale(self, lease_seconds):
+        """Move claims without a recent heartbeat back to the pending tasks; returns how many."""
+        now, requeued = time.time(), 0
+        for name in os.listdir(self._path('claimed', '')):
+            path = self._path('claimed', name)
+            try:
+                if now - os.path.getmtime(path) > lease_seconds:
+                    os.rename(path, self._path('tasks', name))
+                    requeued += 1
+            except FileNotFoundError:
+                continue
+        return requeued
+
+    def collect(self, task_ids):
+        """Return {task_id: result} for the given tasks that have finished."""
+        done = {}
+        for task_id in task_ids:
+            path = self._path('results', f"{task_id}.result")
+            try:
+                with open(path, 'rb') as f:
+                    done[task_id] = pickle.load(f)
+            except FileNotFoundError:
+                continue
+        return done
+
+    def cleanup(self, search_id):
+        """Remove a finished search's shared data, results and any leftover tasks."""
+        shutil.rmtree(self._path('shared', search_id), ignore_errors=True)
+        for sub in ('tasks', 'claimed', 'results'):
+            for name in os.listdir(self._path(sub, '')):
+                if name.startswith(f"{search_id}-"):
+                    try:
+                        os.remove(self._path(sub, name))
+                    except FileNotFoundError:
+                        pass
+
+
+def _run_task(queue, task, shared):
+    """Fit and score one (configuration, fold) task."""
+    search_id = task['search_id']
+    if search_id not in shared:
+        shared.clear()  # keep only the current search's matrices mapped
+        shared[search_id] = (queue.get_shared(search_id, 'estimator'), queue.get_shared(search_id, 'data'))
+    estimator, (X, y, splits, fit_params) = shared[search_id]
+    train_idx, test_idx = splits[task['fold']]
+
+    model = clone(estimator).set_params(**task['params'])
+    start = time.perf_counter()
+    model.fit(X[train_idx], y[train_idx], **{k: np.asarray(v)[train_idx] for k, v in fit_params.items()})
+    fit_time = time.perf_counter() - start
+    start = time.perf_counter()
+    score = get_scorer(task['scoring'])(model, X[test_idx], y[test_idx])
+    return {'score': float(score), 'fit_time': fit_time, 'score_time': time.perf_counter() - start}
+
+
+def run_worker(directory, lease_seconds=QueueConfig.lease_seconds, poll_interval=0.2,
+               idle_exit=None, threads=None):
+    """
+    Pull and run tasks until stopped (or idle for ``idle_exit`` seconds).
+
+    Returns:
+        Number of tasks completed
+    """
+    queue = WorkQueue(directory)
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    shared, completed, idle_since = {}, 0, time.monotonic()
+    with threadpool_limits(limits=threads):
+        while True:
+            claimed = queue.claim()
+            if claimed is None:
+                if idle_exit is not None and time.monotonic() - idle_since > idle_exit:
+                    return completed
+                time.sleep(poll_interval)
+                continue
+            task_id, task = claimed
+
+            stop = threading.Event()
+
+            def beat():
+                while not stop.wait(lease_seconds / 4):
+                    queue.heartbeat(task_id)
+
+            beater = threading.Thread(target=beat, daemon=True)
+            beater.start()
+            try:
+                result = _run_task(queue, task, shared)
+            except Exception:
+                result = {'score': float('nan'), 'fit_time': 0.0, 'score_time': 0.0,
+                          'error': traceback.format_exc()}
+            finally:
+                stop.set()
+                beater.join()
+            queue.complete(task_id, {**result, 'worker': worker})
+            completed += 1
+            idle_since = time.monotonic()
+
+
+class DistributedSearchCV:
+    """
+    Exhaustive grid search whose CV fits run on work-queue workers.
+
+    Exposes the same ``best_params_``, ``best_score_``, ``best_index_``,
+    ``best_estimator_`` and ``cv_results_`` (per-split scores, fit/score
+    times, ranks) as ``GridSearchCV``. Failed fits score NaN with a warning,
+    as with GridSearchCV's default ``error_score``.
+    """
+
+    def __init__(self, estimator, param_grid, cv, queue, scoring='accuracy', refit=True,
+                 poll_interval=0.05):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.cv = cv
+        self.queue = queue
+        self.scoring = scoring
+        self.refit = refit
+        self.poll_interval = poll_interval
+
+    def _start_local_workers(self):
+        return start_local_workers(self.queue)
+
+    def fit(self, X, y, **fit_params):
+        """``fit_params`` are sample-aligned arrays, indexed per fold (as GridSearchCV does)."""
+        queue = WorkQueue(self.queue.directory)
+        candidates = list(ParameterGrid(self.param_grid))
+        y = np.asarray(y)
+        splits = [(np.asarray(tr), np.asarray(te)) for tr, te in self.cv.split(X, y)]
+        search_id = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+        queue.put_shared(search_id, 'estimator', self.estimator)
+        queue.put_shared(search_id, 'data', (X, y, splits, fit_params))
+        task_ids = {}
+        for i, params in enumerate(candidates):
+            for k in range(len(splits)):
+                task_id = f"{search_id}-{i:05d}-{k:03d}"
+                queue.submit(task_id, {'search_id': search_id, 'params': params, 'fold': k,
+                                       'scoring': self.scoring})
+                task_ids[task_id] = (i, k)
+
+        workers = self._start_local_workers()
+        results = {}
+        start = progress = time.monotonic()
+        last_pending = len(task_ids)
+        try:
+            while len(results) < len(task_ids):
+                now = time.monotonic()
+                if self.queue.timeout is not None and now - start > self.queue.timeout:
+                    raise TimeoutError(f"Distributed search {search_id}: {len(results)}/{len(task_ids)} "
+                                       f"fits finished after {self.queue.timeout:.0f}s")
+                if now - progress > self.queue.idle_timeout:
+                    raise TimeoutError(f"Distributed search {search_id}: no task claimed or finished in "
+                                       f"{self.queue.idle_timeout:.0f}s; start workers with "
+                                       f"'python distributed_search.py --queue {self.queue.directory}' "
+                                       f"or use --local-workers")
+                if workers and all(w.poll() is not None for w in workers):
+                    # Remote workers may still be running, but local ones only exit on a crash
+                    raise RuntimeError(f"All {len(workers)} local workers exited "
+                                       f"(exit codes {[w.returncode for w in workers]})")
+                queue.requeue_stale(self.queue.lease_seconds)
+                finished = len(results)
+                results.update(queue.collect([t for t in task_ids if t not in results]))
+                # A claimed task is being worked on (its lease expires if the worker died)
+                pending, claimed = queue.counts()
+                if len(results) > finished or claimed or pending < last_pending:
+                    progress = now
+                last_pending = pending
+                time.sleep(self.poll_interval)
+        finally:
+            stop_local_workers(workers)
+            queue.cleanup(search_id)
+
+        self._aggregate(candidates, len(splits), task_ids, results)
+        if self.refit:
+            self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_).fit(X, y, **fit_params)
+        return self
+
+    def _aggregate(self, candidates, n_splits, task_ids, results):
+        scores = np.full((len(candidates), n_splits), np.nan)
+        fit_times = np.zeros_like(scores)
+        score_times = np.zeros_like(scores)
+        errors = []
+        self.workers_ = sorted({r['worker'] for r in results.values()})
+        for task_id, (i, k) in task_ids.items():
+            r = results[task_id]
+            scores[i, k], fit_times[i, k], score_times[i, k] = r['score'], r['fit_time'], r['score_time']
+            if 'error' in r:
+                errors.append(r['error'])
+        if errors:
+            if len(errors) == scores.size:
+                raise RuntimeError(f"All {len(errors)} distributed fits failed:\n{errors[0]}")
+            warnings.warn(f"{len(errors)} of {scores.size} distributed fits failed; their score is NaN. "
+                          f"First error:\n{errors[0]}")
+
+        mean = scores.mean(axis=1)
+        # Same ranking as GridSearchCV: NaN means rank last, ties share the best rank
+        ordered = np.where(np.isnan(mean), -np.inf, mean)
+        rank = np.array([1 + np.sum(ordered > m) for m in ordered])
+        self.cv_results_ = {
+            'params': candidates,
+            'mean_test_score': mean,
+            'std_test_score': scores.std(axis=1),
+            'rank_test_score': rank,
+            'mean_fit_time': fit_times.mean(axis=1),
+            'std_fit_time': fit_times.std(axis=1),
+            'mean_score_time': score_times.mean(axis=1),
+            'std_score_time': score_times.std(axis=1),
+            **{f"split{k}_test_score": scores[:, k] for k in range(n_splits)},
+        }
+        self.best_index_ = int(np.argmax(ordered))
+        self.best_params_ = candidates[self.best_index_]
+        self.best_score_ = float(mean[self.best_index_])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Worker for distributed hyperparameter search")
+    parser.add_argument('--queue', required=True, help="Queue directory shared with the coordinator")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="BLAS/OpenMP threads per fit (default: library default)")
+    parser.add_argument('--lease-seconds', type=float, default=QueueConfig.lease_seconds,
+                        help="Must match the coordinator's lease")
+    parser.add_argument('--idle-exit', type=float, default=None,
+                        help="Exit after this many seconds without work (default: run until killed)")
+    args = parser.parse_args(argv)
+    completed = run_worker(args.queue, lease_seconds=args.lease_seconds, idle_exit=args.idle_exit,
+                           threads=args.threads)
+    print(f"✓ Worker finished {completed} task(s)")
+
+
+if __name__ == "__main__":
+    main()
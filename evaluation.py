@@ -0,0 +1,202 @@
+"""
+Batched Evaluation
+==================
+
+Metrics for the selection and evaluation stages of ``train_erm_model.py``,
+computed from one prediction pass per (model, split):
+
+- ``PredictionCache`` keeps each model's class probabilities and labels per
+  split and input, so evaluating the selected model reuses what model
+  selection already predicted, and missing splits are predicted
+  concurrently;
+- the classification report is derived from the confusion matrix instead of
+  re-scanning the labels;
+- log loss and Brier score come from the cached probabilities;
+- plots are rendered on a background thread (or skipped), off the critical
+  path.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+import joblib
+import numpy as np
+
+# Probabilities are clipped away from 0 for the log loss
+_EPS = 1e-15
+
+
+@dataclass
+class SplitPrediction:
+    """Labels and (when the model has predict_proba) class probabilities for one split."""
+    labels: np.ndarray
+    proba: Optional[np.ndarray] = None
+    classes: Optional[np.ndarray] = None
+
+
+def predict_split(model, X):
+    """One batched pass: ``predict_proba`` when available (labels are its argmax), else ``predict``."""
+    if hasattr(model, 'predict_proba'):
+        proba = model.predict_proba(X)
+        classes = np.asarray(model.classes_)
+        return SplitPrediction(classes[np.argmax(proba, axis=1)], proba, classes)
+    return SplitPrediction(np.asarray(model.predict(X)))
+
+
+class PredictionCache:
+    """
+    Per-(model name, split, input) predictions, each computed once.
+
+    Entries are keyed by a content hash of the split's input as well, so the
+    same model and split name on other data (another target's matrices, say)
+    is predicted again rather than served stale. Where the model is given a
+    converted copy of the input (densified, re-encoded), ``source`` names the
+    data the copy was derived from, which is what gets hashed.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._fingerprints = {}
+
+    def _fingerprint(self, X):
+        # Each input is hashed once; the reference held keeps its id from being reused
+        if id(X) not in self._fingerprints:
+            # A FoldMatrix is identified by its raw rows, folds and transformer spec
+            self._fingerprints[id(X)] = (X, joblib.hash(getattr(X, 'key', X)))
+        return self._fingerprints[id(X)][1]
+
+    def _key(self, model_name, split, X, source=None):
+        return model_name, split, self._fingerprint(X if source is None else source)
+
+    def get(self, model_name, split, model, X, source=None):
+        key = self._key(model_name, split, X, source)
+        if key not in self._entries:
+            self._entries[key] = predict_split(model, X)
+        return self._entries[key]
+
+    def put(self, model_name, split, X, prediction):
+        """Add predictions on ``X`` computed elsewhere (e.g. an ensemble combining cached ones)."""
+        self._entries[self._key(model_name, split, X)] = prediction
+
+    def get_many(self, model_name, model, splits, sources=None):
+        """
+        Predictions for several splits, predicting the missing ones concurrently.
+
+        Args:
+            splits: {split name: X}
+            sources: {split name: data X was derived from}, for splits whose
+                     X is a converted copy
+
+        Returns:
+            {split name: SplitPrediction}
+        """
+        sources = sources or {}
+        missing = [name for name, X in splits.items()
+                   if self._key(model_name, name, X, sources.get(name)) not in self._entries]
+        if len(missing) > 1:
+            with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+                done = pool.map(lambda name: predict_split(model, splits[name]), missing)
+                for name, prediction in zip(missing, done):
+                    self._entries[self._key(model_name, name, splits[name], sources.get(name))] = prediction
+        return {name: self.get(model_name, name, model, X, sources.get(name)) for name, X in splits.items()}
+
+
+def confusion(y_true, y_pred):
+    """
+    Confusion matrix over the sorted union of true and predicted labels, in one pass.
+
+    Returns:
+        (matrix, labels)
+    """
+    labels, codes = np.unique(np.concatenate([np.asarray(y_true), np.asarray(y_pred)]),
+                              return_inverse=True)
+    n = len(labels)
+    true_codes, pred_codes = codes[:len(codes) // 2], codes[len(codes) // 2:]
+    matrix = np.bincount(true_codes * n + pred_codes, minlength=n * n).reshape(n, n)
+    return matrix, labels
+
+
+def report_from_confusion(matrix, labels, digits=2):
+    """Text classification report (same layout as scikit-learn's) derived from a confusion matrix."""
+    tp = np.diag(matrix).astype(float)
+    predicted, support = matrix.sum(axis=0), matrix.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(predicted > 0, tp / predicted, 0.0)
+        recall = np.where(support > 0, tp / support, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    total = support.sum()
+
+    names = [str(label) for label in labels]
+    width = max(max(len(name) for name in names), len('weighted avg'), digits)
+    head = f"{'':>{width}s} " + ''.join(f" {h:>9}" for h in ('precision', 'recall', 'f1-score', 'support'))
+
+    def row(name, p, r, f, s):
+        return f"{name:>{width}s} " + ''.join(f" {v:>9.{digits}f}" for v in (p, r, f)) + f" {s:>9}"
+
+    lines = [head, '']
+    lines += [row(name, p, r, f, s) for name, p, r, f, s in zip(names, precision, recall, f1, support)]
+    lines.append('')
+    lines.append(f"{'accuracy':>{width}s}  {'':>9} {'':>9} {tp.sum() / total:>9.{digits}f} {total:>9}")
+    lines.append(row('macro avg', precision.mean(), recall.mean(), f1.mean(), total))
+    weights = support / total
+    lines.append(row('weighted avg', precision @ weights, recall @ weights, f1 @ weights, total))
+    return '\n'.join(lines) + '\n'
+
+
+def probability_metrics(y_true, prediction):
+    """
+    Log loss and (multiclass) Brier score from cached probabilities.
+
+    Returns:
+        {'log_loss': ..., 'brier': ...}, or {} when the model has no probabilities
+    """
+    if prediction.proba is None:
+        return {}
+    y_true = np.asarray(y_true)
+    index = np.searchsorted(prediction.classes, y_true)
+    index = np.clip(index, 0, len(prediction.classes) - 1)
+    known = prediction.classes[index] == y_true
+    p_true = np.where(known, prediction.proba[np.arange(len(y_true)), index], 0.0)
+    one_hot = np.zeros_like(prediction.proba)
+    one_hot[np.arange(len(y_true))[known], index[known]] = 1.0
+    return {
+        'log_loss': float(-np.mean(np.log(np.clip(p_true, _EPS, 1.0)))),
+        'brier': float(np.mean(np.sum((prediction.proba - one_hot) ** 2, axis=1))),
+    }
+
+
+_plot_worker = None
+_plot_jobs = []
+
+
+def render_plots(jobs, background=True):
+    """
+    Render figures with ``evaluation_plots``.
+
+    Args:
+        jobs: List of (function name in evaluation_plots, args tuple)
+        background: Render on a worker thread (collect with ``wait_for_plots``)
+
+    Returns:
+        List of written paths when rendered synchronously, else None
+    """
+    def run():
+        import evaluation_plots
+        return [getattr(evaluation_plots, name)(*args) for name, args in jobs]
+
+    if not background:
+        return run()
+    global _plot_worker
+    if _plot_worker is None:
+        _plot_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix='plots')
+    _plot_jobs.append(_plot_worker.submit(run))
+    return None
+
+
+def wait_for_plots():
+    """Wait for background plots; returns the written paths (raises if a plot failed)."""
+    paths = []
+    while _plot_jobs:
+        paths.extend(_plot_jobs.pop(0).result())
+    return paths
@@ -0,0 +1,53 @@
+"""
+Evaluation Plots
+================
+
+Figures written by the evaluation stage of ``train_erm_model.py``.
+
+matplotlib and seaborn (which pulls in scipy.stats) take most of a second to
+import, so this module is only imported once evaluation runs; loading data,
+scoring or incremental runs never pay for it.
+
+Figures are drawn with matplotlib's object API on the Agg canvas, without
+pyplot's global state, so they can be rendered on a background thread.
+"""
+
+import numpy as np
+import seaborn as sns
+from matplotlib.figure import Figure
+
+# Visualization setup
+sns.set_style("whitegrid")
+
+
+def plot_confusion_matrix(cm, labels, model_name, path='confusion_matrix.png', dpi=150):
+    """Save a confusion matrix heatmap."""
+    fig = Figure(figsize=(8, 6))
+    ax = fig.subplots()
+    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues',
+                xticklabels=labels,
+                yticklabels=labels,
+                ax=ax)
+    ax.set_title(f'Confusion Matrix - {model_name}')
+    ax.set_ylabel('True Label')
+    ax.set_xlabel('Predicted Label')
+    fig.tight_layout()
+    fig.savefig(path, dpi=dpi, bbox_inches='tight')
+    return path
+
+
+def plot_feature_importance(top_features, model_name, path='feature_importance.png', dpi=150):
+    """Save a horizontal bar chart of (feature, importance) pairs."""
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    features_to_plot = [f[0] for f in top_features]
+    importances_to_plot = [f[1] for f in top_features]
+
+    ax.barh(np.arange(len(features_to_plot)), importances_to_plot)
+    ax.set_yticks(np.arange(len(features_to_plot)))
+    ax.set_yticklabels(features_to_plot)
+    ax.set_xlabel('Importance')
+    ax.set_title(f'Top {len(top_features)} Feature Importances - {model_name}')
+    fig.tight_layout()
+    fig.savefig(path, dpi=dpi, bbox_inches='tight')
+    return path
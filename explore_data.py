@@ -4,24 +4,28 @@ Quick dataset analysis to identify target column and features
 import pandas as pd
 import numpy as np
 
-# Load the dataset
-df = pd.read_csv('patient_dataset_5000_realistic.csv')
+from compact_table import CompactPatientTable, memory_report
+from dataset_cache import cached_profile
+from ingest import apply_schema
+
+# Profile the dataset in one streaming pass (bounded memory), or reuse the cached profile
+profile = cached_profile('patient_dataset_5000_realistic.csv')
 
 print("="*80)
 print("COMPLETE DATASET ANALYSIS")
 print("="*80)
 
-print(f"\n1. SHAPE: {df.shape[0]} rows × {df.shape[1]} columns")
+print(f"\n1. SHAPE: {profile.rows} rows × {len(profile.columns)} columns")
 
 print("\n2. COLUMNS:")
-for i, col in enumerate(df.columns, 1):
+for i, col in enumerate(profile.columns, 1):
     print(f"   {i}. {col}")
 
 print("\n3. DATA TYPES:")
-print(df.dtypes)
+print(profile.dtypes)
 
 print("\n4. MISSING VALUES:")
-missing = df.isnull().sum()
+missing = profile.missing()
 if missing.sum() == 0:
     print("   No missing values found!")
 else:
@@ -31,24 +35,48 @@ print("\n5. SAMPLE DATA (first 3 rows):")
 pd.set_option('display.max_columns', None)
 pd.set_option('display.width', None)
 pd.set_option('display.max_colwidth', 50)
-print(df.head(3))
+print(profile.head.head(3))
 
 print("\n6. UNIQUE VALUE COUNTS PER COLUMN:")
-for col in df.columns:
-    n_unique = df[col].nunique()
-    print(f"\n   {col}: {n_unique} unique values", end="")
+for col, stats in profile.columns.items():
+    n_unique = stats.n_unique
+    approx = "" if stats.tracking else " (approx.)"
+    print(f"\n   {col}: {n_unique} unique values{approx}", end="")
     if n_unique <= 15:  # Show values if categorical
-        print(f"\n      → {sorted(df[col].dropna().unique())}")
+        print(f"\n      → {sorted(stats.value_counts().index)}")
     else:
         print()
+    if stats.is_numeric:
+        print(f"      mean={stats.mean:.2f} std={stats.std:.2f} min={stats.min:g} max={stats.max:g}")
 
 print("\n7. IDENTIFYING TARGET COLUMN:")
 print("   Looking for classification target...")
-for col in df.columns:
-    if col != 'Patient_ID' and df[col].nunique() < 20:
+for col, stats in profile.columns.items():
+    if col != 'Patient_ID' and stats.n_unique < 20:
         print(f"\n   Possible target: {col}")
-        print(f"   - Unique values: {df[col].nunique()}")
-        print(f"   - Distribution:\n{df[col].value_counts()}")
+        print(f"   - Unique values: {stats.n_unique}")
+        print(f"   - Distribution:\n{stats.value_counts()}")
+
+print("\n8. MEMORY FOOTPRINT:")
+# Measured on a bounded sample and extrapolated, so large extracts are never loaded whole;
+# one parse: the schema-typed frame and the compact table are derived from it
+MEMORY_SAMPLE_ROWS = 100_000
+raw = pd.read_csv('patient_dataset_5000_realistic.csv', nrows=MEMORY_SAMPLE_ROWS)
+typed = apply_schema(raw)
+compact = CompactPatientTable.from_frame(typed)
+report = memory_report({'read_csv': raw, 'schema': typed, 'compact': compact})
+per_row = report / len(raw)
+print(f"   Measured on {len(raw)} of {profile.rows} rows, bytes per row:")
+print(per_row.round(1).to_string())
+total = per_row.loc['TOTAL']
+print(f"\n   Extrapolated to {profile.rows} rows: "
+      + ", ".join(f"{name} {total[name] * profile.rows / 1024 ** 2:.1f} MiB" for name in per_row.columns))
+print("\n   Encodings:")
+for col, encoding in compact.encodings().items():
+    print(f"   - {col}: {encoding}")
+print(f"\n   Compact table: {total['read_csv'] / total['compact']:.1f}x smaller than read_csv, "
+      f"{total['schema'] / total['compact']:.1f}x smaller than the typed frame")
+print(f"   Round trip to DataFrame exact: {compact.to_frame().equals(typed)}")
 
 print("\n" + "="*80)
 print("ANALYSIS COMPLETE")
@@ -0,0 +1,559 @@
+"""
+Feature Attribution
+===================
+
+Model-agnostic and tree-specific feature attribution, reported on the
+patient's own columns rather than the one-hot encoded matrix:
+
+- ``feature_map`` names every encoded column ("Gender=Male") and maps it to
+  the engineered feature it came from, through the fitted
+  ``ColumnTransformer``; ``feature_groups`` groups encoded columns by
+  engineered feature or by raw patient column ('Symptom_Fever' →
+  'Symptoms').
+- ``permutation_importance`` shuffles each group's columns jointly (so a
+  one-hot block stays valid) and measures the accuracy drop. Perturbed
+  copies are stacked into a few large prediction batches, and the batches
+  run on a thread pool.
+- ``TreePathAttribution`` decomposes forest / histogram-boosting predictions
+  exactly along each row's decision paths (Saabas attribution): the bias
+  plus the per-feature contributions equals the model output. All trees
+  are flattened into one node table and traversed together, one NumPy step
+  per tree level. XGBoost models use the booster's own TreeSHAP
+  contributions.
+- ``Explainer`` explains single patients at scoring time (tree paths,
+  linear terms, or occlusion against a background row in one batched
+  prediction), in milliseconds.
+
+Importance tables are cached next to the model artifact
+(``<artifact>.importance.json``), keyed by model version, method and data.
+
+Usage:
+    python feature_attribution.py --artifact artifacts/patient_model.joblib
+    python feature_attribution.py --method tree_path --explain 3
+"""
+
+import argparse
+import json
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy import sparse
+
+from clinical_features import raw_column
+from parallelism import available_cores
+
+ATTRIBUTION_METHODS = ('permutation', 'tree_path')
+
+# Rows per stacked prediction batch of permuted copies
+DEFAULT_BATCH_ROWS = 50_000
+
+
+def _dense(X):
+    return X.toarray() if sparse.issparse(X) else np.asarray(X)
+
+
+def feature_map(preprocessor):
+    """
+    Encoded column names and their engineered features.
+
+    Returns:
+        (names, features): 'Age' / 'Gender=Male' per encoded column, and the
+        engineered column each one comes from
+    """
+    names, features = [], []
+    for name, transformer, columns in preprocessor.transformers_:
+        if name == 'remainder' or isinstance(transformer, str):
+            continue
+        columns = list(columns)
+        onehot = getattr(transformer, 'named_steps', {}).get('onehot')
+        if onehot is not None:
+            for col, categories in zip(columns, onehot.categories_):
+                names.extend(f"{col}={c}" for c in categories)
+                features.extend([col] * len(categories))
+        else:
+            names.extend(columns)
+            features.extend(columns)
+    return names, features
+
+
+def feature_groups(features, level='raw'):
+    """
+    Encoded column indices per engineered feature ('feature') or raw patient column ('raw').
+
+    Returns:
+        {label: index array}, in first-column order
+    """
+    groups = {}
+    for i, feature in enumerate(features):
+        groups.setdefault(raw_column(feature) if level == 'raw' else feature, []).append(i)
+    return {label: np.array(idx) for label, idx in groups.items()}
+
+
+def group_sum(values, groups):
+    """Sum the last axis of per-encoded-column ``values`` into groups (returns a DataFrame)."""
+    values = np.atleast_2d(values)
+    return pd.DataFrame({label: values[:, idx].sum(axis=1) for label, idx in groups.items()})
+
+
+# ----------------------------------------------------------------------------
+# Permutation importance
+# ----------------------------------------------------------------------------
+
+def permutation_importance(model, X, y, groups, n_repeats=5, max_rows=None,
+                           batch_rows=DEFAULT_BATCH_ROWS, n_jobs=None, random_state=0):
+    """
+    Accuracy drop when each group of encoded columns is shuffled.
+
+    Args:
+        model: Fitted classifier taking the encoded matrix
+        X, y: Evaluation rows (held-out data)
+        groups: {label: encoded column indices} (see ``feature_groups``)
+        n_repeats: Shuffles per group
+        max_rows: Score on a random sample of at most this many rows (approximate mode)
+        batch_rows: Rows per stacked prediction call
+        n_jobs: Threads running the batches (default: all cores)
+
+    Returns:
+        DataFrame indexed by group with 'importance' (mean drop) and 'std',
+        most important first
+    """
+    rng = np.random.default_rng(random_state)
+    X, y = _dense(X), np.asarray(y)
+    if max_rows is not None and len(y) > max_rows:
+        sample = rng.choice(len(y), max_rows, replace=False)
+        X, y = X[sample], y[sample]
+    n = len(y)
+    baseline = float(np.mean(model.predict(X) == y))
+
+    jobs = [(label, rng.permutation(n)) for label in groups for _ in range(n_repeats)]
+    per_batch = max(1, batch_rows // max(n, 1))
+    batches = [jobs[i:i + per_batch] for i in range(0, len(jobs), per_batch)]
+
+    def run(batch):
+        stacked = np.tile(X, (len(batch), 1))
+        for k, (label, order) in enumerate(batch):
+            cols = groups[label]
+            stacked[k * n:(k + 1) * n, cols] = X[np.ix_(order, cols)]
+        predicted = model.predict(stacked).reshape(len(batch), n)
+        return [(label, float(np.mean(p == y))) for (label, _), p in zip(batch, predicted)]
+
+    done = Parallel(n_jobs=n_jobs or available_cores(), prefer='threads')(
+        delayed(run)(batch) for batch in batches)
+    scores = {label: [] for label in groups}
+    for label, score in (item for batch in done for item in batch):
+        scores[label].append(score)
+    table = pd.DataFrame({'importance': {k: baseline - np.mean(v) for k, v in scores.items()},
+                          'std': {k: float(np.std(v)) for k, v in scores.items()}})
+    return table.sort_values('importance', ascending=False)
+
+
+# ----------------------------------------------------------------------------
+# Tree-path attribution
+# ----------------------------------------------------------------------------
+
+def _split_pipeline(model):
+    """(preceding transform steps, final estimator) of a Pipeline, or ([], model)."""
+    steps = getattr(model, 'steps', None)
+    if steps is None:
+        return [], model
+    return [step for _, step in steps[:-1]], steps[-1][1]
+
+
+# Left-category bitsets (32 categories per uint32 word) of trees without categorical splits
+_NO_BITSETS = np.zeros((0, 8), dtype=np.uint32)
+
+
+def _sklearn_trees(forest):
+    """Flat-table inputs for a (forest of) scikit-learn decision tree classifier(s)."""
+    trees = getattr(forest, 'estimators_', None)
+    trees = [forest] if trees is None else list(np.ravel(trees))
+    tables = []
+    for tree in trees:
+        t = tree.tree_
+        missing = getattr(t, 'missing_go_to_left', np.zeros(t.node_count, dtype=np.uint8))
+        # Classifier node values are class fractions; the forest averages its trees
+        value = t.value[:, 0, :] / len(trees)
+        tables.append((t.feature, t.threshold, t.children_left, t.children_right,
+                       missing.astype(bool), value, np.full(t.node_count, -1), _NO_BITSETS))
+    return tables, np.zeros(trees[0].tree_.value.shape[2]), 'probability', np.float32
+
+
+def _hist_gradient_boosting_trees(model):
+    """Flat-table inputs for a HistGradientBoostingClassifier (raw log-odds per output)."""
+    n_outputs = model.n_trees_per_iteration_
+    tables = []
+    for iteration in model._predictors:
+        for k, predictor in enumerate(iteration):
+            nodes = predictor.nodes
+            leaf = nodes['is_leaf'].astype(bool)
+            count = nodes['count'].astype(np.float64)
+            raw = nodes['value'].astype(np.float64)
+            # Leaves hold the shrunk values; inner nodes get the count-weighted mean of their children
+            node_value = np.where(leaf, raw, 0.0)
+            for node in range(len(nodes) - 1, -1, -1):
+                if not leaf[node]:
+                    l, r = nodes['left'][node], nodes['right'][node]
+                    weight = count[l] + count[r]
+                    node_value[node] = ((count[l] * node_value[l] + count[r] * node_value[r]) / weight
+                                        if weight > 0 else (node_value[l] + node_value[r]) / 2)
+                    count[node] = weight if count[node] == 0 else count[node]
+            value = np.zeros((len(nodes), n_outputs))
+            value[:, k] = node_value
+            left = np.where(leaf, -1, nodes['left'].astype(np.int64))
+            right = np.where(leaf, -1, nodes['right'].astype(np.int64))
+            # Native categorical splits send the categories in a bitset left
+            bitset = np.where(nodes['is_categorical'].astype(bool), nodes['bitset_idx'].astype(np.int64), -1)
+            tables.append((nodes['feature_idx'].astype(np.int64), nodes['num_threshold'],
+                           left, right, nodes['missing_go_to_left'].astype(bool), value,
+                           bitset, predictor.raw_left_cat_bitsets))
+    bias = np.asarray(model._baseline_prediction, dtype=np.float64).ravel()
+    return tables, bias, 'log-odds', np.float64
+
+
+class TreePathAttribution:
+    """
+    Exact decision-path attribution for tree ensembles.
+
+    ``contributions(X)`` returns (bias, contributions) with
+    ``bias + contributions.sum(axis=1)`` equal to the model output per row:
+    class probabilities for forests, raw log-odds for histogram boosting
+    (one output for binary problems), SHAP values for XGBoost.
+    Contributions are per column of the matrix passed in: where a pipeline
+    step folds columns together (``NativeCategoricals``), each folded column's
+    contribution goes to the first column of its block.
+
+    Raises:
+        TypeError: The model is not a supported tree model
+    """
+
+    def __init__(self, model):
+        self.steps, estimator = _split_pipeline(model)
+        self.estimator = estimator
+        kind = type(estimator).__name__
+        self._booster = None
+        # Histogram boosting with native categoricals encodes and reorders its input itself
+        self._native = None
+        if kind in ('RandomForestClassifier', 'ExtraTreesClassifier', 'DecisionTreeClassifier',
+                    'ExtraTreeClassifier'):
+            tables, self.bias, self.space, self._dtype = _sklearn_trees(estimator)
+        elif kind == 'HistGradientBoostingClassifier':
+            tables, self.bias, self.space, self._dtype = _hist_gradient_boosting_trees(estimator)
+            self._native = getattr(estimator, '_preprocessor', None)
+        elif kind == 'XGBClassifier':
+            self._booster, self.space = estimator.get_booster(), 'log-odds (SHAP)'
+            return
+        else:
+            raise TypeError(f"No tree-path attribution for {kind}")
+
+        sizes = [len(t[0]) for t in tables]
+        offsets = np.cumsum([0] + sizes[:-1])
+        self.roots = offsets.astype(np.int64)
+        self.feature = np.concatenate([t[0] for t in tables]).astype(np.int64)
+        self.threshold = np.concatenate([t[1] for t in tables]).astype(np.float64)
+        self.left = np.concatenate([np.where(t[2] >= 0, t[2] + o, -1) for t, o in zip(tables, offsets)])
+        self.right = np.concatenate([np.where(t[3] >= 0, t[3] + o, -1) for t, o in zip(tables, offsets)])
+        self.missing_left = np.concatenate([t[4] for t in tables])
+        self.value = np.concatenate([t[5] for t in tables])
+        bitset_offsets = np.cumsum([0] + [len(t[7]) for t in tables[:-1]])
+        self.bitset = np.concatenate([np.where(t[6] >= 0, t[6] + o, -1) for t, o in zip(tables, bitset_offsets)])
+        self.bitsets = np.concatenate([t[7] for t in tables]).astype(np.uint32)
+        self.bias = self.bias + self.value[self.roots].sum(axis=0)
+
+    @staticmethod
+    def supports(model):
+        try:
+            TreePathAttribution(model)
+        except (TypeError, AttributeError):
+            return False
+        return True
+
+    def _transform(self, X):
+        for step in self.steps:
+            X = step.transform(X)
+        return _dense(X)
+
+    def _native_columns(self, n_inputs):
+        """Estimator input column of each column its internal preprocessor outputs (categoricals first)."""
+        columns = np.empty(n_inputs, dtype=np.int64)
+        for name, _, selection in self._native.transformers_:
+            columns[self._native.output_indices_[name]] = np.arange(n_inputs)[selection]
+        return columns
+
+    def _to_input_space(self, contributions):
+        """Map contributions back through the steps that record their ``input_columns_``."""
+        for step in reversed(self.steps):
+            columns = getattr(step, 'input_columns_', None)
+            if columns is None:
+                break
+            mapped = np.zeros((contributions.shape[0], step.n_features_in_, contributions.shape[2]))
+            mapped[:, columns] = contributions
+            contributions = mapped
+        return contributions
+
+    def _xgboost_contributions(self, X):
+        import xgboost
+
+        contribs = self._booster.predict(xgboost.DMatrix(X), pred_contribs=True)
+        if contribs.ndim == 2:
+            contribs = contribs[:, None, :]
+        # (rows, outputs, features + bias) → bias per output, (rows, features, outputs)
+        return contribs[0, :, -1], np.transpose(contribs[:, :, :-1], (0, 2, 1))
+
+    def contributions(self, X):
+        X = self._transform(X)
+        n_inputs = X.shape[1]
+        if self._native is not None:
+            X = self._native.transform(X)
+        if self._booster is not None:
+            bias, contributions = self._xgboost_contributions(X)
+            return bias, self._to_input_space(contributions)
+        X = X.astype(self._dtype)
+        n, n_features = X.shape
+        n_outputs = self.value.shape[1]
+        out = np.zeros((n * n_features, n_outputs))
+
+        rows = np.repeat(np.arange(n), len(self.roots))
+        node = np.tile(self.roots, n)
+        while len(node):
+            inner = self.left[node] >= 0
+            rows, node = rows[inner], node[inner]
+            if not len(node):
+                break
+            f = self.feature[node]
+            x = X[rows, f]
+            go_left = (x <= self.threshold[node]) | (np.isnan(x) & self.missing_left[node])
+            categorical = self.bitset[node] >= 0
+            if categorical.any():
+                x_cat, cat_node = x[categorical], node[categorical]
+                code = np.where(np.isnan(x_cat), 0, x_cat).astype(np.int64)
+                in_left = (self.bitsets[self.bitset[cat_node], code // 32] >> (code % 32).astype(np.uint32)) & 1
+                go_left[categorical] = np.where(np.isnan(x_cat), self.missing_left[cat_node], in_left == 1)
+            child = np.where(go_left, self.left[node], self.right[node])
+            delta = self.value[child] - self.value[node]
+            flat = rows * n_features + f
+            for k in range(n_outputs):
+                out[:, k] += np.bincount(flat, weights=delta[:, k], minlength=n * n_features)
+            node = child
+        out = out.reshape(n, n_features, n_outputs)
+        if self._native is not None:
+            reordered = np.zeros((n, n_inputs, n_outputs))
+            reordered[:, self._native_columns(n_inputs)] = out
+            out = reordered
+        return self.bias, self._to_input_space(out)
+
+
+def _class_output(contributions, class_index, n_classes):
+    """Contributions toward one class (binary log-odds models have one output for class 1)."""
+    if contributions.shape[-1] == 1 and n_classes == 2:
+        return contributions[..., 0] * (1 if class_index == 1 else -1)
+    return contributions[..., class_index]
+
+
+def tree_path_importance(model, X, groups):
+    """
+    Mean absolute decision-path contribution per group, over rows and classes.
+
+    Returns:
+        DataFrame indexed by group with 'importance', most important first
+    """
+    attribution = TreePathAttribution(model)
+    _, contributions = attribution.contributions(X)
+    per_column = np.abs(contributions).mean(axis=(0, 2))
+    table = group_sum(per_column, groups).T.rename(columns={0: 'importance'})
+    return table.sort_values('importance', ascending=False)
+
+
+# ----------------------------------------------------------------------------
+# Per-patient explanations
+# ----------------------------------------------------------------------------
+
+class Explainer:
+    """
+    Per-row explanations of a fitted classifier, cheap enough for scoring time.
+
+    Method by model type: 'tree_path' for tree ensembles, 'linear' for
+    models with ``coef_`` (coefficient × deviation from the background row),
+    otherwise 'occlusion' (change in the predicted class's probability when
+    a group is reset to the background, all groups in one batched call).
+
+    Args:
+        model: Fitted classifier on the encoded matrix
+        features: Engineered feature per encoded column (see ``feature_map``)
+        background: Reference encoded row (e.g. the training mean); zeros if None
+        level: 'feature' (engineered columns) or 'raw' (patient columns)
+    """
+
+    def __init__(self, model, features, background=None, level='feature'):
+        self.model = model
+        self.groups = feature_groups(features, level)
+        self.background = (np.zeros(len(features)) if background is None
+                           else np.asarray(background, dtype=np.float64))
+        self.classes = np.asarray(model.classes_)
+        self._tree = TreePathAttribution(model) if TreePathAttribution.supports(model) else None
+        _, final = _split_pipeline(model)
+        if self._tree is not None:
+            self.method = 'tree_path'
+        elif hasattr(final, 'coef_') and final is model:
+            self.method = 'linear'
+        else:
+            self.method = 'occlusion'
+
+    def explain(self, X):
+        """
+        Contributions of each group toward each row's predicted class.
+
+        Returns:
+            (predicted labels, DataFrame of contributions with one column per group)
+        """
+        X = _dense(X).astype(np.float64)
+        n_classes = len(self.classes)
+
+        if self.method == 'tree_path':
+            # The decomposition reproduces the model output, so no separate predict call
+            bias, contributions = self._tree.contributions(X)
+            output = bias + contributions.sum(axis=1)
+            if output.shape[1] == 1 and n_classes == 2:
+                predicted = (output[:, 0] > 0).astype(np.int64)
+            else:
+                predicted = np.argmax(output, axis=1)
+            per_column = np.stack([_class_output(contributions[i], c, n_classes)
+                                   for i, c in enumerate(predicted)])
+            return self.classes[predicted], group_sum(per_column, self.groups)
+
+        proba = self.model.predict_proba(X)
+        predicted = np.argmax(proba, axis=1)
+        if self.method == 'linear':
+            coef = np.atleast_2d(self.model.coef_)
+            terms = (X - self.background)[:, None, :] * coef[None, :, :]
+            per_column = np.stack([_class_output(np.moveaxis(terms[i], 0, -1), c, n_classes)
+                                   for i, c in enumerate(predicted)])
+        else:
+            n, labels = X.shape[0], list(self.groups)
+            occluded = np.repeat(X, len(labels), axis=0).reshape(n, len(labels), -1)
+            for g, label in enumerate(labels):
+                cols = self.groups[label]
+                occluded[:, g, cols] = self.background[cols]
+            occluded_proba = self.model.predict_proba(occluded.reshape(n * len(labels), -1))
+            occluded_proba = occluded_proba.reshape(n, len(labels), n_classes)
+            rows = np.arange(n)
+            drops = proba[rows, predicted][:, None] - occluded_proba[rows, :, predicted]
+            return self.classes[predicted], pd.DataFrame(drops, columns=labels)
+        return self.classes[predicted], group_sum(per_column, self.groups)
+
+    def explain_one(self, x, top=5):
+        """Top ``top`` (group, contribution) pairs for one encoded row, by magnitude."""
+        label, table = self.explain(np.asarray(x, dtype=np.float64).reshape(1, -1))
+        row = table.iloc[0]
+        order = row.abs().sort_values(ascending=False).index[:top]
+        return label[0], [(name, float(row[name])) for name in order]
+
+
+# ----------------------------------------------------------------------------
+# Importance cache per model artifact
+# ----------------------------------------------------------------------------
+
+def importance_cache_path(artifact_path):
+    return os.path.splitext(artifact_path)[0] + '.importance.json'
+
+
+def importance_key(method, X, y, **params):
+    """Cache key of an importance table: method, parameters and evaluation data."""
+    return f"{method}-{joblib.hash((sorted(params.items()), _dense(X), np.asarray(y)))}"
+
+
+def load_importance(artifact_path, model_version, key):
+    """Cached importance table for this artifact version and key, or None."""
+    path = importance_cache_path(artifact_path)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        cache = json.load(f)
+    if cache.get('model_version') != model_version or key not in cache['entries']:
+        return None
+    return pd.DataFrame(cache['entries'][key]).set_index('column')
+
+
+def save_importance(artifact_path, model_version, key, table):
+    """Store an importance table; entries of other model versions are dropped."""
+    path = importance_cache_path(artifact_path)
+    cache = {'model_version': model_version, 'entries': {}}
+    if os.path.exists(path):
+        with open(path) as f:
+            existing = json.load(f)
+        if existing.get('model_version') == model_version:
+            cache = existing
+    cache['entries'][key] = table.rename_axis('column').reset_index().to_dict('list')
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, 'w') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp, path)
+
+
+def cached_importance(artifact_path, model_version, method, model, X, y, groups, **params):
+    """
+    Importance table for a model artifact, computed once per version, method and data.
+
+    Returns:
+        (table, from_cache)
+    """
+    key = importance_key(method, X, y, **params)
+    table = load_importance(artifact_path, model_version, key)
+    if table is not None:
+        return table, True
+    if method == 'tree_path':
+        table = tree_path_importance(model, X, groups)
+    else:
+        table = permutation_importance(model, X, y, groups, **params)
+    save_importance(artifact_path, model_version, key, table)
+    return table, False
+
+
+def main(argv=None):
+    from model_artifact import DEFAULT_ARTIFACT_PATH
+    from predict import Predictor
+
+    parser = argparse.ArgumentParser(description="Feature importance and per-patient explanations")
+    parser.add_argument('input', nargs='?', default='patient_dataset_5000_realistic.csv',
+                        help="Labelled patient CSV to evaluate on")
+    parser.add_argument('--artifact', default=DEFAULT_ARTIFACT_PATH, help="Model artifact path")
+    parser.add_argument('--method', choices=ATTRIBUTION_METHODS, default='permutation')
+    parser.add_argument('--max-rows', type=int, default=None,
+                        help="Evaluate on a sample of this many rows (approximate, faster)")
+    parser.add_argument('--repeats', type=int, default=5, help="Shuffles per column (permutation)")
+    parser.add_argument('--level', choices=('raw', 'feature'), default='raw',
+                        help="Report per raw patient column or per engineered feature")
+    parser.add_argument('--explain', type=int, default=0, help="Also explain the first N patients")
+    args = parser.parse_args(argv)
+
+    predictor = Predictor(args.artifact)
+    meta = predictor.metadata
+    frame = pd.read_csv(args.input)
+    frame = frame[frame[meta['target']].notna()]  # unlabelled rows have no accuracy to lose
+    if args.max_rows is not None and len(frame) > args.max_rows:
+        frame = frame.sample(n=args.max_rows, random_state=0)
+    X = predictor.transform(frame)
+    y = frame[meta['target']].astype(str).to_numpy()
+    _, features = feature_map(predictor.preprocessor)
+    groups = feature_groups(features, args.level)
+
+    params = {} if args.method == 'tree_path' else {'n_repeats': args.repeats}
+    table, from_cache = cached_importance(args.artifact, meta['model_version'], args.method,
+                                          predictor.model, X, y, groups, **params)
+    source = "cached" if from_cache else "computed"
+    print(f"✓ {args.method} importance of {meta['model_name']} on {len(y)} rows ({source}):")
+    print(table.to_string())
+
+    if args.explain:
+        explainer = predictor.explainer()
+        print(f"\nPer-patient explanations ({explainer.method}):")
+        for record in frame.head(args.explain).to_dict('records'):
+            label, top = predictor.explain_one(record)
+            terms = ', '.join(f"{name} {value:+.3f}" for name, value in top)
+            print(f"  {record.get('Patient_ID', '?')}: {label} ← {terms}")
+
+
+if __name__ == "__main__":
+    main()
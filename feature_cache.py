@@ -0,0 +1,357 @@
+"""
+Fold-Aware Feature Cache
+========================
+
+Fits the preprocessing ``ColumnTransformer`` once per cross-validation fold,
+on that fold's training rows only, and memoises the fitted transformers so
+every estimator and every hyperparameter configuration reuses them.
+
+The per-fold matrices are exposed as one stacked ``FoldMatrix`` with a
+matching list of (train, test) index pairs, so any scikit-learn search can
+consume them as ``search.fit(cache.X, cache.y)`` with ``cv=cache.cv`` and
+never re-fit the preprocessing. The stacked matrix is virtual: a fold's rows
+are transformed when the search indexes them, and only the most recent fold
+is held in memory, rather than all folds (n_splits × the training matrix).
+"""
+
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.base import BaseEstimator, TransformerMixin, clone
+from sklearn.pipeline import make_pipeline
+
+
+class PredefinedFolds:
+    """CV splitter that replays fixed (train, test) index pairs."""
+
+    def __init__(self, splits):
+        self.splits = splits
+
+    def split(self, X=None, y=None, groups=None):
+        yield from self.splits
+
+    def get_n_splits(self, X=None, y=None, groups=None):
+        return len(self.splits)
+
+
+def _pad_columns(matrix, width):
+    """Right-pad a matrix with zero columns up to ``width``."""
+    missing = width - matrix.shape[1]
+    if missing == 0:
+        return matrix
+    if sparse.issparse(matrix):
+        return sparse.hstack([matrix, sparse.csr_matrix((matrix.shape[0], missing))], format='csr')
+    return np.hstack([matrix, np.zeros((matrix.shape[0], missing), dtype=matrix.dtype)])
+
+
+class NativeCategoricals(TransformerMixin, BaseEstimator):
+    """
+    Fold the one-hot blocks of a fitted preprocessor back into one code column each.
+
+    For estimators with native categorical support (histogram gradient
+    boosting): numeric columns pass through, every categorical becomes a
+    single column of category codes, and both the imputer's fill category
+    and categories unseen at fit time (all-zero blocks) become NaN, so the
+    estimator's own missing-value handling sees them. The layout is read
+    from ``preprocessor``; no statistics are learned from the data.
+
+    Args:
+        preprocessor: Fitted ColumnTransformer ('num' / 'cat' transformers)
+                      whose output this step receives
+        max_categories: Categoricals with more levels are flagged as ordinary
+                        numeric code columns in ``categorical_mask_``
+    """
+
+    def __init__(self, preprocessor=None, max_categories=255):
+        self.preprocessor = preprocessor
+        self.max_categories = max_categories
+
+    def fit(self, X=None, y=None):
+        pre = self.preprocessor
+        num = pre.output_indices_['num']
+        self.numeric_ = np.arange(num.start, num.stop)
+        self.blocks_ = []
+        if 'cat' in pre.named_transformers_ and pre.output_indices_['cat'].stop > pre.output_indices_['cat'].start:
+            cat = pre.named_transformers_['cat']
+            fill = cat.named_steps['imputer'].fill_value
+            start = pre.output_indices_['cat'].start
+            for categories in cat.named_steps['onehot'].categories_:
+                fill_code = np.flatnonzero(categories == fill)
+                self.blocks_.append((start, start + len(categories),
+                                     int(fill_code[0]) if len(fill_code) else -1))
+                start += len(categories)
+        self.n_features_in_ = max(s.stop for s in pre.output_indices_.values())
+        # Input column each output column is read from (a block's first column for a categorical)
+        self.input_columns_ = np.r_[self.numeric_, [start for start, _, _ in self.blocks_]].astype(np.int64)
+        self.categorical_mask_ = np.r_[np.zeros(len(self.numeric_), dtype=bool),
+                                       [stop - start <= self.max_categories
+                                        for start, stop, _ in self.blocks_]]
+        return self
+
+    def transform(self, X):
+        out = np.empty((X.shape[0], len(self.numeric_) + len(self.blocks_)), dtype=np.float64)
+        numeric = X[:, self.numeric_]
+        out[:, :len(self.numeric_)] = numeric.toarray() if sparse.issparse(numeric) else numeric
+        for j, (start, stop, fill_code) in enumerate(self.blocks_, start=len(self.numeric_)):
+            block = X[:, start:stop]
+            block = block.toarray() if sparse.issparse(block) else np.asarray(block)
+            codes = block.argmax(axis=1).astype(np.float64)
+            codes[block.max(axis=1) == 0] = np.nan
+            codes[codes == fill_code] = np.nan
+            out[:, j] = codes
+        return out
+
+
+def _vstack(blocks):
+    if any(sparse.issparse(b) for b in blocks):
+        return sparse.vstack([sparse.csr_matrix(b) for b in blocks], format='csr')
+    return np.vstack(blocks)
+
+
+def _transform(chain, X):
+    for transformer in chain:
+        X = transformer.transform(X)
+    return X
+
+
+class FoldMatrix:
+    """
+    Stacked per-fold feature matrix, transformed on demand.
+
+    Row block ``k`` holds raw rows ``rows[bounds[k]:bounds[k + 1]]`` (fold
+    ``k``'s training rows, then its test rows) transformed by fold ``k``'s
+    fitted transformer chain. Indexing rows (``X[idx]``, as the CV searches
+    do with a fold's train or test positions) transforms the touched folds
+    and memoises the most recent one, so a fold's train and test rows cost
+    one transform. Blocks are right-padded with zero columns to ``shape[1]``.
+
+    Args:
+        X_raw: Raw training features (DataFrame)
+        chains: Fitted transformers of each fold, applied in order
+        rows: Raw row of each stacked row
+        bounds: Start of each fold's block, plus the total row count
+        width: Columns of the widest fold
+        key: Content hash of the raw rows, folds and transformer spec
+        dense: Emit dense arrays even when the transformers produce CSR
+    """
+
+    def __init__(self, X_raw, chains, rows, bounds, width, key, dense=False):
+        self.X_raw = X_raw
+        self.chains = chains
+        self.rows = rows
+        self.bounds = bounds
+        self.width = width
+        self.key = key
+        self.dense = dense
+        self.sparse = False
+        self._memo = None
+        if not dense:
+            probe = _transform(chains[0], X_raw.iloc[:1])
+            self.sparse = sparse.issparse(probe)
+
+    @property
+    def shape(self):
+        return (len(self.rows), self.width)
+
+    @property
+    def ndim(self):
+        return 2
+
+    def __len__(self):
+        return len(self.rows)
+
+    def densified(self):
+        """The same matrix with dense blocks (for estimators without sparse support)."""
+        if not self.sparse:
+            return self
+        return FoldMatrix(self.X_raw, self.chains, self.rows, self.bounds, self.width,
+                          self.key, dense=True)
+
+    def block(self, k):
+        """The whole transformed, padded block of fold ``k``."""
+        memo = self._memo
+        if memo is not None and memo[0] == k:
+            return memo[1]
+        start, stop = self.bounds[k], self.bounds[k + 1]
+        X = _pad_columns(_transform(self.chains[k], self.X_raw.iloc[self.rows[start:stop]]), self.width)
+        if self.dense and sparse.issparse(X):
+            X = X.toarray()
+        elif sparse.issparse(X):
+            X = X.tocsr()
+        self._memo = (k, X)
+        return X
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            key, rest = key[0], key[1:]
+            if rest not in ((), (Ellipsis,)):
+                raise IndexError("FoldMatrix only supports row indexing")
+        positions = np.arange(len(self.rows))[key]
+        if np.ndim(positions) == 0:
+            positions = positions.reshape(1)
+        folds = np.searchsorted(self.bounds, positions, side='right') - 1
+        if len(positions) and (folds == folds[0]).all():
+            return self.block(folds[0])[positions - self.bounds[folds[0]]]
+        # Rows spanning folds: gather fold by fold, then restore the requested order
+        order = np.argsort(folds, kind='stable')
+        parts = [self.block(k)[positions[order][folds[order] == k] - self.bounds[k]]
+                 for k in np.unique(folds)]
+        if not parts:
+            return self.block(0)[:0]
+        gathered = _vstack(parts)
+        return gathered[np.argsort(order, kind='stable')]
+
+    def __getstate__(self):
+        # The memoised fold is a per-process scratch buffer, not part of the content
+        state = self.__dict__.copy()
+        state['_memo'] = None
+        return state
+
+
+class FoldFeatureCache:
+    """
+    Leakage-free per-fold feature matrices, fitted once and transformed on demand.
+
+    Args:
+        preprocessor: ColumnTransformer (cloned and fitted per fold)
+        X: Raw training features (DataFrame)
+        y: Training target
+        cv: CV splitter whose folds the searches use
+        strata: Labels the folds are stratified on (default: ``y``), e.g. the
+                joint label of several targets sharing the cache
+    """
+
+    def __init__(self, preprocessor, X, y, cv, strata=None):
+        self.preprocessor = preprocessor
+        self.X_raw = X
+        self.y_raw = np.asarray(y)
+        self.strata = self.y_raw if strata is None else np.asarray(strata)
+        self.base_cv = cv
+        self._stacked = None
+        self._derived = {}
+        # Raw row of each stacked row, and the folds over the raw rows
+        self._rows = None
+        self._raw_splits = None
+        # Fitted transformer chain of each fold
+        self._chains = None
+        self.build_seconds = 0.0
+
+    def fold(self, k):
+        """Return the (X_train, X_test, y_train, y_test) matrices of fold ``k``."""
+        X, y, cv = self.build()
+        train_idx, test_idx = cv.splits[k]
+        return X[train_idx], X[test_idx], y[train_idx], y[test_idx]
+
+    def with_step(self, transformer):
+        """
+        Return a cache whose per-fold pipeline ends with ``transformer``.
+
+        The step (e.g. ``NativeCategoricals``) is fitted on each fold's
+        preprocessed training rows, reusing this cache's fitted preprocessors
+        rather than re-fitting them; a step with a ``preprocessor`` parameter
+        gets that fold's fitted preprocessor. The derived cache is memoised,
+        so every configuration of every search that asks for the same step
+        shares it.
+        """
+        key = repr(transformer)
+        if key not in self._derived:
+            X, y, cv = self.build()
+            start = time.perf_counter()
+            chains = []
+            for k, (train_idx, _) in enumerate(cv.splits):
+                step = clone(transformer)
+                if 'preprocessor' in step.get_params():
+                    step.set_params(preprocessor=self._chains[k][0])
+                step.fit(X[train_idx])
+                chains.append(self._chains[k] + [step])
+            derived = FoldFeatureCache(make_pipeline(self.preprocessor, transformer),
+                                       self.X_raw, self.y_raw, self.base_cv, self.strata)
+            # Same rows and folds, one more step per chain
+            derived._stacked = (self._matrix(chains, derived.preprocessor), y, cv)
+            derived._rows, derived._raw_splits = self._rows, self._raw_splits
+            derived._chains = chains
+            derived.build_seconds = time.perf_counter() - start
+            self._derived[key] = derived
+        return self._derived[key]
+
+    def with_target(self, y):
+        """
+        Return a cache over the same rows and folds for another target.
+
+        The fitted fold transformers (and the derived caches built so far)
+        are shared; only the labels are gathered into the stacked row order,
+        so a second target costs no preprocessing. The folds stay those of
+        this cache (stratified on its ``strata``).
+        """
+        X, _, cv = self.build()
+        y = np.asarray(y)
+        other = FoldFeatureCache(self.preprocessor, self.X_raw, y, PredefinedFolds(self._raw_splits))
+        other._stacked = (X, y[self._rows], cv)
+        other._rows, other._raw_splits = self._rows, self._raw_splits
+        other._chains = self._chains
+        other._derived = {key: derived.with_target(y) for key, derived in self._derived.items()}
+        other.build_seconds = 0.0
+        return other
+
+    @property
+    def raw_splits(self):
+        """The (train, test) folds as positions in the raw training rows."""
+        self.build()
+        return self._raw_splits
+
+    @property
+    def X(self):
+        return self.build()[0]
+
+    @property
+    def y(self):
+        return self.build()[1]
+
+    @property
+    def cv(self):
+        return self.build()[2]
+
+    def _matrix(self, chains, spec):
+        """The stacked FoldMatrix of fitted fold chains (``spec``: their unfitted pipeline)."""
+        bounds = np.r_[0, np.cumsum([len(tr) + len(te) for tr, te in self._raw_splits])]
+        # Fold vocabularies can differ in size; blocks are padded to the widest.
+        # A fold's rows are only ever used together, so padded columns are all-zero for it.
+        width = max(_transform(chain, self.X_raw.iloc[:1]).shape[1] for chain in chains)
+        key = joblib.hash((list(self.X_raw.columns),
+                           pd.util.hash_pandas_object(self.X_raw, index=False).to_numpy(),
+                           self._rows, bounds, clone(spec)))
+        return FoldMatrix(self.X_raw, chains, self._rows, bounds, width, key)
+
+    def build(self):
+        """
+        Fit the preprocessor on each fold's training rows (once).
+
+        Returns:
+            (X, y, cv): the stacked ``FoldMatrix``, the stacked labels and the
+            ``PredefinedFolds`` over the stacked rows
+        """
+        if self._stacked is not None:
+            return self._stacked
+
+        start = time.perf_counter()
+        targets, splits, rows, raw_splits, chains = [], [], [], [], []
+        offset = 0
+        for train_idx, test_idx in self.base_cv.split(self.X_raw, self.strata):
+            # Statistics (medians, scaler moments, vocabularies) come from the fold's training rows only
+            chains.append([clone(self.preprocessor).fit(self.X_raw.iloc[train_idx])])
+            targets.extend([self.y_raw[train_idx], self.y_raw[test_idx]])
+            rows.extend([train_idx, test_idx])
+            raw_splits.append((train_idx, test_idx))
+            n_tr, n_te = len(train_idx), len(test_idx)
+            splits.append((np.arange(offset, offset + n_tr),
+                           np.arange(offset + n_tr, offset + n_tr + n_te)))
+            offset += n_tr + n_te
+
+        self._rows, self._raw_splits, self._chains = np.concatenate(rows), raw_splits, chains
+        self._stacked = (self._matrix(chains, self.preprocessor), np.concatenate(targets),
+                         PredefinedFolds(splits))
+        self.build_seconds = time.perf_counter() - start
+        return self._stacked
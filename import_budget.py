@@ -0,0 +1,109 @@
+"""
+Import-Time Budget
+==================
+
+Checks that the pipeline's entry modules start quickly. Each module is
+imported in a fresh interpreter under ``python -X importtime``; the check
+fails when the best of several runs exceeds its budget, or when a module
+that only a later stage needs (plotting, XGBoost, the ensemble estimators)
+is imported at startup.
+
+``tests/test_import_budget.py`` runs the same check under pytest. To see
+where the time goes, run it by hand:
+    python import_budget.py
+    python import_budget.py --modules train_erm_model --budget-ms 1500 --top 15
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+DEFAULT_MODULES = ('train_erm_model', 'predict', 'scoring_server')
+
+# Cold-start budget per module (milliseconds, best of --repeat runs)
+DEFAULT_BUDGET_MS = 2000
+
+# Imported only by the stage that needs them
+LAZY_MODULES = ('matplotlib', 'seaborn', 'xgboost', 'sklearn.ensemble')
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def measure_import(module, python=sys.executable):
+    """
+    Import ``module`` in a fresh interpreter.
+
+    Returns:
+        (cumulative_seconds, entries): the module's cumulative import time and
+        a list of (name, depth, self_us, cumulative_us) for everything it imported
+    """
+    result = subprocess.run([python, '-X', 'importtime', '-c', f"import {module}"],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    entries = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        depth = len(indent) // 2
+        if depth == 0 and name != module:
+            entries = []  # interpreter startup, not part of the module's import
+            continue
+        entries.append((name, depth, int(self_us), int(cumulative_us)))
+        if depth == 0:
+            return int(cumulative_us) / 1e6, entries
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def eager_lazy_modules(entries, lazy=LAZY_MODULES):
+    """Stage-only modules that were imported at startup."""
+    names = {name for name, *_ in entries}
+    return sorted(m for m in lazy if m in names)
+
+
+def heaviest(entries, top=10, depth=1):
+    """The ``top`` direct imports (at ``depth``) with the largest cumulative time."""
+    direct = [(name, cum) for name, d, _, cum in entries if d == depth]
+    return sorted(direct, key=lambda item: item[1], reverse=True)[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the import-time budget of the pipeline modules")
+    parser.add_argument('--modules', default=','.join(DEFAULT_MODULES),
+                        help="Comma-separated modules to check")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help="Maximum cumulative import time per module")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per module (the best one counts)")
+    parser.add_argument('--top', type=int, default=8, help="Heaviest direct imports to list")
+    args = parser.parse_args(argv)
+
+    failures = []
+    for module in args.modules.split(','):
+        runs = [measure_import(module) for _ in range(args.repeat)]
+        seconds, entries = min(runs, key=lambda run: run[0])
+        eager = eager_lazy_modules(entries)
+        over = seconds * 1000 > args.budget_ms
+        status = '✗' if over or eager else '✓'
+        print(f"{status} {module}: {seconds * 1000:.0f} ms (budget {args.budget_ms:.0f} ms)")
+        for name, cumulative in heaviest(entries, args.top):
+            print(f"    {name:32s} {cumulative / 1000:8.1f} ms")
+        if over:
+            failures.append(f"{module} imports in {seconds * 1000:.0f} ms > {args.budget_ms:.0f} ms")
+        if eager:
+            failures.append(f"{module} eagerly imports {', '.join(eager)}")
+
+    if failures:
+        print(f"\n⚠ {len(failures)} import budget violation(s):")
+        for failure in failures:
+            print(f"  - {failure}")
+        return 1
+    print("\n✓ All modules within the import budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
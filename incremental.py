@@ -0,0 +1,451 @@
+"""
+Incremental Retraining
+======================
+
+Support for updating an exported model when new patient rows are appended
+to the training CSV, instead of retraining from scratch:
+
+- a run manifest next to the model artifact records the source file size,
+  its per-block digests (see ``dataset_cache.file_digest``), the
+  train/validation/test assignment of every row and the preprocessor's
+  sufficient statistics,
+- appended rows are found from the recorded size and digests: only the last
+  partial block of the old file is re-read to check it, and only the new
+  bytes are hashed and parsed,
+- preprocessor statistics (medians, scaler moments, category vocabularies)
+  are updated from the new rows alone,
+- fitted models are rebased onto the updated scaling and continued with
+  ``partial_fit`` or ``warm_start`` on the new rows (plus a sample of
+  replayed old rows) rather than refitted on the whole history.
+
+Blocks of the old file before its last one are trusted, not re-read: an
+in-place edit there goes unnoticed (the cost of not re-hashing the history).
+"""
+
+import json
+import math
+import os
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.utils.validation import has_fit_parameter
+
+from dataset_cache import DIGEST_BLOCK, block_digests, combine_digests
+
+# Bump when the manifest layout changes
+MANIFEST_VERSION = 2
+
+# Fewest old training rows replayed alongside a batch of new rows
+MIN_REPLAY = 1000
+
+# Row assignment codes stored in the manifest (-1: row not used, e.g. missing target)
+SPLIT_CODES = {'train': 0, 'val': 1, 'test': 2}
+
+
+def manifest_path(artifact_path):
+    """Manifest JSON written next to a model artifact."""
+    return os.path.splitext(artifact_path)[0] + '.manifest.json'
+
+
+def _splits_path(artifact_path):
+    return os.path.splitext(artifact_path)[0] + '.splits.npy'
+
+
+def split_assignments(n_rows, train_index, val_index, test_index):
+    """Encode the row labels of the three splits as one int8 code per row."""
+    splits = np.full(n_rows, -1, dtype=np.int8)
+    splits[np.asarray(train_index)] = SPLIT_CODES['train']
+    splits[np.asarray(val_index)] = SPLIT_CODES['val']
+    splits[np.asarray(test_index)] = SPLIT_CODES['test']
+    return splits
+
+
+def assign_splits(ids, test_size=0.15, val_size=0.15, y=None):
+    """
+    Deterministically assign rows to train/val/test by a hash of their ID.
+
+    Without ``y`` every row is placed by its own hash. With ``y`` the
+    assignment is stratified: within each class the rows are ordered by
+    hash and the split fractions are taken as per-class quotas, as the
+    stratified split of a full run does. Either way the assignment depends
+    only on the rows passed in, so appended rows are placed without
+    revisiting the existing ones.
+
+    Returns:
+        int8 array of SPLIT_CODES
+    """
+    hashes = pd.util.hash_pandas_object(pd.Series(ids).astype(str), index=False).to_numpy()
+    u = hashes / np.float64(2 ** 64)
+    if y is not None:
+        # Replace each hash by the row's mid-rank position within its class
+        codes = pd.factorize(pd.Series(np.asarray(y)), use_na_sentinel=False)[0]
+        order = np.lexsort((u, codes))
+        counts = np.bincount(codes)
+        starts = np.cumsum(counts) - counts
+        rank = np.empty(len(u), dtype=np.float64)
+        rank[order] = np.arange(len(u)) - np.repeat(starts, counts)
+        u = (rank + 0.5) / counts[codes]
+    splits = np.full(len(u), SPLIT_CODES['train'], dtype=np.int8)
+    splits[u < test_size + val_size] = SPLIT_CODES['val']
+    splits[u < test_size] = SPLIT_CODES['test']
+    return splits
+
+
+class PreprocessorStats:
+    """
+    Exact sufficient statistics of the preprocessing ``ColumnTransformer``
+    (median imputer + standard scaler, constant imputer + one-hot encoder).
+
+    Numeric columns keep a value histogram, from which both the median and
+    the scaler moments of the imputed column follow exactly; the clinical
+    vitals are low-cardinality, so the histograms stay small. Categorical
+    columns keep their category counts.
+    """
+
+    def __init__(self, numerical_features, categorical_features, fill_value='unknown'):
+        self.fill_value = fill_value
+        self.values = {col: Counter() for col in numerical_features}
+        self.missing = {col: 0 for col in numerical_features}
+        self.categories = {col: Counter() for col in categorical_features}
+        self.rows = 0
+
+    def update(self, X):
+        """Add the training rows of a DataFrame to the statistics."""
+        for col in self.values:
+            values = pd.to_numeric(X[col], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+            observed = values[~np.isnan(values)]
+            self.missing[col] += len(values) - len(observed)
+            uniques, counts = np.unique(observed, return_counts=True)
+            self.values[col].update(dict(zip(uniques.tolist(), counts.tolist())))
+        for col in self.categories:
+            values = X[col].astype(object).where(X[col].notna(), self.fill_value).astype(str)
+            self.categories[col].update(values.value_counts().to_dict())
+        self.rows += len(X)
+        return self
+
+    def histogram(self, col):
+        """Sorted distinct observed values of a numeric column and their counts."""
+        values = np.array(sorted(self.values[col]), dtype=np.float64)
+        counts = np.array([self.values[col][v] for v in values], dtype=np.float64)
+        return values, counts
+
+    def median(self, col):
+        """Median of the observed values (as SimpleImputer(strategy='median'))."""
+        values, counts = self.histogram(col)
+        if not len(values):
+            return np.nan
+        cumulative = np.cumsum(counts)
+        n = int(cumulative[-1])
+        lo = values[np.searchsorted(cumulative, (n - 1) // 2, side='right')]
+        hi = values[np.searchsorted(cumulative, n // 2, side='right')]
+        return (lo + hi) / 2
+
+    def moments(self, col):
+        """Mean and (population) variance of the column after median imputation."""
+        values, counts = self.histogram(col)
+        median, n_missing = self.median(col), self.missing[col]
+        n = counts.sum() + n_missing
+        mean = (values @ counts + n_missing * median) / n
+        var = (counts @ (values - mean) ** 2 + n_missing * (median - mean) ** 2) / n
+        return mean, var
+
+    def supports(self, columns):
+        """Sorted distinct observed values of each numeric column."""
+        return [self.histogram(col)[0] for col in columns]
+
+    def new_categories(self, preprocessor):
+        """Categories seen in the statistics but unknown to the fitted encoder."""
+        encoder = preprocessor.named_transformers_['cat'].named_steps['onehot']
+        cat_cols = [cols for name, _, cols in preprocessor.transformers_ if name == 'cat'][0]
+        unseen = {}
+        for col, known in zip(cat_cols, encoder.categories_):
+            extra = set(self.categories[col]) - set(map(str, known))
+            if extra:
+                unseen[col] = sorted(extra)
+        return unseen
+
+    def apply(self, preprocessor):
+        """
+        Write the statistics into a fitted preprocessor's numeric transformer.
+
+        Returns:
+            (old_mean, old_scale, new_mean, new_scale) of the scaler
+        """
+        num = preprocessor.named_transformers_['num']
+        num_cols = [cols for name, _, cols in preprocessor.transformers_ if name == 'num'][0]
+        imputer, scaler = num.named_steps['imputer'], num.named_steps['scaler']
+        old_mean, old_scale = scaler.mean_.copy(), scaler.scale_.copy()
+
+        moments = np.array([self.moments(col) for col in num_cols], dtype=np.float64)
+        scale = np.sqrt(moments[:, 1])
+        imputer.statistics_ = np.array([self.median(col) for col in num_cols], dtype=np.float64)
+        scaler.mean_, scaler.var_ = moments[:, 0], moments[:, 1]
+        scaler.scale_ = np.where(scale < 10 * np.finfo(np.float64).eps, 1.0, scale)
+        scaler.n_samples_seen_ = self.rows
+        return old_mean, old_scale, scaler.mean_, scaler.scale_
+
+    def fit_preprocessor(self, preprocessor):
+        """
+        Fit an unfitted preprocessor from the statistics alone, without the rows.
+
+        The transformer is fitted on a small frame holding every known category,
+        then its numeric statistics are overwritten with the exact ones.
+        """
+        num_cols = [cols for name, _, cols in preprocessor.transformers if name == 'num'][0]
+        cat_cols = [cols for name, _, cols in preprocessor.transformers if name == 'cat'][0]
+        n = max([len(self.categories[col]) for col in cat_cols] + [1])
+        frame = {col: np.full(n, self.median(col)) for col in num_cols}
+        for col in cat_cols:
+            known = sorted(self.categories[col]) or [self.fill_value]
+            frame[col] = np.resize(np.array(known, dtype=object), n)
+        preprocessor.fit(pd.DataFrame(frame))
+        self.apply(preprocessor)
+        return preprocessor
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'fill_value': self.fill_value,
+            'values': {col: [[v, c] for v, c in sorted(h.items())] for col, h in self.values.items()},
+            'missing': self.missing,
+            'categories': {col: dict(c) for col, c in self.categories.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(list(data['values']), list(data['categories']), data['fill_value'])
+        stats.rows = data['rows']
+        stats.values = {col: Counter({v: c for v, c in pairs}) for col, pairs in data['values'].items()}
+        stats.missing = dict(data['missing'])
+        stats.categories = {col: Counter(c) for col, c in data['categories'].items()}
+        return stats
+
+
+def write_manifest(artifact_path, source, target_col, splits, stats, blocks=None):
+    """
+    Record what an artifact was trained on, for the next incremental run.
+
+    Args:
+        artifact_path: Path of the exported model artifact
+        source: Training CSV path
+        target_col: Predicted column
+        splits: int8 split code per CSV row (see SPLIT_CODES)
+        stats: PreprocessorStats of the training rows
+        blocks: Block digests of ``source`` if already known (hashed otherwise)
+    """
+    blocks = block_digests(source) if blocks is None else blocks
+    manifest = {
+        'manifest_version': MANIFEST_VERSION,
+        'source': os.path.abspath(source),
+        'bytes': os.path.getsize(source),
+        'digest': combine_digests(blocks),
+        'blocks': blocks,
+        'rows': int(len(splits)),
+        'target': target_col,
+        'stats': stats.to_dict(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    np.save(_splits_path(artifact_path), np.asarray(splits, dtype=np.int8))
+    with open(manifest_path(artifact_path), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_manifest(artifact_path):
+    """Return (manifest, splits) for an artifact, or None if it has no manifest."""
+    path = manifest_path(artifact_path)
+    if not (os.path.exists(path) and os.path.exists(_splits_path(artifact_path))):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get('manifest_version') != MANIFEST_VERSION:
+        return None
+    return manifest, np.load(_splits_path(artifact_path))
+
+
+def find_appended_rows(manifest, path):
+    """
+    Check that ``path`` is the manifest's source with rows appended.
+
+    Only the old file's last (partial) block is re-read, to check it is
+    unchanged; the block digests are then extended over the new bytes.
+
+    Returns:
+        (offset, blocks): byte offset of the first appended row (equal to the
+        file size when nothing was appended) and the block digests of the
+        current file; None when the file was rewritten rather than appended to
+    """
+    old_size, old_blocks = manifest['bytes'], manifest['blocks']
+    if os.path.getsize(path) < old_size:
+        return None
+    with open(path, 'rb') as f:
+        f.seek(max(old_size - 1, 0))
+        if f.read(1) != b'\n':
+            return None
+    start = (old_size // DIGEST_BLOCK) * DIGEST_BLOCK
+    kept = old_blocks[:old_size // DIGEST_BLOCK]
+    if block_digests(path, start, old_size) != old_blocks[len(kept):]:
+        return None
+    return old_size, kept + block_digests(path, start)
+
+
+def _fitted_trees(model):
+    """Fitted scikit-learn decision trees of a tree or tree ensemble, else None."""
+    if hasattr(model, 'tree_'):
+        return [model]
+    estimators = getattr(model, 'estimators_', None)
+    if estimators is None:
+        return None
+    trees = list(np.ravel(estimators))
+    return trees if trees and all(hasattr(t, 'tree_') for t in trees) else None
+
+
+def _rebase_thresholds(thresholds, support, old_mean, old_scale, new_mean, new_scale):
+    """
+    Move split thresholds of one feature to the new scaling without changing
+    which side any observed value falls on.
+
+    Trees compare float32 inputs against float64 thresholds that can sit
+    within rounding of an observed value, so instead of mapping thresholds
+    affinely, each one is placed midway between the new scaled positions of
+    the nearest observed raw values on either side of it.
+    """
+    old_scaled = ((support - old_mean) / old_scale).astype(np.float32)
+    new_scaled = ((support - new_mean) / new_scale).astype(np.float32).astype(np.float64)
+    padded = np.concatenate([[new_scaled[0] - 1.0], new_scaled, [new_scaled[-1] + 1.0]])
+    n_left = np.searchsorted(old_scaled, thresholds, side='right')
+    return (padded[n_left] + padded[n_left + 1]) / 2
+
+
+def rebase_model(model, feature_slice, old_mean, old_scale, new_mean, new_scale, supports=None):
+    """
+    Re-express a fitted model in an updated standard scaling of some inputs.
+
+    With x' = (x - m) / s, a split ``x'_old <= t`` becomes
+    ``x'_new <= t * s_old / s_new + (m_old - m_new) / s_new``, and a linear
+    term ``w * x'_old`` becomes ``(w * s_new / s_old) * x'_new`` plus a
+    constant folded into the intercept. Predictions on raw data are
+    unchanged by the rebase (apart from median-imputed values).
+
+    Args:
+        model: Fitted tree, tree ensemble or linear model
+        feature_slice: Columns of the model input produced by the scaler
+        old_mean, old_scale, new_mean, new_scale: Scaler parameters
+        supports: Optional sorted observed raw values per scaled column; when
+                  given, tree thresholds are placed exactly between them
+
+    Returns:
+        True if the model was rebased, False if its type is not supported
+    """
+    ratio = old_scale / new_scale
+    shift = (old_mean - new_mean) / new_scale
+
+    trees = _fitted_trees(model)
+    if trees is not None:
+        for tree in trees:
+            t = tree.tree_
+            local = t.feature - feature_slice.start
+            hit = (t.feature >= feature_slice.start) & (t.feature < feature_slice.stop)
+            rebased = t.threshold[hit] * ratio[local[hit]] + shift[local[hit]]
+            if supports is not None:
+                thresholds = t.threshold[hit]
+                for j in np.unique(local[hit]):
+                    mine = local[hit] == j
+                    if len(supports[j]):
+                        rebased[mine] = _rebase_thresholds(thresholds[mine], supports[j], old_mean[j],
+                                                           old_scale[j], new_mean[j], new_scale[j])
+            t.threshold[hit] = rebased
+        return True
+
+    if hasattr(model, 'coef_') and hasattr(model, 'intercept_'):
+        coef = model.coef_[..., feature_slice]
+        model.intercept_ = model.intercept_ + coef @ ((new_mean - old_mean) / old_scale)
+        model.coef_[..., feature_slice] = coef / ratio
+        return True
+    return False
+
+
+def incremental_method(model):
+    """
+    How a fitted model can absorb new rows.
+
+    Returns:
+        'partial_fit', 'trees' (warm-start extra trees / boosting stages),
+        'warm_start' (refit initialised from the current solution) or None
+    """
+    params = model.get_params()
+    if hasattr(model, 'partial_fit'):
+        return 'partial_fit'
+    if 'warm_start' in params and 'n_estimators' in params and _fitted_trees(model) is not None:
+        return 'trees'
+    if 'warm_start' in params and hasattr(model, 'coef_'):
+        return 'warm_start'
+    return None
+
+
+def _stack(blocks):
+    if any(sparse.issparse(b) for b in blocks):
+        return sparse.vstack([sparse.csr_matrix(b) for b in blocks], format='csr')
+    return np.vstack(blocks)
+
+
+def continue_training(model, X_new, y_new, history, n_seen):
+    """
+    Update a fitted (and rebased) model with new training rows.
+
+    Args:
+        model: Fitted estimator
+        X_new, y_new: Preprocessed new training rows
+        history: Callable ``history(n)`` returning (X, y) for ``n`` sampled
+                 previous training rows
+        n_seen: Number of training rows the model has seen so far
+
+    Returns:
+        Description of the update, or None if the model needs a full refit
+    """
+    method = incremental_method(model)
+    y_new = np.asarray(y_new)
+
+    if method == 'partial_fit':
+        model.partial_fit(X_new, y_new)
+        return f"partial_fit on {len(y_new)} new rows"
+
+    if method == 'trees':
+        # New trees / stages in proportion to the new data, trained on the new
+        # rows plus as many replayed old rows so they do not overfit a small batch
+        n_trees = model.get_params()['n_estimators']
+        extra = max(1, math.ceil(n_trees * len(y_new) / max(n_seen, 1)))
+        X_replay, y_replay = history(len(y_new))
+        X = _stack([X_new, X_replay])
+        y = np.concatenate([y_new, np.asarray(y_replay)])
+        if set(np.unique(y).tolist()) != set(np.asarray(model.classes_).tolist()):
+            return None
+        model.set_params(warm_start=True, n_estimators=n_trees + extra)
+        model.fit(X, y)
+        model.set_params(warm_start=False)
+        return f"warm start: +{extra} trees on {len(y_new)} new + {len(y_replay)} replayed rows"
+
+    if method == 'warm_start':
+        # No partial_fit: refit from the previous coefficients on the new rows
+        # plus a replayed sample, weighted up to stand for all previous rows so
+        # the objective approximates the full-history one at a bounded cost
+        X_old, y_old = history(min(n_seen, max(len(y_new), MIN_REPLAY)))
+        X = _stack([X_new, X_old])
+        y = np.concatenate([y_new, np.asarray(y_old)])
+        if set(np.unique(y).tolist()) != set(np.asarray(model.classes_).tolist()):
+            return None
+        fit_params = {}
+        if has_fit_parameter(model, 'sample_weight') and len(y_old):
+            fit_params['sample_weight'] = np.concatenate([np.ones(len(y_new)),
+                                                          np.full(len(y_old), n_seen / len(y_old))])
+        model.set_params(warm_start=True)
+        model.fit(X, y, **fit_params)
+        model.set_params(warm_start=False)
+        weighting = f" weighted to {n_seen}" if fit_params else ""
+        return (f"no partial_fit, warm-started refit on {len(y_new)} new + "
+                f"{len(y_old)} replayed rows{weighting}")
+
+    return None
@@ -0,0 +1,229 @@
+"""
+Run Instrumentation
+===================
+
+Lightweight timing spans, peak-memory tracking and counters for the
+training pipeline, written as structured JSON lines and, optionally, a
+Prometheus textfile (for node_exporter's textfile collector).
+
+Instrumentation is off by default: ``get()`` then returns a no-op recorder
+whose spans are a shared null context, so instrumented code costs a method
+call and nothing else.
+
+Usage:
+    import instrumentation
+    instrumentation.configure(jsonl_path='metrics.jsonl', prom_path='metrics.prom')
+    with instrumentation.get().span('stage', stage='load'):
+        ...
+    instrumentation.get().count('fits_total', 180, model='Random Forest')
+    instrumentation.get().close()
+
+The Prometheus textfile is rewritten every ``flush_interval`` seconds as
+spans end and counters move, so a long or crashed run still exposes what it
+recorded, and once more on close().
+"""
+
+import contextlib
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+
+
+class PeakRSS:
+    """
+    Track peak resident memory while a block runs.
+
+    Samples /proc/self/statm from a background thread; where /proc is not
+    available it falls back to the process-lifetime ru_maxrss.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._page = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+        self._stop = threading.Event()
+
+    def _rss(self):
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * self._page
+        except OSError:
+            scale = 1 if sys.platform == 'darwin' else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_bytes = max(self.peak_bytes, self._rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak_bytes = self._rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, self._rss())
+        return False
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape_label(value):
+    """Escape a label value for the Prometheus text format (backslash, quote, newline)."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class NullInstrumentation:
+    """Disabled recorder: every call is a no-op."""
+
+    enabled = False
+    _null_span = contextlib.nullcontext()
+
+    def span(self, name, **labels):
+        return self._null_span
+
+    def count(self, name, value=1, **labels):
+        pass
+
+    def event(self, name, **fields):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class Instrumentation:
+    """
+    Recorder writing spans, counters and events.
+
+    Args:
+        jsonl_path: File that receives one JSON object per span/event (appended,
+                    flushed per line so a crashed run keeps what it recorded)
+        prom_path: Optional Prometheus textfile, rewritten at most every
+                   ``flush_interval`` seconds while recording and on close()
+        prefix: Metric name prefix for the Prometheus output
+        flush_interval: Minimum seconds between two Prometheus textfile writes
+    """
+
+    enabled = True
+
+    def __init__(self, jsonl_path=None, prom_path=None, prefix='erm', flush_interval=15.0):
+        self.prefix = prefix
+        self.prom_path = prom_path
+        self.flush_interval = flush_interval
+        self._flushed = time.monotonic()
+        self.run_id = time.strftime('%Y%m%dT%H%M%S') + f"-{os.getpid()}"
+        self._jsonl = open(jsonl_path, 'a', encoding='utf-8') if jsonl_path else None
+        self._lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.gauges = {}
+
+    def _write(self, record):
+        if self._jsonl is None:
+            return
+        record = {'ts': time.time(), 'run_id': self.run_id, **record}
+        with self._lock:
+            self._jsonl.write(json.dumps(record, default=str) + "\n")
+            self._jsonl.flush()
+
+    @contextlib.contextmanager
+    def span(self, name, **labels):
+        """Time a block: wall and CPU seconds plus peak RSS while it ran."""
+        cpu0 = time.process_time()
+        with PeakRSS() as rss:
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                wall = time.perf_counter() - start
+        cpu = time.process_time() - cpu0
+        key = (name, _label_key(labels))
+        self.gauges[('seconds',) + key] = wall
+        self.gauges[('peak_rss_bytes',) + key] = rss.peak_bytes
+        self._write({'type': 'span', 'name': name, 'labels': labels, 'wall_s': round(wall, 6),
+                     'cpu_s': round(cpu, 6), 'peak_rss_mb': round(rss.peak_bytes / 1024 ** 2, 1)})
+        self._maybe_flush()
+
+    def count(self, name, value=1, **labels):
+        """Increment a counter (e.g. fits done, configs pruned)."""
+        self.counters[(name, _label_key(labels))] += value
+        self._write({'type': 'counter', 'name': name, 'labels': labels, 'value': value})
+        self._maybe_flush()
+
+    def event(self, name, **fields):
+        """Record a free-form structured event (e.g. per-config CV fit times)."""
+        self._write({'type': 'event', 'name': name, **fields})
+
+    def _render_prometheus(self):
+        lines = []
+
+        def fmt(labels):
+            if not labels:
+                return ''
+            return '{' + ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels) + '}'
+
+        typed = set()
+
+        def add(metric, kind, labels, value):
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"{metric}{fmt(labels)} {value}")
+
+        # Copies: spans on other threads may add entries while rendering
+        for (unit, name, labels), value in sorted(dict(self.gauges).items(), key=str):
+            add(f"{self.prefix}_{name}_{unit}", 'gauge', labels, value)
+        for (name, labels), value in sorted(dict(self.counters).items(), key=str):
+            add(f"{self.prefix}_{name}", 'counter', labels, f"{value:g}")
+        add(f"{self.prefix}_last_run_timestamp_seconds", 'gauge', (), f"{time.time():.0f}")
+        return "\n".join(lines) + "\n"
+
+    def _maybe_flush(self):
+        if self.prom_path and time.monotonic() - self._flushed >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write the Prometheus textfile with everything recorded so far (atomically replaced)."""
+        if not self.prom_path:
+            return
+        with self._lock:
+            self._flushed = time.monotonic()
+            tmp = f"{self.prom_path}.tmp-{os.getpid()}"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(self._render_prometheus())
+            os.replace(tmp, self.prom_path)
+
+    def close(self):
+        """Flush the JSON lines file and write the Prometheus textfile."""
+        self.flush()
+        if self._jsonl is not None:
+            self._jsonl.close()
+            self._jsonl = None
+
+
+_current = NullInstrumentation()
+
+
+def configure(jsonl_path=None, prom_path=None):
+    """Enable instrumentation when an output is given; return the active recorder."""
+    global _current
+    _current.close()
+    _current = Instrumentation(jsonl_path, prom_path) if (jsonl_path or prom_path) else NullInstrumentation()
+    return _current
+
+
+def get():
+    """Return the active recorder (a no-op recorder unless configured)."""
+    return _current
@@ -0,0 +1,88 @@
+"""
+Model Artifacts
+===============
+
+Versioned export of a trained patient model: the fitted preprocessing
+``ColumnTransformer``, the fitted estimator, the feature schema it expects
+and run metadata, written as one joblib file plus a human-readable JSON
+sidecar.
+"""
+
+import json
+import os
+import time
+
+import joblib
+import numpy as np
+import sklearn
+
+# Bump when the artifact layout changes
+ARTIFACT_VERSION = 1
+
+DEFAULT_ARTIFACT_PATH = os.path.join('artifacts', 'patient_model.joblib')
+
+
+def export_artifact(path, preprocessor, model, model_name, target_col,
+                    raw_columns, numerical_features, categorical_features,
+                    features_version, metrics=None, extra=None):
+    """
+    Write a versioned model artifact.
+
+    Args:
+        path: Destination .joblib path (a .json sidecar is written next to it)
+        preprocessor: Fitted ColumnTransformer
+        model: Fitted estimator
+        model_name: Display name of the model
+        target_col: Name of the predicted column
+        raw_columns: Patient columns expected at scoring time (before engineering)
+        numerical_features, categorical_features: Engineered feature columns
+        features_version: clinical_features.FEATURES_VERSION used in training
+        metrics: Optional dict of evaluation metrics
+        extra: Optional dict of additional metadata
+
+    Returns:
+        metadata: The metadata dict stored in the artifact
+    """
+    metadata = {
+        'artifact_version': ARTIFACT_VERSION,
+        'model_version': time.strftime('%Y%m%d-%H%M%S'),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'model_name': model_name,
+        'estimator': type(model).__name__,
+        'target': target_col,
+        'classes': [str(c) for c in getattr(model, 'classes_', [])],
+        'schema': {
+            'raw_columns': list(raw_columns),
+            'numerical_features': list(numerical_features),
+            'categorical_features': list(categorical_features),
+            'n_features_out': int(len(preprocessor.get_feature_names_out())),
+            'features_version': features_version,
+        },
+        'sklearn_version': sklearn.__version__,
+        'numpy_version': np.__version__,
+        'metrics': metrics or {},
+        **(extra or {}),
+    }
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    joblib.dump({'metadata': metadata, 'preprocessor': preprocessor, 'model': model}, tmp)
+    os.replace(tmp, path)
+    with open(os.path.splitext(path)[0] + '.json', 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata
+
+
+def load_artifact(path=DEFAULT_ARTIFACT_PATH):
+    """
+    Load a model artifact written by ``export_artifact``.
+
+    Returns:
+        dict with 'metadata', 'preprocessor' and 'model'
+    """
+    artifact = joblib.load(path)
+    version = artifact['metadata'].get('artifact_version')
+    if version != ARTIFACT_VERSION:
+        raise ValueError(f"Unsupported artifact version {version} in {path} "
+                         f"(expected {ARTIFACT_VERSION})")
+    return artifact
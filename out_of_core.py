@@ -0,0 +1,258 @@
+"""
+Out-of-Core Training
+====================
+
+Training on patient extracts larger than memory. The CSV is streamed twice,
+chunk by chunk, and never held whole:
+
+1. every labelled row is assigned to train/validation/test by a hash of its
+   Patient_ID, stratified within each chunk (per-class quotas taken in hash
+   order, see ``incremental.assign_splits``), and the training rows'
+   preprocessing statistics and class counts are accumulated;
+2. each chunk is transformed by the preprocessor built from those
+   statistics and appended to per-split memory-mapped ``.npy`` files:
+   float32 features for ``partial_fit`` linear models, or uint8 bin codes
+   for histogram-based boosting.
+
+Models then read the memory maps in blocks, so resident memory is bounded
+by the chunk size rather than the dataset size.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+from scipy import sparse
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.pipeline import Pipeline
+
+from clinical_features import engineer_clinical_features
+from incremental import SPLIT_CODES, assign_splits
+from ingest import DEFAULT_CHUNKSIZE, iter_patient_chunks
+
+OOC_DIR = '.ooc_cache'
+OOC_MODELS = ('sgd', 'hist_gb')
+
+# Bin codes are stored as uint8
+MAX_BINS = 255
+
+
+def iter_engineered_chunks(path, target_col, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Stream a patient CSV as engineered chunks with their split codes.
+
+    Labelled rows are split with per-class quotas within the chunk, so both
+    passes (same ``chunksize``) assign every row alike; rows without a target
+    get split code -1.
+
+    Yields:
+        (features, splits): engineered DataFrame chunk and int8 split codes
+    """
+    start = 0
+    for chunk in iter_patient_chunks(path, chunksize):
+        if 'Patient_ID' in chunk:
+            ids = chunk['Patient_ID']
+        else:
+            ids = pd.Series(np.arange(start, start + len(chunk)))
+        labelled = chunk[target_col].notna().to_numpy()
+        splits = np.full(len(chunk), -1, dtype=np.int8)
+        splits[labelled] = assign_splits(ids[labelled], y=chunk[target_col][labelled])
+        start += len(chunk)
+        yield engineer_clinical_features(chunk), splits
+
+
+def bin_edges(stats, preprocessor, max_bins=MAX_BINS):
+    """
+    Per-column bin edges in the preprocessor's output space.
+
+    Scaled numeric columns get one bin per distinct value when they have at
+    most ``max_bins`` of them (lossless), otherwise quantile edges from the
+    exact value histograms; one-hot columns get a single 0/1 edge.
+    """
+    num_cols = [cols for name, _, cols in preprocessor.transformers_ if name == 'num'][0]
+    scaler = preprocessor.named_transformers_['num'].named_steps['scaler']
+    n_out = len(preprocessor.get_feature_names_out())
+    edges = [np.array([0.5])] * n_out
+    for j, col in enumerate(num_cols):
+        values, counts = stats.histogram(col)
+        if len(values) > max_bins:
+            cumulative = np.cumsum(counts)
+            targets = cumulative[-1] * np.arange(1, max_bins) / max_bins
+            values = np.unique(values[np.searchsorted(cumulative, targets)])
+        raw = (values[:-1] + values[1:]) / 2
+        edges[preprocessor.output_indices_['num'].start + j] = (raw - scaler.mean_[j]) / scaler.scale_[j]
+    return edges
+
+
+def _column_edges(values, max_bins=MAX_BINS):
+    """Bin edges of one column: midpoints between distinct values, or quantiles if there are too many."""
+    distinct = np.unique(values)
+    if len(distinct) > max_bins:
+        distinct = np.unique(np.quantile(values, np.linspace(0, 1, max_bins)))
+    return (distinct[:-1] + distinct[1:]) / 2
+
+
+class FeatureBinner(TransformerMixin, BaseEstimator):
+    """
+    Map preprocessed features to uint8 bin codes.
+
+    Args:
+        edges: Fixed per-column bin edges; when None, ``fit`` derives them from
+               the data (one bin per distinct value up to ``max_bins``, else quantiles)
+        max_bins: Maximum bins per column (at most 256 for uint8 codes)
+    """
+
+    def __init__(self, edges=None, max_bins=MAX_BINS):
+        self.edges = edges
+        self.max_bins = max_bins
+
+    def fit(self, X, y=None):
+        if self.edges is not None:
+            self.edges_ = self.edges
+        else:
+            X = X.toarray() if sparse.issparse(X) else np.asarray(X)
+            self.edges_ = [_column_edges(X[:, j], self.max_bins) for j in range(X.shape[1])]
+        return self
+
+    def transform(self, X):
+        X = X.toarray() if sparse.issparse(X) else np.asarray(X)
+        codes = np.empty(X.shape, dtype=np.uint8)
+        for j, edges in enumerate(self.edges_):
+            codes[:, j] = np.searchsorted(edges, X[:, j], side='right')
+        return codes
+
+
+class MemmapSplits:
+    """
+    Per-split memory-mapped feature matrices and label codes, filled chunk by chunk.
+
+    Args:
+        directory: Where the ``X_<split>.npy`` / ``y_<split>.npy`` files go
+        counts: Rows per split, e.g. {'train': 700_000, 'val': 150_000, 'test': 150_000}
+        n_features: Columns of the feature matrices
+        dtype: Feature dtype (float32 features or uint8 bin codes)
+    """
+
+    def __init__(self, directory, counts, n_features, dtype):
+        os.makedirs(directory, exist_ok=True)
+        self.X = {name: open_memmap(os.path.join(directory, f"X_{name}.npy"), mode='w+',
+                                    dtype=dtype, shape=(n, n_features)) for name, n in counts.items()}
+        self.y = {name: open_memmap(os.path.join(directory, f"y_{name}.npy"), mode='w+',
+                                    dtype=np.int16, shape=(n,)) for name, n in counts.items()}
+        self.filled = dict.fromkeys(counts, 0)
+
+    def append(self, name, X, y_codes):
+        start = self.filled[name]
+        self.X[name][start:start + len(X)] = X
+        self.y[name][start:start + len(X)] = y_codes
+        self.filled[name] = start + len(X)
+
+    def flush(self):
+        for arrays in (self.X, self.y):
+            for array in arrays.values():
+                array.flush()
+
+    def blocks(self, name, block_rows, rng=None):
+        """Yield (X, y_codes) blocks of a split, in shuffled block order when ``rng`` is given."""
+        n = len(self.y[name])
+        starts = np.arange(0, n, block_rows)
+        if rng is not None:
+            rng.shuffle(starts)
+        for start in starts:
+            X = np.asarray(self.X[name][start:start + block_rows])
+            y = np.asarray(self.y[name][start:start + block_rows])
+            if rng is not None:
+                order = rng.permutation(len(y))
+                X, y = X[order], y[order]
+            yield X, y
+
+
+def select_features(features, numerical_features, categorical_features):
+    """Feature columns of an engineered chunk, numeric columns coerced to numbers."""
+    X = features[numerical_features + categorical_features].copy()
+    for col in numerical_features:
+        X[col] = pd.to_numeric(X[col], errors='coerce')
+    return X
+
+
+def write_splits(path, target_col, preprocessor, numerical_features, categorical_features,
+                 classes, counts, directory, binner=None, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Second pass: transform every chunk and append it to the split memory maps.
+
+    Returns:
+        MemmapSplits holding float32 features, or uint8 bin codes with ``binner``
+    """
+    n_features = len(preprocessor.get_feature_names_out())
+    data = MemmapSplits(directory, counts, n_features, np.uint8 if binner is not None else np.float32)
+    class_index = {c: i for i, c in enumerate(classes)}
+    for features, splits in iter_engineered_chunks(path, target_col, chunksize):
+        X = select_features(features, numerical_features, categorical_features)
+        for name, code in SPLIT_CODES.items():
+            rows = np.flatnonzero(splits == code)
+            if not len(rows):
+                continue
+            Xt = preprocessor.transform(X.iloc[rows])
+            Xt = binner.transform(Xt) if binner is not None else np.asarray(
+                Xt.toarray() if sparse.issparse(Xt) else Xt, dtype=np.float32)
+            y_codes = features[target_col].iloc[rows].astype(str).map(class_index)
+            if y_codes.isna().any():
+                unknown = sorted(set(features[target_col].iloc[rows].astype(str)) - set(class_index))
+                raise ValueError(f"Labels {unknown} are missing from the class list {list(classes)}")
+            y_codes = y_codes.to_numpy()
+            data.append(name, Xt, y_codes)
+    data.flush()
+    return data
+
+
+def fit_sgd(data, classes, class_weight=None, epochs=5, block_rows=DEFAULT_CHUNKSIZE,
+            random_state=None):
+    """
+    Train a logistic-loss SGD classifier with ``partial_fit`` over the train memory map.
+
+    Each epoch visits the blocks in a new random order, shuffling rows within blocks.
+    """
+    from sklearn.linear_model import SGDClassifier
+
+    rng = np.random.default_rng(random_state)
+    model = SGDClassifier(loss='log_loss', alpha=1e-4, class_weight=class_weight,
+                          random_state=random_state)
+    for _ in range(epochs):
+        for X, y in data.blocks('train', block_rows, rng):
+            model.partial_fit(X, classes[y], classes=classes)
+    return model
+
+
+def fit_hist_gb(data, classes, binner, max_rows, class_weight=None, random_state=None):
+    """
+    Train histogram-based gradient boosting on the binned train memory map.
+
+    scikit-learn's booster needs its input in memory (as float64), so at most
+    ``max_rows`` training rows are used, sampled uniformly when the split is
+    larger. Binning already happened out of core, so each sampled row costs
+    one uint8 per feature on disk.
+
+    Returns:
+        Pipeline(binner, booster) that scores preprocessed features
+    """
+    from sklearn.ensemble import HistGradientBoostingClassifier
+
+    rng = np.random.default_rng(random_state)
+    n = len(data.y['train'])
+    rows = np.sort(rng.choice(n, size=max_rows, replace=False)) if n > max_rows else slice(None)
+    X = np.asarray(data.X['train'][rows], dtype=np.float64)
+    y = classes[np.asarray(data.y['train'][rows])]
+    booster = HistGradientBoostingClassifier(max_iter=200, learning_rate=0.1, early_stopping=True,
+                                             class_weight=class_weight, random_state=random_state)
+    booster.fit(X, y)
+    return Pipeline([('bin', binner), ('hgb', booster)])
+
+
+def streamed_accuracy(model, data, name, classes, block_rows=DEFAULT_CHUNKSIZE):
+    """Accuracy of ``model`` over a split memory map, scored block by block."""
+    correct = 0
+    for X, y in data.blocks(name, block_rows):
+        correct += int(np.sum(model.predict(X) == classes[y]))
+    n = len(data.y[name])
+    return correct / n if n else float('nan')
@@ -0,0 +1,147 @@
+"""
+Parallelism Planner
+===================
+
+Owns a single core budget for a training run and splits it between outer
+cross-validation workers and inner estimator / BLAS threads, so that a
+``GridSearchCV(n_jobs=...)`` wrapping a ``RandomForestClassifier(n_jobs=...)``
+never asks for more threads than there are cores.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from joblib import parallel_config
+from threadpoolctl import threadpool_limits
+
+# Optional: psutil gives CPU time of loky worker processes as well
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+BACKENDS = {
+    'loky': 'loky',
+    'threads': 'threading',
+    'processes': 'multiprocessing',
+}
+
+
+@dataclass
+class ParallelPlan:
+    """
+    Split of the core budget for one search.
+
+    Attributes:
+        cores: Total cores owned by the run
+        outer_jobs: Parallel CV fits (search n_jobs)
+        inner_threads: Threads per fit (estimator n_jobs and BLAS/OpenMP pools)
+        backend: User-facing backend name ('loky', 'threads', 'processes')
+    """
+    cores: int
+    outer_jobs: int
+    inner_threads: int
+    backend: str = 'loky'
+
+    def describe(self):
+        return (f"{self.cores} cores → {self.outer_jobs} outer CV worker(s) × "
+                f"{self.inner_threads} inner thread(s) [{self.backend}]")
+
+    @contextmanager
+    def activate(self):
+        """Apply the plan to joblib and the native thread pools of this process."""
+        config = {'backend': BACKENDS[self.backend], 'n_jobs': self.outer_jobs}
+        if self.backend == 'loky':
+            # Caps BLAS/OpenMP threads inside each loky worker process
+            config['inner_max_num_threads'] = self.inner_threads
+        with parallel_config(**config), threadpool_limits(limits=self.inner_threads):
+            yield self
+
+
+class ParallelismPlanner:
+    """
+    Hands out ParallelPlans from a single core budget.
+
+    Args:
+        cores: Core budget (defaults to all available cores)
+        backend: 'loky', 'threads' or 'processes'
+    """
+
+    def __init__(self, cores=None, backend='loky'):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}'. Choose from {list(BACKENDS)}")
+        self.cores = max(1, cores or available_cores())
+        self.backend = backend
+
+    def plan(self, n_tasks):
+        """
+        Plan a search of ``n_tasks`` independent CV fits.
+
+        Outer workers come first because CV fits are embarrassingly parallel;
+        cores left over once every task has a worker go to the estimator's
+        own threads (tree ``n_jobs``) and to its BLAS/OpenMP pools.
+        """
+        outer = max(1, min(self.cores, n_tasks))
+        inner = max(1, self.cores // outer)
+        return ParallelPlan(cores=self.cores, outer_jobs=outer,
+                            inner_threads=inner, backend=self.backend)
+
+
+def available_cores():
+    """Cores usable by this process (respects CPU affinity where supported)."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _cpu_seconds():
+    """
+    CPU time consumed by this process and its worker children.
+
+    Without psutil only reaped children are counted, so loky workers that
+    are still alive are missed and utilisation is under-reported.
+    """
+    if PSUTIL_AVAILABLE:
+        proc = psutil.Process()
+        total = sum(proc.cpu_times()[:2])
+        for child in proc.children(recursive=True):
+            try:
+                total += sum(child.cpu_times()[:2])
+            except psutil.NoSuchProcess:
+                pass
+        return total
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+class CpuMeter:
+    """
+    Measure wall time and CPU utilisation of a block of work.
+
+    Utilisation is CPU seconds divided by (wall seconds × cores), so 1.0
+    means the whole core budget was busy for the whole block.
+    """
+
+    def __init__(self, cores):
+        self.cores = cores
+        self.wall = 0.0
+        self.cpu = 0.0
+
+    def __enter__(self):
+        self._wall0 = time.perf_counter()
+        self._cpu0 = _cpu_seconds()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self._wall0
+        self.cpu = _cpu_seconds() - self._cpu0
+        return False
+
+    @property
+    def utilisation(self):
+        if self.wall <= 0:
+            return 0.0
+        return self.cpu / (self.wall * self.cores)
@@ -0,0 +1,243 @@
+"""
+Batch Inference for the Patient Model
+=====================================
+
+Loads a model artifact once and scores patient records:
+
+- ``Predictor.predict_proba(frame)`` scores a DataFrame of raw patient
+  records in vectorized batches, writing features into a preallocated
+  buffer instead of going through the ColumnTransformer.
+- ``Predictor.predict_one(record)`` scores a single dict with no pandas
+  overhead, for low-latency calls.
+
+Usage:
+    python predict.py records.csv --output predictions.csv
+    python predict.py --benchmark
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from clinical_features import FEATURES_VERSION, engineer_clinical_features, engineer_record
+from ingest import iter_patient_chunks
+from model_artifact import DEFAULT_ARTIFACT_PATH, load_artifact
+
+
+class _CompiledPreprocessor:
+    """
+    Replays a fitted ColumnTransformer from create_preprocessing_pipeline
+    (median impute + standard scale, 'unknown' impute + one-hot) as plain
+    array arithmetic into a caller-provided buffer.
+    """
+
+    def __init__(self, preprocessor):
+        num = preprocessor.named_transformers_['num']
+        cat = preprocessor.named_transformers_['cat']
+        columns = {name: cols for name, _, cols in preprocessor.transformers_}
+        self.num_cols = list(columns['num'])
+        self.cat_cols = list(columns['cat'])
+        self.num_slice = preprocessor.output_indices_['num']
+        self.cat_slice = preprocessor.output_indices_['cat']
+
+        scaler = num.named_steps['scaler']
+        self.median = num.named_steps['imputer'].statistics_.astype(np.float64)
+        self.mean = scaler.mean_ if scaler.with_mean else np.zeros_like(self.median)
+        self.scale = scaler.scale_ if scaler.with_std else np.ones_like(self.median)
+
+        self.fill_value = cat.named_steps['imputer'].fill_value
+        self.categories = cat.named_steps['onehot'].categories_
+        self.cat_offsets = np.cumsum([0] + [len(c) for c in self.categories[:-1]]).astype(np.int64)
+        self.category_index = [{str(v): i for i, v in enumerate(c)} for c in self.categories]
+        self.n_out = self.cat_slice.stop if self.cat_cols else self.num_slice.stop
+
+    def fill_frame(self, frame, out):
+        """Transform an engineered DataFrame into ``out[:len(frame)]``."""
+        n = len(frame)
+        rows = out[:n]
+        if self.num_cols:
+            values = frame[self.num_cols].apply(pd.to_numeric, errors='coerce').to_numpy(
+                dtype=np.float64, na_value=np.nan)
+            values = np.where(np.isnan(values), self.median, values)
+            rows[:, self.num_slice] = (values - self.mean) / self.scale
+        if self.cat_cols:
+            block = rows[:, self.cat_slice]
+            block[:] = 0.0
+            for j, col in enumerate(self.cat_cols):
+                values = frame[col].astype(object).where(frame[col].notna(), self.fill_value)
+                codes = pd.Categorical(values.astype(str), categories=self.categories[j]).codes
+                hit = codes >= 0
+                block[np.flatnonzero(hit), self.cat_offsets[j] + codes[hit]] = 1.0
+        return rows
+
+    def fill_record(self, record, row):
+        """Transform one engineered record (dict) into a 1-D ``row``."""
+        num = row[self.num_slice]
+        for i, col in enumerate(self.num_cols):
+            try:
+                value = float(record.get(col))
+            except (TypeError, ValueError):
+                value = np.nan
+            num[i] = ((self.median[i] if value != value else value) - self.mean[i]) / self.scale[i]
+        if self.cat_cols:
+            cat = row[self.cat_slice]
+            cat[:] = 0.0
+            for j, col in enumerate(self.cat_cols):
+                value = record.get(col)
+                key = self.fill_value if value is None or value != value else str(value)
+                idx = self.category_index[j].get(key)
+                if idx is not None:
+                    cat[self.cat_offsets[j] + idx] = 1.0
+        return row
+
+
+class Predictor:
+    """
+    Load a model artifact once and score patient records.
+
+    Args:
+        artifact_path: Path of the .joblib artifact
+        max_batch: Rows per internal batch (size of the preallocated buffer)
+    """
+
+    def __init__(self, artifact_path=DEFAULT_ARTIFACT_PATH, max_batch=8192):
+        artifact = load_artifact(artifact_path)
+        self.metadata = artifact['metadata']
+        self.preprocessor = artifact['preprocessor']
+        self.model = artifact['model']
+        self.classes = np.asarray(self.model.classes_)
+
+        schema = self.metadata['schema']
+        if schema['features_version'] != FEATURES_VERSION:
+            raise ValueError(f"Artifact built with clinical features v{schema['features_version']}, "
+                             f"this code provides v{FEATURES_VERSION}")
+
+        # Scoring runs on the caller's thread; estimator thread pools only add latency
+        if 'n_jobs' in self.model.get_params():
+            self.model.set_params(n_jobs=1)
+
+        self._compiled = _CompiledPreprocessor(self.preprocessor)
+        self.max_batch = max_batch
+        self._buffer = np.empty((max_batch, self._compiled.n_out), dtype=np.float64)
+        self._row = np.empty((1, self._compiled.n_out), dtype=np.float64)
+        self._explainers = {}
+
+    def transform(self, frame):
+        """Engineer and encode raw patient records (features for the estimator)."""
+        engineered = engineer_clinical_features(frame)
+        out = np.empty((len(frame), self._compiled.n_out), dtype=np.float64)
+        return self._compiled.fill_frame(engineered, out)
+
+    def predict_proba(self, frame):
+        """
+        Class probabilities for a DataFrame of raw patient records.
+
+        Returns:
+            ndarray of shape (n_rows, n_classes), columns ordered as ``classes``
+        """
+        engineered = engineer_clinical_features(frame)
+        result = np.empty((len(frame), len(self.classes)), dtype=np.float64)
+        for start in range(0, len(frame), self.max_batch):
+            stop = min(start + self.max_batch, len(frame))
+            X = self._compiled.fill_frame(engineered.iloc[start:stop], self._buffer)
+            result[start:stop] = self.model.predict_proba(X)
+        return result
+
+    def predict(self, frame):
+        """Predicted class labels for a DataFrame of raw patient records."""
+        return self.classes[np.argmax(self.predict_proba(frame), axis=1)]
+
+    def explainer(self, level='feature'):
+        """Per-patient Explainer for this model (built once per level)."""
+        if level not in self._explainers:
+            from feature_attribution import Explainer, feature_map
+
+            background = self.metadata.get('explanation', {}).get('background')
+            self._explainers[level] = Explainer(self.model, feature_map(self.preprocessor)[1],
+                                                background=background, level=level)
+        return self._explainers[level]
+
+    def explain_one(self, record, top=5, level='feature'):
+        """
+        Predicted class of one raw patient record and the features that drove it.
+
+        Returns:
+            (label, [(feature, contribution), ...]) for the ``top`` largest contributions
+        """
+        row = np.empty(self._compiled.n_out, dtype=np.float64)
+        self._compiled.fill_record(engineer_record(record), row)
+        return self.explainer(level).explain_one(row, top=top)
+
+    def predict_one(self, record):
+        """
+        Score one raw patient record (dict) on the low-latency path.
+
+        Returns:
+            dict mapping class label to probability
+        """
+        self._compiled.fill_record(engineer_record(record), self._row[0])
+        proba = self.model.predict_proba(self._row)[0]
+        return dict(zip(self.classes.tolist(), proba.tolist()))
+
+
+def score_csv(predictor, input_path, output_path, chunksize=100_000):
+    """Score a patient CSV chunk by chunk and write predictions with probabilities."""
+    written = 0
+    for i, chunk in enumerate(iter_patient_chunks(input_path, chunksize)):
+        proba = predictor.predict_proba(chunk)
+        out = pd.DataFrame(proba, columns=[f"P({c})" for c in predictor.classes], index=chunk.index)
+        out.insert(0, 'Prediction', predictor.classes[np.argmax(proba, axis=1)])
+        if 'Patient_ID' in chunk:
+            out.insert(0, 'Patient_ID', chunk['Patient_ID'])
+        out.to_csv(output_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        written += len(out)
+    return written
+
+
+def benchmark(predictor, data_path, n_rows=100_000, n_single=2000):
+    """Measure batch throughput (rows/s) and single-record latency percentiles."""
+    sample = next(iter_patient_chunks(data_path, 10_000))
+    frame = sample.sample(n=n_rows, replace=True, random_state=0).reset_index(drop=True)
+
+    predictor.predict_proba(frame.head(1000))  # warm-up
+    start = time.perf_counter()
+    predictor.predict_proba(frame)
+    elapsed = time.perf_counter() - start
+    print(f"  Batch:  {n_rows} rows in {elapsed:.3f}s → {n_rows / elapsed:,.0f} rows/s")
+
+    records = frame.head(n_single).to_dict('records')
+    latencies = np.empty(len(records))
+    for i, record in enumerate(records):
+        t0 = time.perf_counter()
+        predictor.predict_one(record)
+        latencies[i] = time.perf_counter() - t0
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    print(f"  Single: p50 {p50:.3f} ms, p99 {p99:.3f} ms over {len(records)} calls")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score patient records with a trained model artifact")
+    parser.add_argument('input', nargs='?', default='patient_dataset_5000_realistic.csv',
+                        help="Patient CSV to score")
+    parser.add_argument('--artifact', default=DEFAULT_ARTIFACT_PATH, help="Model artifact path")
+    parser.add_argument('--output', default='predictions.csv', help="Where to write predictions")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="Measure throughput and latency instead of writing predictions")
+    args = parser.parse_args(argv)
+
+    predictor = Predictor(args.artifact)
+    meta = predictor.metadata
+    print(f"✓ Loaded {meta['model_name']} (model version {meta['model_version']}, "
+          f"target '{meta['target']}')")
+
+    if args.benchmark:
+        benchmark(predictor, args.input)
+    else:
+        n = score_csv(predictor, args.input, args.output)
+        print(f"✓ Scored {n} records → {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Resumable Search Result Store
+=============================
+
+Content-addressed store for cross-validation results, so a search that is
+re-run (or restarted after a crash) only fits the cells it has not seen.
+
+A cell is one estimator configuration fitted on one fold. Its key hashes the
+estimator class, its hyperparameters and the fold's training matrix and
+labels. The matrices are the preprocessed per-fold features, so the key also
+covers the dataset contents and the preprocessing configuration. When the
+search passes ``row_ids`` (see ``StoredFit``), the search matrix is hashed
+once and each fold is keyed by that hash plus its row positions, instead of
+hashing the fold's matrix on every fit. Under the key the store keeps the
+predictions for each evaluated matrix (keyed by that matrix's hash), and
+optionally the fitted model.
+
+``StoredFit`` wraps an estimator for any scikit-learn search: ``fit`` is
+skipped when the cell is already stored, and ``predict`` returns the stored
+predictions. Changing one grid value therefore recomputes only the new cells,
+and a crashed run resumes where it stopped, whichever worker fitted the cell.
+
+Layout::
+
+    .result_store/<key[:2]>/<key>/meta.json
+                                 /predict-<matrix hash>.joblib
+                                 /model.joblib          (with save_models)
+    .result_store/tally/<run>.<reused|computed>          (one byte per fit)
+"""
+
+import json
+import os
+import time
+
+import joblib
+import numpy as np
+import sklearn
+from sklearn.base import BaseEstimator, MetaEstimatorMixin, clone
+from sklearn.utils import get_tags
+
+RESULT_STORE_DIR = '.result_store'
+
+# Bump when the stored layout or the keyed contents change
+STORE_VERSION = 1
+
+# Parameters that change how a fit runs but not what it computes
+_EXECUTION_PARAMS = ('n_jobs', 'verbose')
+
+PARAM_PREFIX = 'estimator__'
+
+
+def _atomic_write(path, write):
+    tmp = f"{path}.tmp-{os.getpid()}"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+class ResultStore:
+    """
+    Directory of fitted-cell results, safe for concurrent writers.
+
+    Args:
+        directory: Store root (shared by all workers of a search; for a
+                   distributed search, put it on the queue's shared mount)
+        save_models: Also keep each fitted model, so predictions on a new
+                     matrix do not need a refit
+    """
+
+    def __init__(self, directory=RESULT_STORE_DIR, save_models=False):
+        self.directory = os.path.abspath(directory)
+        self.save_models = save_models
+
+    @staticmethod
+    def data_key(X, y):
+        """Content hash of a search's whole matrix and labels (see ``StoredFit``)."""
+        # A FoldMatrix is identified by its raw rows, folds and transformer spec
+        return joblib.hash((getattr(X, 'key', X), np.asarray(y)))
+
+    def key(self, estimator, X, y, data_key=None, rows=None):
+        """
+        Content hash of (estimator, hyperparameters, training matrix, labels).
+
+        With ``data_key`` and ``rows`` the training matrix is identified as
+        those rows of the hashed search matrix, without hashing ``X``.
+        """
+        params = {k: v for k, v in estimator.get_params(deep=True).items()
+                  if k.split('__')[-1] not in _EXECUTION_PARAMS}
+        data = (X, np.asarray(y)) if data_key is None or rows is None else (data_key, np.asarray(rows))
+        return joblib.hash((STORE_VERSION, sklearn.__version__, type(estimator).__module__,
+                            type(estimator).__qualname__, params, data))
+
+    def _dir(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def has(self, key):
+        return os.path.exists(os.path.join(self._dir(key), 'meta.json'))
+
+    def load(self, key, name):
+        path = os.path.join(self._dir(key), f"{name}.joblib")
+        return joblib.load(path) if os.path.exists(path) else None
+
+    def save(self, key, name, obj):
+        os.makedirs(self._dir(key), exist_ok=True)
+        _atomic_write(os.path.join(self._dir(key), f"{name}.joblib"), lambda p: joblib.dump(obj, p))
+
+    def record_fit(self, key, estimator, fit_time, n_rows):
+        os.makedirs(self._dir(key), exist_ok=True)
+        meta = {'estimator': type(estimator).__name__, 'params': estimator.get_params(deep=False),
+                'fit_seconds': round(fit_time, 4), 'rows': int(n_rows), 'created': time.time()}
+
+        def write(path):
+            with open(path, 'w') as f:
+                json.dump(meta, f, default=repr)
+
+        _atomic_write(os.path.join(self._dir(key), 'meta.json'), write)
+
+    def count_cells(self):
+        """Number of stored fitted cells."""
+        if not os.path.isdir(self.directory):
+            return 0
+        return sum(name == 'meta.json' for _, _, names in os.walk(self.directory) for name in names)
+
+    def tally(self, run, event):
+        """Count one ``event`` ('reused' / 'computed') of a run, from any worker process."""
+        directory = os.path.join(self.directory, 'tally')
+        os.makedirs(directory, exist_ok=True)
+        # One-byte O_APPEND writes do not interleave between processes
+        with open(os.path.join(directory, f"{run}.{event}"), 'ab') as f:
+            f.write(b'.')
+
+    def pop_tally(self, run):
+        """Counts recorded for ``run`` so far, removing them: {'reused': n, 'computed': n}."""
+        counts = {}
+        for event in ('reused', 'computed'):
+            path = os.path.join(self.directory, 'tally', f"{run}.{event}")
+            try:
+                counts[event] = os.path.getsize(path)
+                os.remove(path)
+            except FileNotFoundError:
+                counts[event] = 0
+        return counts
+
+
+class StoredFit(MetaEstimatorMixin, BaseEstimator):
+    """
+    Estimator wrapper whose fits and predictions go through a ResultStore.
+
+    The wrapped estimator's hyperparameters are addressed as
+    ``estimator__<name>`` (see ``prefix_params`` / ``unprefix_params``).
+
+    Args:
+        estimator: Unfitted estimator
+        store: ResultStore
+        data_key: ``ResultStore.data_key`` of the search matrix; with it, fits
+                  given ``row_ids`` are keyed without hashing their matrix
+        run: Tally name; every fit counts as reused or computed under it
+    """
+
+    def __init__(self, estimator, store, data_key=None, run=None):
+        self.estimator = estimator
+        self.store = store
+        self.data_key = data_key
+        self.run = run
+
+    def __sklearn_tags__(self):
+        return get_tags(self.estimator)
+
+    def fit(self, X, y, row_ids=None):
+        """
+        Args:
+            row_ids: Positions of the rows of ``X`` in the search matrix (pass
+                     ``np.arange(n)`` to the search's ``fit``; searches
+                     index it per fold like any sample-aligned fit parameter)
+        """
+        self.key_ = self.store.key(self.estimator, X, y, self.data_key, row_ids)
+        self.classes_ = np.unique(y)
+        self.estimator_ = None
+        # A stored cell is fitted lazily, only if a prediction is missing
+        self._train = (X, y)
+        reused = self.store.has(self.key_)
+        if not reused:
+            self._fit()
+        if self.run is not None:
+            self.store.tally(self.run, 'reused' if reused else 'computed')
+        return self
+
+    def _fit(self):
+        X, y = self._train
+        model = self.store.load(self.key_, 'model') if self.store.save_models else None
+        if model is None:
+            start = time.perf_counter()
+            model = clone(self.estimator).fit(X, y)
+            if self.store.save_models:
+                self.store.save(self.key_, 'model', model)
+            self.store.record_fit(self.key_, self.estimator, time.perf_counter() - start, len(y))
+        self.estimator_ = model
+        self._train = None
+
+    def _stored(self, method, X):
+        name = f"{method}-{joblib.hash(X)}"
+        output = self.store.load(self.key_, name)
+        if output is None:
+            if self.estimator_ is None:
+                self._fit()
+            output = getattr(self.estimator_, method)(X)
+            self.store.save(self.key_, name, output)
+        return output
+
+    def predict(self, X):
+        return self._stored('predict', X)
+
+    def predict_proba(self, X):
+        return self._stored('predict_proba', X)
+
+
+def prefix_params(params):
+    """Address a grid or parameter dict to the estimator inside a StoredFit."""
+    return {PARAM_PREFIX + k: v for k, v in params.items()}
+
+
+def unprefix_params(params):
+    """Inverse of ``prefix_params`` (names without the prefix are left unchanged)."""
+    return {k.removeprefix(PARAM_PREFIX): v for k, v in params.items()}
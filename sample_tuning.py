@@ -0,0 +1,212 @@
+"""
+Sample-First Hyperparameter Tuning
+==================================
+
+Explores hyperparameters on a stratified sample of the training rows, so
+each CV fit costs a fraction of a full-data fit:
+
+- ``stratified_sample`` draws exactly the requested number of rows across
+  the strata of the target crossed with demographic columns (``Gender``
+  and age bands by default): one row of each non-empty stratum, so rare
+  classes and groups stay represented, and the rest in proportion;
+- ``train_model_with_erm`` runs the model's usual search on the sample
+  (with its own per-fold preprocessing), re-scores only the ``top_k``
+  configurations on the full training data and refits the best one;
+- ``rank_agreement`` measures how closely the sample ranking matches the
+  full-data ranking. Rank correlations need the whole grid scored on full
+  data (``verify``); over the few re-scored configurations only whether the
+  sample's best held up is reported.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from feature_cache import FoldFeatureCache
+from result_store import unprefix_params
+
+# Age bands (years, left-closed) used as a sampling stratum
+AGE_BANDS = [0, 18, 35, 50, 65, np.inf]
+
+# Stratum columns and their bins (None: one stratum per value)
+DEFAULT_STRATA = {'Gender': None, 'Age': AGE_BANDS}
+
+# Fewest configurations a rank correlation is computed over
+MIN_RANK_CONFIGS = 5
+
+
+@dataclass
+class TuningSample:
+    """
+    Training rows the searches explore on, and how the results are carried over.
+
+    Attributes:
+        rows: Positions of the sampled rows in the training set
+        fold_cache: FoldFeatureCache of the sample (None without a fold cache)
+        top_k: Configurations re-scored on the full training data
+        verify: Run the full search too and report agreement over the whole grid
+    """
+    rows: np.ndarray
+    fold_cache: Optional[FoldFeatureCache] = None
+    top_k: int = 3
+    verify: bool = False
+
+
+def sample_size(spec, n_rows):
+    """Rows to sample: ``spec`` ≤ 1 is a fraction of ``n_rows``, larger values a row count."""
+    spec = float(spec)
+    if spec <= 0:
+        raise ValueError(f"Sample size must be positive, got {spec}")
+    return min(n_rows, int(round(spec * n_rows)) if spec <= 1 else int(spec))
+
+
+def strata_codes(X, y, strata=DEFAULT_STRATA):
+    """
+    One stratum code per row: the target crossed with the stratum columns.
+
+    Columns missing from ``X`` are ignored; missing values form their own stratum.
+    """
+    parts = [pd.factorize(pd.Series(np.asarray(y)), use_na_sentinel=False)[0]]
+    for column, bins in strata.items():
+        if column not in X:
+            continue
+        values = X[column]
+        if bins is not None:
+            values = pd.cut(pd.to_numeric(values, errors='coerce'), bins, right=False)
+        parts.append(pd.factorize(values, use_na_sentinel=False)[0])
+    codes = np.zeros(len(parts[0]), dtype=np.int64)
+    for part in parts:
+        codes = codes * (int(part.max()) + 1) + part
+    return pd.factorize(codes)[0]
+
+
+def stratified_sample(codes, size, random_state=None):
+    """
+    Stratified sample of exactly ``size`` rows, drawn without per-row loops.
+
+    Every non-empty stratum keeps one row and the remaining rows are
+    allocated in proportion to what is left of each stratum, the rows left
+    after flooring going to the largest remainders. With fewer rows than
+    strata, the largest strata get one row each.
+
+    Returns:
+        Sorted row positions
+    """
+    n = len(codes)
+    if size >= n:
+        return np.arange(n)
+    counts = np.bincount(codes)
+    nonempty = np.flatnonzero(counts)
+    quota = np.zeros(len(counts), dtype=np.int64)
+    if size < len(nonempty):
+        quota[nonempty[np.argsort(-counts[nonempty], kind='stable')[:size]]] = 1
+    else:
+        quota[nonempty] = 1
+        rest = counts - quota
+        exact = rest * (size - len(nonempty)) / rest.sum()
+        quota += np.floor(exact).astype(np.int64)
+        # The remainders sum to the rows still missing, and a stratum with one never exceeds its count
+        leftover = size - int(quota.sum())
+        quota[np.argsort(-(exact - np.floor(exact)), kind='stable')[:leftover]] += 1
+
+    # Rank rows randomly within their stratum and keep the first quota of each
+    rng = np.random.default_rng(random_state)
+    order = np.lexsort((rng.random(n), codes))
+    starts = np.cumsum(counts) - counts
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n) - np.repeat(starts, counts)
+    return np.flatnonzero(rank < quota[codes])
+
+
+def make_tuning_sample(X, y, size, cv, preprocessor=None, strata=DEFAULT_STRATA, top_k=3,
+                       verify=False, random_state=None):
+    """
+    Draw the tuning sample of one target.
+
+    Args:
+        X: Raw training features (DataFrame)
+        y: Training target
+        size: Sample size spec (see ``sample_size``)
+        cv: CV splitter for the sample's searches
+        preprocessor: Unfitted ColumnTransformer; when given, the sample gets
+                      its own leakage-free FoldFeatureCache
+    """
+    codes = strata_codes(X, y, strata)
+    rows = stratified_sample(codes, sample_size(size, len(codes)), random_state)
+    fold_cache = None
+    if preprocessor is not None:
+        fold_cache = FoldFeatureCache(preprocessor, X.iloc[rows], np.asarray(y)[rows], cv)
+    return TuningSample(rows, fold_cache, top_k=top_k, verify=verify)
+
+
+def _config_key(params, resource=None):
+    params = unprefix_params(params)
+    return repr(sorted((k, v) for k, v in params.items() if k != resource))
+
+
+def ranked_configs(search, resource=None):
+    """
+    Configurations of a fitted search, best first.
+
+    Successive halving scores later rungs on more resources, so candidates
+    are ordered by the last rung they reached, then by score. Each
+    configuration appears once, at its last rung, keyed without the halving
+    ``resource`` parameter so rankings of different searches line up.
+
+    Returns:
+        List of (key, params, mean CV score)
+    """
+    results = search.cv_results_
+    params = results['params']
+    iters = np.asarray(results.get('iter', np.zeros(len(params), dtype=int)))
+    scores = np.asarray(results['mean_test_score'], dtype=float)
+    ordered = np.where(np.isnan(scores), -np.inf, scores)
+
+    last = {}
+    for i, p in enumerate(params):
+        key = _config_key(p, resource)
+        if key not in last or iters[i] >= iters[last[key]]:
+            last[key] = i
+    order = sorted(last.values(), key=lambda i: (-iters[i], -ordered[i]))
+    return [(_config_key(params[i], resource), params[i], float(scores[i])) for i in order]
+
+
+def top_k_grid(ranked, k):
+    """Grid (list of single-point grids) of the ``k`` best configurations, best first."""
+    return [{name: [value] for name, value in params.items()} for _, params, _ in ranked[:k]]
+
+
+def rank_agreement(sample_ranked, full_ranked):
+    """
+    How closely the sample ranking matches the full-data ranking.
+
+    Compared over the configurations both rankings contain. The top few
+    configurations of a sample are close in score, so their order is mostly
+    noise: the correlations are only computed over at least
+    ``MIN_RANK_CONFIGS`` configurations (in practice, a verified full grid).
+
+    Returns:
+        {'n_configs', 'spearman', 'kendall' (NaN over fewer than
+        MIN_RANK_CONFIGS configurations), 'top1' (same best configuration)
+        and 'best_sample_rank' (1-based sample rank of the full-data best)}
+    """
+    from scipy.stats import kendalltau, spearmanr
+
+    sample_rank = {key: i for i, (key, _, _) in enumerate(sample_ranked)}
+    common = [key for key, _, _ in full_ranked if key in sample_rank]
+    full_positions = np.arange(len(common))
+    sample_positions = np.array([sample_rank[key] for key in common])
+    spearman = kendall = float('nan')
+    if len(common) >= MIN_RANK_CONFIGS:
+        spearman = float(spearmanr(sample_positions, full_positions).statistic)
+        kendall = float(kendalltau(sample_positions, full_positions).statistic)
+    best = full_ranked[0][0]
+    return {
+        'n_configs': len(common),
+        'spearman': spearman,
+        'kendall': kendall,
+        'top1': bool(sample_ranked and sample_ranked[0][0] == best),
+        'best_sample_rank': sample_rank[best] + 1 if best in sample_rank else None,
+    }
@@ -0,0 +1,313 @@
+"""
+Micro-Batching Scoring Service
+==============================
+
+A small asyncio HTTP server around the model artifact exported by
+``train_erm_model.py``. Concurrent requests are queued and gathered into
+micro-batches, and each batch is scored with a single vectorized
+``predict_proba`` call instead of one model call per request.
+
+Endpoints:
+    POST /score    JSON patient record, or a list of records
+    GET  /metrics  Latency and batch-size histograms (Prometheus text format)
+    GET  /health   Liveness and model version
+
+Records are normalized and validated one by one before they are queued
+(a malformed record gets a 400 without touching its batch-mates), and a
+batch whose vectorized call fails is re-scored record by record so only
+the offending record fails.
+
+Usage:
+    python scoring_server.py --port 8085 --max-batch 256 --max-wait-ms 2
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import numpy as np
+import pandas as pd
+
+from model_artifact import DEFAULT_ARTIFACT_PATH
+from predict import Predictor
+
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+# Largest request body accepted (bytes); larger ones get a 413
+MAX_BODY_BYTES = 1 << 20
+
+
+def normalize_record(record, columns=None):
+    """
+    Validate one JSON patient record and return a flat copy for scoring.
+
+    Values must be JSON strings or numbers (booleans are rejected); a list of
+    strings (e.g. ``"Symptoms": ["Fever", "Cough"]``) is joined into the
+    comma-separated form of the CSV. With ``columns`` (the artifact's raw
+    columns) the copy holds exactly those keys, missing ones as None, so a
+    record is scored the same whatever batch it lands in.
+
+    Raises:
+        ValueError: the record is not an object or holds a nested or boolean value
+    """
+    if not isinstance(record, dict):
+        raise ValueError("expected a patient record object or a list of them")
+    flat = {}
+    for key, value in record.items():
+        if isinstance(value, list) and all(isinstance(v, str) for v in value):
+            value = ', '.join(value)
+        elif value is not None and (isinstance(value, bool) or not isinstance(value, (str, int, float))):
+            raise ValueError(f"field {key!r} must be a string or a number, "
+                             f"got {type(value).__name__}")
+        flat[key] = value
+    if columns is not None:
+        flat = {column: flat.get(column) for column in columns}
+    return flat
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = np.asarray(buckets, dtype=np.float64)
+        self.counts = np.zeros(len(buckets) + 1, dtype=np.int64)
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, value):
+        self.counts[np.searchsorted(self.buckets, value)] += 1
+        self.total += value
+        self.n += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        cumulative = np.cumsum(self.counts)
+        for bound, count in zip(self.buckets, cumulative):
+            lines.append(f'{self.name}_bucket{{le="{bound:g}"}} {count}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative[-1]}')
+        lines.append(f"{self.name}_sum {self.total:.6f}")
+        lines.append(f"{self.name}_count {self.n}")
+        return "\n".join(lines)
+
+
+class MicroBatcher:
+    """
+    Gather queued records into batches of at most ``max_batch`` rows,
+    waiting at most ``max_wait`` seconds after the first record arrives.
+
+    Scoring runs on a single worker thread so the event loop keeps
+    accepting requests while a batch is being scored.
+    """
+
+    def __init__(self, predictor, max_batch=256, max_wait=0.002):
+        self.predictor = predictor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='scorer')
+        self.batch_sizes = Histogram('scoring_batch_size', "Records per micro-batch", BATCH_BUCKETS)
+        self.batch_latency = Histogram('scoring_batch_latency_ms', "Model time per micro-batch (ms)",
+                                       LATENCY_BUCKETS_MS)
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        self.executor.shutdown(wait=False)
+
+    async def submit(self, records):
+        """Queue records and wait for their probability rows."""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for record in records:
+            future = loop.create_future()
+            self.queue.put_nowait((record, future))
+            futures.append(future)
+        return await asyncio.gather(*futures)
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # Drain anything already queued without waiting further
+        while len(batch) < self.max_batch and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    def _score(self, records):
+        start = time.perf_counter()
+        proba = self.predictor.predict_proba(pd.DataFrame.from_records(records))
+        return proba, (time.perf_counter() - start) * 1000
+
+    def _score_each(self, records):
+        """Fallback for a failed batch: score records one by one, keeping each error."""
+        results = []
+        for record in records:
+            try:
+                results.append(self.predictor.predict_proba(pd.DataFrame.from_records([record]))[0])
+            except Exception as exc:
+                results.append(ValueError(f"record could not be scored: {exc}"))
+        return results
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            records = [record for record, _ in batch]
+            try:
+                proba, elapsed_ms = await loop.run_in_executor(self.executor, self._score, records)
+                self.batch_sizes.observe(len(batch))
+                self.batch_latency.observe(elapsed_ms)
+            except Exception:
+                # One bad record must not fail its batch-mates
+                proba = await loop.run_in_executor(self.executor, self._score_each, records)
+            for (_, future), row in zip(batch, proba):
+                if future.done():
+                    continue
+                if isinstance(row, Exception):
+                    future.set_exception(row)
+                else:
+                    future.set_result(row)
+
+
+class ScoringServer:
+    """Minimal HTTP/1.1 server (keep-alive, JSON bodies) on asyncio streams."""
+
+    def __init__(self, predictor, max_batch=256, max_wait=0.002, max_body=MAX_BODY_BYTES):
+        self.predictor = predictor
+        self.max_body = max_body
+        self.batcher = MicroBatcher(predictor, max_batch=max_batch, max_wait=max_wait)
+        self.request_latency = Histogram('scoring_request_latency_ms',
+                                         "End-to-end /score latency (ms)", LATENCY_BUCKETS_MS)
+        self.classes = [str(c) for c in predictor.classes]
+        self.columns = predictor.metadata['schema']['raw_columns']
+
+    async def _score(self, body):
+        payload = json.loads(body or b'null')
+        records = payload if isinstance(payload, list) else [payload]
+        if not records:
+            return 400, {'error': "expected a patient record object or a list of them"}
+        records = [normalize_record(record, self.columns) for record in records]
+        rows = await self.batcher.submit(records)
+        results = [{'prediction': self.classes[int(np.argmax(row))],
+                    'probabilities': dict(zip(self.classes, map(float, row)))} for row in rows]
+        return 200, results if isinstance(payload, list) else results[0]
+
+    def _metrics(self):
+        return "\n".join([self.request_latency.render(), self.batcher.batch_sizes.render(),
+                          self.batcher.batch_latency.render()]) + "\n"
+
+    async def _dispatch(self, method, path, body):
+        if method == 'POST' and path == '/score':
+            try:
+                return await self._score(body)
+            except (ValueError, KeyError) as exc:
+                return 400, {'error': str(exc)}
+            except Exception as exc:
+                return 500, {'error': f"{type(exc).__name__}: {exc}"}
+        if method == 'GET' and path == '/metrics':
+            return 200, self._metrics()
+        if method == 'GET' and path == '/health':
+            meta = self.predictor.metadata
+            return 200, {'status': 'ok', 'model': meta['model_name'],
+                         'model_version': meta['model_version']}
+        return 404, {'error': f"no route for {method} {path}"}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if not 0 <= length <= self.max_body:
+                    # The body is left unread, so the connection cannot be reused
+                    status = 413 if length > 0 else 400
+                    await self._respond(writer, status, {'error': f"body of {length} bytes not accepted "
+                                                                  f"(limit {self.max_body})"})
+                    break
+                body = await reader.readexactly(length)
+
+                start = time.perf_counter()
+                status, payload = await self._dispatch(method, path, body)
+                if path == '/score' and status == 200:
+                    self.request_latency.observe((time.perf_counter() - start) * 1000)
+
+                await self._respond(writer, status, payload)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, payload):
+        if isinstance(payload, str):
+            data, content_type = payload.encode(), 'text/plain; version=0.0.4'
+        else:
+            data, content_type = json.dumps(payload).encode(), 'application/json'
+        writer.write(f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(data)}\r\n"
+                     f"Access-Control-Allow-Origin: *\r\n\r\n".encode() + data)
+        await writer.drain()
+
+    async def serve(self, host='127.0.0.1', port=8085):
+        self.batcher.start()
+        server = await asyncio.start_server(self.handle, host, port, backlog=4096)
+        print(f"✓ Scoring server listening on http://{host}:{port} "
+              f"(max batch {self.batcher.max_batch}, max wait {self.batcher.max_wait * 1000:g} ms)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-batching scoring server for the patient model")
+    parser.add_argument('--artifact', default=DEFAULT_ARTIFACT_PATH, help="Model artifact path")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8085)
+    parser.add_argument('--max-batch', type=int, default=256, help="Maximum records per model call")
+    parser.add_argument('--max-wait-ms', type=float, default=2.0,
+                        help="Maximum time a request waits for its batch to fill")
+    parser.add_argument('--max-body-bytes', type=int, default=MAX_BODY_BYTES,
+                        help="Largest request body accepted")
+    args = parser.parse_args(argv)
+
+    predictor = Predictor(args.artifact)
+    server = ScoringServer(predictor, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000,
+                           max_body=args.max_body_bytes)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
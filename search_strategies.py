@@ -0,0 +1,309 @@
+"""
+Hyperparameter Search Strategies
+================================
+
+Pluggable search strategies for ``train_model_with_erm``:
+
+- ``exhaustive``: plain ``GridSearchCV`` over every configuration.
+- ``halving``: successive halving, growing either ``n_samples`` or an
+  estimator parameter (``n_estimators``, ``max_iter``) and dropping the
+  worst configurations after each rung. A grown parameter reaches the
+  grid's largest value on the last rung, so the best configuration is a
+  grid point.
+- ``random``: budgeted random sampling from the grid.
+- ``adaptive``: budgeted sampler that, after a random warm-up round, draws
+  new configurations close to the best ones seen so far (Bayesian-style
+  exploitation on the discrete grid).
+- ``distributed``: the exhaustive grid, with its CV fits run by work-queue
+  workers on one or more machines (see ``distributed_search``).
+
+The sampled strategies stop when a fit-count or wall-clock budget runs out
+(by default, after half of the grid). Successive halving honours the fit
+count: when its full schedule would exceed it, it halves a random subset of
+the grid that fits. The exhaustive and distributed strategies always cover
+the whole grid.
+"""
+
+import math
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from sklearn.base import clone, is_classifier
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import (GridSearchCV, HalvingGridSearchCV, HalvingRandomSearchCV, ParameterGrid,
+                                     check_cv)
+
+from distributed_search import DistributedSearchCV
+
+SEARCH_STRATEGIES = ('exhaustive', 'halving', 'random', 'adaptive', 'distributed')
+
+
+@dataclass
+class SearchBudget:
+    """
+    Budget for the sampled search strategies.
+
+    Candidates are evaluated in rounds and always on every CV fold, so the
+    budget is spent in whole candidates: the fit limit is never exceeded
+    (it is rounded down to a multiple of the fold count), while the time
+    limit is checked between rounds, so the round running when it expires
+    completes. The first round always runs.
+
+    Attributes:
+        max_fits: Maximum number of CV fits (candidates × folds)
+        max_seconds: Maximum wall-clock time spent searching
+        max_share: Share of the grid's candidates evaluated when neither
+                   limit above is set
+    """
+    max_fits: Optional[int] = None
+    max_seconds: Optional[float] = None
+    max_share: float = 0.5
+
+    def fit_limit(self, n_candidates, n_splits):
+        """The fit limit for a grid of ``n_candidates`` over ``n_splits`` folds (None: no limit)."""
+        if self.max_fits is not None:
+            if self.max_fits < n_splits:
+                raise ValueError(f"SearchBudget(max_fits={self.max_fits}) cannot cover one candidate "
+                                 f"({n_splits} CV fits)")
+            return self.max_fits - self.max_fits % n_splits
+        if self.max_seconds is not None:
+            if self.max_seconds <= 0:
+                raise ValueError(f"SearchBudget(max_seconds={self.max_seconds}) allows no fits")
+            return None
+        return max(1, math.ceil(self.max_share * n_candidates)) * n_splits
+
+    def exhausted(self, n_fits, elapsed, max_fits=None):
+        """Return True once either limit has been reached."""
+        max_fits = self.max_fits if max_fits is None else max_fits
+        if max_fits is not None and n_fits >= max_fits:
+            return True
+        if self.max_seconds is not None and elapsed >= self.max_seconds:
+            return True
+        return False
+
+
+class BudgetedSearchCV:
+    """
+    Budgeted random / adaptive search over a discrete parameter grid.
+
+    Candidates are evaluated in rounds with ``GridSearchCV`` so each round
+    still uses the usual parallel CV machinery. The search exposes the same
+    ``best_params_``, ``best_score_``, ``best_estimator_`` and
+    ``cv_results_`` attributes as the scikit-learn searches.
+    """
+
+    def __init__(self, estimator, param_grid, cv, budget, scoring='accuracy',
+                 adaptive=False, round_size=None, n_jobs=None, random_state=None, refit=True):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.cv = cv
+        self.budget = budget
+        self.scoring = scoring
+        self.adaptive = adaptive
+        self.round_size = round_size
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.refit = refit
+
+    def _grid_indices(self, candidates):
+        """Encode each candidate as a vector of value positions in the grid."""
+        keys = sorted(self.param_grid)
+        positions = {k: {repr(v): i for i, v in enumerate(self.param_grid[k])} for k in keys}
+        return np.array([[positions[k][repr(c[k])] for k in keys] for c in candidates])
+
+    def _next_round(self, rng, untried, tried_idx, scores, codes, size):
+        """Pick the next batch of untried candidates."""
+        size = min(size, len(untried))
+        if not self.adaptive or not tried_idx:
+            return list(rng.choice(untried, size=size, replace=False))
+
+        # Weight untried candidates by their grid distance to the current top configs
+        top = [tried_idx[i] for i in np.argsort(scores)[::-1][:max(1, size)]]
+        dist = np.abs(codes[untried][:, None, :] - codes[top][None, :, :]).sum(axis=2).min(axis=1)
+        weights = np.exp(-dist.astype(float))
+        weights /= weights.sum()
+        return list(rng.choice(untried, size=size, replace=False, p=weights))
+
+    def fit(self, X, y, **fit_params):
+        rng = np.random.default_rng(self.random_state)
+        candidates = list(ParameterGrid(self.param_grid))
+        codes = self._grid_indices(candidates)
+        cv = check_cv(self.cv, y, classifier=is_classifier(self.estimator))
+        n_splits = cv.get_n_splits(X, y)
+        max_fits = self.budget.fit_limit(len(candidates), n_splits)
+        round_size = self.round_size or max(1, math.ceil(len(candidates) / 4))
+
+        untried = list(range(len(candidates)))
+        tried_idx, means, stds = [], [], []
+        self.n_fits_ = 0
+        start = time.perf_counter()
+
+        while untried and not (tried_idx and self.budget.exhausted(self.n_fits_, time.perf_counter() - start,
+                                                                   max_fits)):
+            size = round_size
+            if max_fits is not None:
+                size = min(size, (max_fits - self.n_fits_) // n_splits)
+            batch = self._next_round(rng, np.array(untried), tried_idx, np.array(means), codes, size)
+
+            search = GridSearchCV(
+                estimator=self.estimator,
+                param_grid=[{k: [v] for k, v in candidates[i].items()} for i in batch],
+                cv=cv,
+                scoring=self.scoring,
+                refit=False,
+                n_jobs=self.n_jobs,
+            )
+            search.fit(X, y, **fit_params)
+
+            tried_idx.extend(batch)
+            means.extend(search.cv_results_['mean_test_score'])
+            stds.extend(search.cv_results_['std_test_score'])
+            done = set(batch)
+            untried = [i for i in untried if i not in done]
+            self.n_fits_ += len(batch) * n_splits
+
+        if np.all(np.isnan(means)):
+            raise RuntimeError(f"All {len(means)} evaluated candidates failed to score")
+        # Failed fits score NaN; the best is taken among the others
+        best = int(np.nanargmax(means))
+        self.best_params_ = candidates[tried_idx[best]]
+        self.best_score_ = float(means[best])
+        if self.refit:
+            self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_).fit(X, y, **fit_params)
+        self.cv_results_ = {
+            'params': [candidates[i] for i in tried_idx],
+            'mean_test_score': np.array(means),
+            'std_test_score': np.array(stds),
+        }
+        return self
+
+
+class _LastRungAtMaxResources:
+    """
+    Successive halving whose last rung evaluates the full resource.
+
+    scikit-learn grows the resource by ``factor`` from ``min_resources``, so
+    the last rung usually falls short of ``max_resources`` (198 of 200 trees)
+    and the best parameters would name a value outside the grid. Any rung
+    that cannot grow further is run at ``max_resources`` instead.
+    """
+
+    def _run_search(self, evaluate_candidates, *, callback_ctx=None):
+        def evaluate(candidate_params, cv=None, more_results=None, **evaluate_kwargs):
+            n_resources = (more_results or {}).get('n_resources')
+            if self.resource != 'n_samples' and n_resources and n_resources[0] * self.factor > self.max_resources_:
+                candidate_params = [{**c, self.resource: self.max_resources_} for c in candidate_params]
+                more_results = {**more_results, 'n_resources': [self.max_resources_] * len(n_resources)}
+            return evaluate_candidates(candidate_params, cv, more_results=more_results, **evaluate_kwargs)
+
+        # scikit-learn passes callback_ctx only to searches that declare it (1.9+)
+        if callback_ctx is None:
+            super()._run_search(evaluate)
+        else:
+            super()._run_search(evaluate, callback_ctx=callback_ctx)
+        if self.resource != 'n_samples':
+            self.n_resources_ = [self.max_resources_ if n * self.factor > self.max_resources_ else n
+                                 for n in self.n_resources_]
+
+
+class _HalvingGridSearchCV(_LastRungAtMaxResources, HalvingGridSearchCV):
+    pass
+
+
+class _HalvingRandomSearchCV(_LastRungAtMaxResources, HalvingRandomSearchCV):
+    pass
+
+
+def halving_fits(n_candidates, n_splits, factor=3):
+    """Upper bound on the CV fits of successive halving over ``n_candidates`` configurations."""
+    fits = 0
+    for _ in range(1 + math.floor(math.log(n_candidates, factor))):
+        fits += n_candidates * n_splits
+        n_candidates = math.ceil(n_candidates / factor)
+    return fits
+
+
+def build_search(estimator, param_grid, cv, strategy='exhaustive', budget=None,
+                 resource='n_samples', n_jobs=-1, random_state=None, refit=True, queue=None,
+                 scoring='accuracy'):
+    """
+    Build a hyperparameter search object for the given strategy.
+
+    Args:
+        estimator: Scikit-learn model instance
+        param_grid: Dictionary of hyperparameters to search
+        cv: Cross-validation splitter
+        strategy: One of SEARCH_STRATEGIES
+        budget: SearchBudget for the sampled strategies and successive halving
+                (fit limit only)
+        resource: 'n_samples' or an estimator parameter such as 'n_estimators' or
+                  'max_iter' for successive halving
+        n_jobs: Parallel jobs for the CV fits
+        random_state: Seed for sampling
+        refit: Refit the best configuration on the data passed to fit()
+        queue: QueueConfig for the distributed strategy
+        scoring: Scorer name or callable (e.g. an OOF-recording accuracy scorer)
+
+    Returns:
+        search: Unfitted search object exposing best_params_/best_score_/best_estimator_
+    """
+    if strategy == 'exhaustive':
+        return GridSearchCV(estimator=estimator, param_grid=param_grid, cv=cv,
+                            scoring=scoring, n_jobs=n_jobs, refit=refit, verbose=0)
+
+    if strategy == 'halving':
+        grid = dict(param_grid)
+        max_resources = 'auto'
+        if resource != 'n_samples':
+            # The resource (n_estimators, max_iter) is grown by the search itself, so it leaves the grid
+            max_resources = max(grid.pop(resource, [estimator.get_params()[resource]]))
+        common = dict(estimator=estimator, cv=cv, scoring=scoring, factor=3, resource=resource,
+                      max_resources=max_resources, min_resources='exhaust', n_jobs=n_jobs,
+                      random_state=random_state, refit=refit, verbose=0)
+        n_candidates = len(ParameterGrid(grid))
+        max_fits = None
+        if budget is not None:
+            max_fits = budget.fit_limit(n_candidates, check_cv(cv).get_n_splits())
+        if max_fits is not None:
+            # The largest random subset of the grid whose whole halving schedule fits the budget
+            n_splits = check_cv(cv).get_n_splits()
+            subset = n_candidates
+            while subset > 1 and halving_fits(subset, n_splits) > max_fits:
+                subset -= 1
+            if subset < n_candidates:
+                return _HalvingRandomSearchCV(param_distributions=grid, n_candidates=subset, **common)
+        return _HalvingGridSearchCV(param_grid=grid, **common)
+
+    if strategy in ('random', 'adaptive'):
+        return BudgetedSearchCV(estimator=estimator, param_grid=param_grid, cv=cv,
+                                budget=budget or SearchBudget(), scoring=scoring,
+                                adaptive=strategy == 'adaptive', n_jobs=n_jobs, random_state=random_state, refit=refit)
+
+    if strategy == 'distributed':
+        if queue is None:
+            raise ValueError("The distributed search strategy needs a QueueConfig")
+        return DistributedSearchCV(estimator=estimator, param_grid=param_grid, cv=cv, queue=queue,
+                                   scoring=scoring, refit=refit)
+
+    raise ValueError(f"Unknown search strategy '{strategy}'. Choose from {SEARCH_STRATEGIES}")
+
+
+def count_fits(search, n_splits):
+    """Return the number of CV fits a fitted search performed."""
+    if hasattr(search, 'n_fits_'):
+        return search.n_fits_
+    return len(search.cv_results_['params']) * n_splits
+
+
+def count_pruned(search, n_configs):
+    """
+    Return the number of configurations a fitted search did not carry to the end.
+
+    For successive halving these are the candidates eliminated before the last
+    iteration; for sampled and budgeted searches, the grid points never evaluated.
+    """
+    if hasattr(search, 'n_candidates_'):
+        return int(search.n_candidates_[0] - search.n_candidates_[-1])
+    return max(n_configs - len(search.cv_results_['params']), 0)
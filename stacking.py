@@ -0,0 +1,267 @@
+"""
+Stacking and Voting Ensembles from Out-of-Fold Predictions
+==========================================================
+
+Builds ensembles of the models ``train_all_models`` selects without
+refitting them:
+
+- ``OOFCollector.scorer()`` is the scorer every hyperparameter search uses.
+  It scores accuracy as before and also saves the class probabilities of
+  each fold's best-scoring CV fits on the held-out rows, keyed by the
+  configuration and the fold's matrix. Scorers run inside the search's
+  worker processes (or on queue workers), so the probabilities go to a
+  shared directory.
+- After a search, ``OOFCollector.collect`` assembles the best
+  configuration's held-out probabilities into an out-of-fold matrix over
+  the training rows. Folds without saved probabilities (a configuration
+  outside that fold's leaders, or successive halving's subsampled rungs)
+  are fitted there.
+- ``build_ensembles`` trains a logistic-regression meta-learner on the
+  out-of-fold matrices (stacking) and averages the base probabilities
+  (soft voting). Both are validated from the base models' cached
+  validation predictions.
+
+``StackingEnsemble`` is a regular fitted classifier: it is exported in
+the model artifact like any other model and scores in row batches.
+"""
+
+import os
+import shutil
+import tempfile
+
+import joblib
+import numpy as np
+from scipy import sparse
+from sklearn.base import BaseEstimator, ClassifierMixin, clone
+from sklearn.utils import get_tags
+
+from evaluation import SplitPrediction
+
+# Parameters that change how a fit runs but not what it computes
+_EXECUTION_PARAMS = ('n_jobs', 'verbose')
+
+ENSEMBLE_METHODS = ('stacking', 'voting')
+
+ENSEMBLE_NAMES = {'stacking': "Stacking Ensemble", 'voting': "Soft Voting Ensemble"}
+
+
+def _atomic_dump(obj, path):
+    tmp = f"{path}.tmp-{os.getpid()}"
+    joblib.dump(obj, tmp)
+    os.replace(tmp, path)
+
+
+def _config_key(estimator):
+    """Hash of an estimator's class and hyperparameters (fitted or not)."""
+    params = {k: v for k, v in estimator.get_params(deep=True).items()
+              if k.split('__')[-1] not in _EXECUTION_PARAMS and not hasattr(v, 'get_params')}
+    return joblib.hash((type(estimator).__qualname__, params))
+
+
+def _dense_for(model, X):
+    """Densify sparse input for estimators without sparse support."""
+    if sparse.issparse(X) and not get_tags(model).input_tags.sparse:
+        return X.toarray()
+    return X
+
+
+class OOFRecorder:
+    """
+    Accuracy scorer that also saves the held-out class probabilities.
+
+    Only the ``keep`` best-scoring fits of each fold keep their
+    probabilities, so a search leaves at most ``keep`` files per fold rather
+    than one per configuration and fold. Picklable, so it runs in joblib and
+    work-queue workers alike.
+    """
+
+    def __init__(self, directory, keep=8):
+        self.directory = directory
+        self.keep = keep
+
+    def __call__(self, estimator, X, y):
+        if not hasattr(estimator, 'predict_proba'):
+            return float(np.mean(np.asarray(estimator.predict(X)) == np.asarray(y)))
+        classes, proba = np.asarray(estimator.classes_), estimator.predict_proba(X)
+        score = float(np.mean(classes[proba.argmax(axis=1)] == np.asarray(y)))
+        self._save(os.path.join(self.directory, joblib.hash(X)), _config_key(estimator),
+                   score, (classes, proba))
+        return score
+
+    def _save(self, fold_dir, key, score, value):
+        """Save a fold's probabilities if they rank among its ``keep`` best, dropping the rest."""
+        os.makedirs(fold_dir, exist_ok=True)
+        saved = [n for n in os.listdir(fold_dir) if n.endswith('.joblib')]
+        if any(n.endswith(f"-{key}.joblib") for n in saved):
+            return
+        # Names lead with 1 - score, so they sort best first
+        name = f"{1 - score:.6f}-{key}.joblib"
+        ranked = sorted(saved + [name])
+        if name not in ranked[:self.keep]:
+            return
+        _atomic_dump(value, os.path.join(fold_dir, name))
+        for stale in ranked[self.keep:]:
+            try:
+                os.remove(os.path.join(fold_dir, stale))
+            except FileNotFoundError:
+                pass
+
+
+class OOFCollector:
+    """
+    Out-of-fold probabilities of each model's selected configuration.
+
+    Args:
+        directory: Where scorers save held-out probabilities; must be visible
+                   to every search worker (default: a temporary directory).
+                   ``cleanup`` removes it.
+        keep: Fits per fold whose probabilities are kept (see ``OOFRecorder``)
+    """
+
+    def __init__(self, directory=None, keep=8):
+        self.directory = os.path.abspath(directory or tempfile.mkdtemp(prefix='oof-'))
+        os.makedirs(self.directory, exist_ok=True)
+        self.keep = keep
+        self.oof = {}
+        self.classes = {}
+
+    def scorer(self):
+        return OOFRecorder(self.directory, keep=self.keep)
+
+    def _load(self, fold_dir, key):
+        try:
+            names = os.listdir(fold_dir)
+        except FileNotFoundError:
+            return None
+        for name in names:
+            if name.endswith(f"-{key}.joblib"):
+                try:
+                    return joblib.load(os.path.join(fold_dir, name))
+                except FileNotFoundError:
+                    return None  # pruned by a better fit meanwhile
+        return None
+
+    def collect(self, model_name, estimator, params, X, y, cv, row_folds, n_rows, fit_params=None):
+        """
+        Assemble the out-of-fold probability matrix of one configuration.
+
+        Args:
+            estimator: Estimator the search cloned (as passed to the search)
+            params: The selected configuration (search ``best_params_``)
+            X, y, cv: The matrix, labels and splitter the search ran on
+            row_folds: For each CV fold, the training-set rows of its held-out part
+            n_rows: Number of training rows
+            fit_params: Sample-aligned fit parameters the search was given
+
+        Returns:
+            Number of folds that had to be fitted here (0 when every held-out
+            prediction came from the search)
+        """
+        if not hasattr(estimator, 'predict_proba'):
+            return 0
+        config = clone(estimator).set_params(**params)
+        key = _config_key(config)
+        y = np.asarray(y)
+        # Every class of the training labels, including ones a fold's fit never saw
+        classes = np.unique(y)
+        oof, n_fitted = np.zeros((n_rows, len(classes))), 0
+        for (train_idx, test_idx), rows in zip(cv.split(X, y), row_folds):
+            X_test = X[test_idx]
+            saved = self._load(os.path.join(self.directory, joblib.hash(X_test)), key)
+            if saved is not None:
+                fold_classes, proba = saved
+            else:
+                model = clone(config).fit(X[train_idx], y[train_idx],
+                                          **{k: np.asarray(v)[train_idx] for k, v in (fit_params or {}).items()})
+                fold_classes, proba = np.asarray(model.classes_), model.predict_proba(X_test)
+                n_fitted += 1
+            # A fold may lack a rare class; place its columns by label
+            oof[np.ix_(rows, np.searchsorted(classes, fold_classes))] = proba
+        self.oof[model_name], self.classes[model_name] = oof, classes
+        return n_fitted
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class StackingEnsemble(ClassifierMixin, BaseEstimator):
+    """
+    Fitted base models combined by a meta-learner or by averaging.
+
+    Args:
+        estimators: List of (name, fitted model), all taking the same features
+        final_estimator: Fitted meta-learner over the concatenated base
+                         probabilities, or None for soft voting
+        batch_size: Rows scored per batch
+    """
+
+    def __init__(self, estimators, final_estimator=None, batch_size=8192):
+        self.estimators = estimators
+        self.final_estimator = final_estimator
+        self.batch_size = batch_size
+
+    @property
+    def classes_(self):
+        return self.estimators[0][1].classes_
+
+    def __sklearn_tags__(self):
+        tags = super().__sklearn_tags__()
+        tags.input_tags.sparse = True  # densified per base model as needed
+        return tags
+
+    def combine(self, base_probas):
+        """Ensemble probabilities from the base models' probabilities."""
+        if self.final_estimator is None:
+            return np.mean(base_probas, axis=0)
+        return self.final_estimator.predict_proba(np.hstack(base_probas))
+
+    def predict_proba(self, X):
+        result = np.empty((X.shape[0], len(self.classes_)))
+        for start in range(0, X.shape[0], self.batch_size):
+            batch = X[start:start + self.batch_size]
+            result[start:start + self.batch_size] = self.combine(
+                [model.predict_proba(_dense_for(model, batch)) for _, model in self.estimators])
+        return result
+
+    def predict(self, X):
+        return np.asarray(self.classes_)[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def build_ensembles(models_dict, collector, y_train, X_val, y_val, predictions, random_state=None):
+    """
+    Stacking and soft-voting ensembles of the selected models, without refitting them.
+
+    Args:
+        models_dict: {model name: fitted model}
+        collector: OOFCollector filled by the searches
+        y_train, y_val: Training and validation targets
+        X_val: Validation features the cached predictions were made on
+        predictions: PredictionCache holding each model's validation predictions;
+                     the ensembles' validation predictions are added to it
+
+    Returns:
+        {ensemble name: (ensemble, validation accuracy)}; empty when fewer than
+        two models have out-of-fold probabilities over the same classes
+    """
+    from sklearn.linear_model import LogisticRegression
+
+    names = [name for name in models_dict if name in collector.oof]
+    if len(names) < 2 or any(not np.array_equal(collector.classes[n], collector.classes[names[0]])
+                             for n in names):
+        return {}
+    estimators = [(name, models_dict[name]) for name in names]
+    val_probas = [predictions.get(name, 'val', models_dict[name], X_val).proba for name in names]
+
+    meta = LogisticRegression(max_iter=1000, random_state=random_state)
+    meta.fit(np.hstack([collector.oof[name] for name in names]), np.asarray(y_train))
+
+    ensembles = {}
+    for method, final_estimator in (('stacking', meta), ('voting', None)):
+        ensemble = StackingEnsemble(estimators, final_estimator)
+        proba = ensemble.combine(val_probas)
+        classes = np.asarray(ensemble.classes_)
+        name = ENSEMBLE_NAMES[method]
+        prediction = SplitPrediction(classes[np.argmax(proba, axis=1)], proba, classes)
+        predictions.put(name, 'val', X_val, prediction)
+        ensembles[name] = (ensemble, float(np.mean(prediction.labels == np.asarray(y_val))))
+    return ensembles
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_validation import DEFAULT_RULES, Range, Validator, validate_csv
+from ingest import load_patient_data
+
+HEADER = 'Patient_ID,Age,Gender,Symptoms,Blood Pressure,Heart Rate,Temperature,Pre-Existing Conditions\n'
+
+
+def _count(report, name):
+    return int(report.counts[[rule.name for rule in report.rules].index(name)])
+
+
+@pytest.fixture
+def bad_csv(tmp_path):
+    path = tmp_path / 'patients.csv'
+    path.write_text(HEADER
+                    + 'P1,200,Male,Fever,120/80,72.5,37.0,Asthma\n'
+                    + 'P2,abc,Female,Cough,120/80,80,hot,\n'
+                    + 'P3,45,Male,Cough,120-80,99999,37.2,\n'
+                    + 'P4,,Female,Cough,120/80,,36.9,\n'
+                    + 'P5,30,Male,Fever,130/85,61,38.0,Diabetes\n')
+    return path
+
+
+@pytest.mark.parametrize('load', ['ingest', 'csv'])
+def test_unparseable_and_out_of_range_values_are_flagged(bad_csv, load):
+    if load == 'ingest':
+        df, profile = load_patient_data(bad_csv, chunksize=2)
+        report = profile.validation
+        # Coercion still ran: the typed frame holds missing values, not wrapped ones
+        assert df['Age'].isna().sum() == 3
+    else:
+        report = validate_csv(bad_csv, chunksize=2)
+
+    # 200 and 'abc' are range violations (seen before the Int8 cast), the blank is missing
+    assert _count(report, 'Age: outside [0, 120]') == 2
+    assert _count(report, 'Age: missing') == 1
+    assert _count(report, 'Heart Rate: outside [30, 220]') == 1
+    assert _count(report, 'Temperature: outside [34, 43]') == 1
+    assert _count(report, 'Blood Pressure: malformed') == 1
+    examples = dict(report.examples[[rule.name for rule in report.rules].index('Age: outside [0, 120]')])
+    assert examples == {0: '200', 1: 'abc'}
+    assert report.rows == 5
+    assert not report.ok
+
+
+def test_text_and_numeric_paths_agree():
+    raw = pd.DataFrame({'Age': ['5', '130', 'x', None, ' ']})
+    numeric = pd.DataFrame({'Age': pd.array([5, 130, None, None, None], dtype='Int16')})
+    validator = Validator([Range('Age', 0, 120)])
+    assert validator.mask(raw).tolist() == [0, 1, 1, 0, 0]
+    assert validator.mask(numeric).tolist() == [0, 1, 0, 0, 0]
+
+
+def test_mask_has_one_bit_per_rule():
+    validator = Validator(DEFAULT_RULES)
+    frame = pd.DataFrame({'Patient_ID': ['P1'], 'Age': ['abc']})
+    mask = validator.mask(frame)
+    bits = [i for i in range(len(DEFAULT_RULES)) if mask[0] >> np.uint32(i) & 1]
+    assert [DEFAULT_RULES[i].name for i in bits] == ['Age: outside [0, 120]']
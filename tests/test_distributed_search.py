@@ -0,0 +1,80 @@
+import os
+import time
+
+import numpy as np
+import pytest
+from sklearn.datasets import make_classification
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import GridSearchCV, StratifiedKFold
+
+from distributed_search import DistributedSearchCV, QueueConfig, WorkQueue
+
+GRID = {'C': [0.01, 0.1, 1.0, 10.0]}
+
+
+@pytest.fixture
+def data():
+    return make_classification(n_samples=200, n_features=6, random_state=0)
+
+
+def test_local_workers_match_grid_search(tmp_path, data):
+    X, y = data
+    cv = StratifiedKFold(3, shuffle=True, random_state=0)
+    queue = QueueConfig(str(tmp_path / 'queue'), local_workers=2, timeout=120)
+
+    search = DistributedSearchCV(LogisticRegression(), GRID, cv, queue).fit(X, y)
+    reference = GridSearchCV(LogisticRegression(), GRID, cv=cv, scoring='accuracy').fit(X, y)
+
+    np.testing.assert_allclose(search.cv_results_['mean_test_score'],
+                               reference.cv_results_['mean_test_score'])
+    assert search.best_params_ == reference.best_params_
+    assert 1 <= len(search.workers_) <= 2
+    # The queue is left empty for the next search
+    for sub in ('tasks', 'claimed', 'results', 'shared'):
+        assert os.listdir(tmp_path / 'queue' / sub) == []
+
+
+def test_fresh_claim_is_not_requeued(tmp_path, monkeypatch):
+    queue = WorkQueue(str(tmp_path))
+    queue.submit('s-00000-000', {'fold': 0})
+    # The task waited in the queue for longer than the lease
+    old = time.time() - 3600
+    os.utime(tmp_path / 'tasks' / 's-00000-000.task', (old, old))
+    rename, requeued = os.rename, []
+
+    def rename_then_requeue(src, dst):
+        # The coordinator sweeps stale claims right after the worker's rename
+        rename(src, dst)
+        requeued.append(queue.requeue_stale(lease_seconds=60))
+
+    monkeypatch.setattr(os, 'rename', rename_then_requeue)
+    task_id, task = queue.claim()
+
+    assert task_id == 's-00000-000' and task == {'fold': 0}
+    assert requeued == [0]
+    assert queue.counts() == (0, 1)
+
+
+def test_lost_claim_moves_on(tmp_path, monkeypatch):
+    queue = WorkQueue(str(tmp_path))
+    queue.submit('s-00000-000', {'fold': 0})
+    queue.submit('s-00000-001', {'fold': 1})
+    rename = os.rename
+
+    def steal_first(src, dst):
+        # Another worker renames the first task away between listdir and our rename
+        if src.endswith('s-00000-000.task'):
+            os.remove(src)
+        return rename(src, dst)
+
+    monkeypatch.setattr(os, 'rename', steal_first)
+    assert queue.claim()[0] == 's-00000-001'
+
+
+def test_search_without_workers_fails_instead_of_hanging(tmp_path, data):
+    X, y = data
+    queue = QueueConfig(str(tmp_path / 'queue'), local_workers=0, idle_timeout=0.5)
+    search = DistributedSearchCV(LogisticRegression(), GRID, StratifiedKFold(3), queue)
+
+    with pytest.raises(TimeoutError, match="no task claimed"):
+        search.fit(X, y)
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.pipeline import Pipeline
+
+from feature_attribution import Explainer, TreePathAttribution, feature_groups, feature_map, tree_path_importance
+from feature_cache import NativeCategoricals
+from train_erm_model import create_preprocessing_pipeline
+
+
+@pytest.fixture
+def hgb_pipeline():
+    rng = np.random.default_rng(0)
+    n = 300
+    df = pd.DataFrame({
+        'Age': rng.integers(18, 90, n).astype(float),
+        'Heart Rate': rng.normal(80, 10, n),
+        'Gender': rng.choice(['Male', 'Female'], n),
+        'Blood Type': rng.choice(['A', 'B', 'O', None], n),
+    })
+    y = np.where((df['Age'] > 60) ^ (df['Gender'] == 'Male'), 'High', 'Low').astype(object)
+    y[df['Blood Type'] == 'O'] = 'Medium'
+    pre = create_preprocessing_pipeline(df, ['Age', 'Heart Rate'], ['Gender', 'Blood Type'], verbose=False)
+    X = pre.fit_transform(df)
+    categoricals = NativeCategoricals(pre).fit()
+    hgb = HistGradientBoostingClassifier(max_iter=20, random_state=0,
+                                         categorical_features=categoricals.categorical_mask_)
+    model = Pipeline([('categoricals', categoricals), ('hgb', hgb)]).fit(X, y)
+    return model, pre, X
+
+
+def test_contributions_are_in_the_encoded_space(hgb_pipeline):
+    model, _, X = hgb_pipeline
+    bias, contributions = TreePathAttribution(model).contributions(X[:20])
+
+    assert contributions.shape[:2] == (20, X.shape[1])
+    np.testing.assert_allclose(bias + contributions.sum(axis=1), model.decision_function(X[:20]), atol=1e-8)
+
+
+def test_hgb_pipeline_importance_and_explanations(hgb_pipeline):
+    model, pre, X = hgb_pipeline
+    features = feature_map(pre)[1]
+
+    table = tree_path_importance(model, X, feature_groups(features))
+    assert set(table.index) == {'Age', 'Heart Rate', 'Gender', 'Blood Type'}
+    assert table.loc['Blood Type', 'importance'] > 0
+
+    label, top = Explainer(model, features, background=X.mean(axis=0)).explain_one(X[0])
+    assert label == model.predict(X[:1])[0]
+    assert {name for name, _ in top} <= set(features)
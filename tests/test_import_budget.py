@@ -0,0 +1,15 @@
+import pytest
+
+from import_budget import DEFAULT_BUDGET_MS, DEFAULT_MODULES, measure_import
+
+STAGE_ONLY = ('matplotlib', 'seaborn', 'xgboost')
+
+
+@pytest.mark.parametrize('module', DEFAULT_MODULES)
+def test_entry_module_imports_within_budget(module):
+    # Best of three cold starts, as the CLI measures it
+    seconds, entries = min((measure_import(module) for _ in range(3)), key=lambda run: run[0])
+    imported = {name for name, *_ in entries}
+
+    assert seconds * 1000 <= DEFAULT_BUDGET_MS
+    assert not imported & set(STAGE_ONLY)
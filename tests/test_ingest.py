@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+
+from ingest import concat_chunks, iter_patient_chunks, load_patient_data
+
+HEADER = 'Patient_ID,Age,Gender,Symptoms,Blood Pressure,Heart Rate,Temperature,Pre-Existing Conditions\n'
+
+
+@pytest.fixture
+def bad_csv(tmp_path):
+    path = tmp_path / 'patients.csv'
+    path.write_text(HEADER
+                    + 'P1,200,Male,Fever,120/80,72.5,37.0,Asthma\n'
+                    + 'P2,abc,Female,Cough,120/80,80,37.1,\n'
+                    + 'P3,45,Male,Cough,120/80,99999,37.2,\n'
+                    + 'P4,,Female,Cough,120/80,,36.9,\n'
+                    + 'P5,-3,Male,Fever,130/85,61,38.0,Diabetes\n')
+    return path
+
+
+def test_integer_vitals_are_coerced_not_wrapped(bad_csv):
+    df = concat_chunks(iter_patient_chunks(bad_csv))
+
+    assert str(df['Age'].dtype) == 'Int8'
+    assert str(df['Heart Rate'].dtype) == 'Int16'
+    # 200 does not fit Int8 and 'abc' does not parse: both missing, never -56
+    assert df['Age'].isna().tolist() == [True, True, False, True, False]
+    assert df['Age'].iloc[2] == 45
+    assert df['Age'].iloc[4] == -3
+    # Fractional values are rounded, values beyond Int16 become missing
+    assert df['Heart Rate'].iloc[0] == 72
+    assert pd.isna(df['Heart Rate'].iloc[2])
+
+
+def test_small_chunks_match_one_chunk(bad_csv):
+    whole, _ = load_patient_data(bad_csv)
+    chunked, _ = load_patient_data(bad_csv, chunksize=2)
+    pd.testing.assert_frame_equal(whole, chunked)
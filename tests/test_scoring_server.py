@@ -0,0 +1,63 @@
+import asyncio
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LogisticRegression
+
+from clinical_features import FEATURES_VERSION, engineer_clinical_features
+from model_artifact import export_artifact
+from predict import Predictor
+from scoring_server import ScoringServer, normalize_record
+from train_erm_model import create_preprocessing_pipeline
+
+DATASET = Path(__file__).resolve().parent.parent / 'patient_dataset_5000_realistic.csv'
+COLUMNS = ['Age', 'Gender', 'Symptoms', 'Blood Pressure', 'Heart Rate', 'Temperature']
+
+
+@pytest.fixture(scope='module')
+def predictor(tmp_path_factory):
+    target = 'Pre-Existing Conditions'
+    df = pd.read_csv(DATASET, nrows=600).dropna(subset=[target])
+    engineered = engineer_clinical_features(df[COLUMNS])
+    numerical = [c for c in engineered.columns if pd.api.types.is_numeric_dtype(engineered[c])]
+    categorical = [c for c in engineered.columns if c not in numerical]
+    pre = create_preprocessing_pipeline(engineered, numerical, categorical, verbose=False)
+    model = LogisticRegression(max_iter=500).fit(pre.fit_transform(engineered), df[target])
+    path = tmp_path_factory.mktemp('artifact') / 'model.joblib'
+    export_artifact(str(path), pre, model, 'Logistic Regression', target, COLUMNS,
+                    numerical, categorical, FEATURES_VERSION)
+    return Predictor(str(path))
+
+
+def score(server, payload):
+    async def run():
+        server.batcher.start()
+        try:
+            return await server._score(json.dumps(payload).encode())
+        finally:
+            await server.batcher.stop()
+    return asyncio.run(run())
+
+
+@pytest.mark.skipif(not DATASET.exists(), reason="dataset CSV not available")
+def test_partial_record_scores_the_same_alone_and_batched(predictor):
+    complete = {'Age': 54, 'Gender': 'Female', 'Symptoms': ['Fever', 'Cough'],
+                'Blood Pressure': '130/85', 'Heart Rate': 88, 'Temperature': 38.2}
+    partial = {'Age': 61, 'Gender': 'Male', 'Temperature': 37.1}
+
+    status, alone = score(ScoringServer(predictor), partial)
+    assert status == 200
+    status, batched = score(ScoringServer(predictor), [complete, partial])
+    assert status == 200
+    assert alone['prediction'] == batched[1]['prediction']
+    np.testing.assert_allclose(list(alone['probabilities'].values()),
+                               list(batched[1]['probabilities'].values()))
+
+
+def test_normalize_record_rejects_booleans_and_fills_columns():
+    with pytest.raises(ValueError, match="'Age'"):
+        normalize_record({'Age': True})
+    assert normalize_record({'Age': 40, 'Extra': 'x'}, ['Age', 'Gender']) == {'Age': 40, 'Gender': None}
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from sklearn.datasets import make_classification
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+from sklearn.model_selection import StratifiedKFold
+
+from search_strategies import SearchBudget, build_search, count_fits
+
+
+@pytest.fixture
+def data():
+    return make_classification(n_samples=200, n_features=6, random_state=0)
+
+
+def test_halving_resource_ends_on_the_grid_maximum(data):
+    X, y = data
+    grid = {'max_iter': [10, 20], 'max_depth': [2, 3], 'learning_rate': [0.1, 0.3]}
+    search = build_search(HistGradientBoostingClassifier(early_stopping=False, random_state=0), grid,
+                          StratifiedKFold(3), strategy='halving', resource='max_iter').fit(X, y)
+
+    assert search.best_params_['max_iter'] == 20
+    assert search.best_estimator_.max_iter == 20
+    assert search.n_resources_[-1] == 20
+
+
+def test_halving_honours_the_fit_budget(data):
+    X, y = data
+    grid = {'n_estimators': [5, 10], 'max_depth': [2, 3, 4, None], 'min_samples_leaf': [1, 2, 4]}
+    cv = StratifiedKFold(3)
+    search = build_search(RandomForestClassifier(random_state=0), grid, cv, strategy='halving',
+                          resource='n_estimators', budget=SearchBudget(max_fits=15), random_state=0).fit(X, y)
+
+    assert count_fits(search, 3) <= 15
+    assert search.best_params_['n_estimators'] == 10
+    assert np.isfinite(search.best_score_)
@@ -0,0 +1,31 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ingest import iter_patient_chunks
+from triage_rules import check_parity, main, score_triage
+
+DATASET = Path(__file__).resolve().parent.parent / 'patient_dataset_5000_realistic.csv'
+
+
+@pytest.mark.skipif(not DATASET.exists(), reason="dataset CSV not available")
+def test_vectorized_scores_match_reference_on_dataset():
+    df = next(iter_patient_chunks(DATASET, 2000))
+    assert check_parity(df) == []
+
+
+def test_check_cli_passes(tmp_path):
+    path = tmp_path / 'patients.csv'
+    path.write_text('Patient_ID,Symptoms,Blood Pressure,Heart Rate,Temperature,Insurance Provider\n'
+                    'P1,"Chest pain, Cough",170/95,120,39.0,Acme\n'
+                    'P2,Headache,85/60,45,35.5,\n'
+                    'P3,Rash,120/80,72,37.0,Acme\n')
+    assert main([str(path), '--check']) == 0
+
+
+def test_empty_insurance_provider_is_uninsured():
+    df = pd.DataFrame({'Insurance Provider': ['Acme', '', None, np.nan]})
+    assert score_triage(df)['financial_risk_score'].tolist() == [20, 85, 85, 85]
+    assert check_parity(df) == []
@@ -11,36 +11,87 @@ Date: 2026-02-15
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.model_selection import train_test_split, GridSearchCV, StratifiedKFold
+from sklearn.model_selection import train_test_split, StratifiedKFold, ParameterGrid
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.impute import SimpleImputer
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
-from sklearn.linear_model import LogisticRegression
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import (accuracy_score, classification_report, confusion_matrix,
-                             precision_score, recall_score, f1_score)
+from sklearn.base import clone
+from sklearn.utils import get_tags
+from scipy import sparse
+from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+import argparse
+import contextlib
+import functools
+import os
+import re
+import uuid
+from collections import Counter
+from dataclasses import dataclass
 import warnings
 warnings.filterwarnings('ignore')
 
-# Try to import XGBoost, fall back to Gradient Boosting if not available
-try:
-    from xgboost import XGBClassifier
-    XGBOOST_AVAILABLE = True
-except ImportError:
-    from sklearn.ensemble import GradientBoostingClassifier
-    XGBOOST_AVAILABLE = False
-    print("Note: XGBoost not available, using sklearn's GradientBoostingClassifier instead")
+from search_strategies import SEARCH_STRATEGIES, SearchBudget, build_search, count_fits, count_pruned
+from distributed_search import QueueConfig, local_worker_pool
+from result_store import (PARAM_PREFIX, RESULT_STORE_DIR, ResultStore, StoredFit, prefix_params,
+                          unprefix_params)
+from parallelism import BACKENDS, CpuMeter, ParallelismPlanner
+from feature_cache import FoldFeatureCache, FoldMatrix, NativeCategoricals
+from ingest import load_patient_data
+from dataset_cache import (cached_patient_data, cached_profile, cached_table, combine_digests, extend_cached_data,
+                           extend_cached_table, record_source_blocks, source_blocks)
+from clinical_features import FEATURES_VERSION, engineer_clinical_features
+from model_artifact import DEFAULT_ARTIFACT_PATH, export_artifact, load_artifact
+from ingest import concat_chunks, iter_appended_chunks
+from out_of_core import (OOC_DIR, OOC_MODELS, FeatureBinner, bin_edges, fit_hist_gb, fit_sgd,
+                         iter_engineered_chunks, select_features, streamed_accuracy, write_splits)
+from incremental import (SPLIT_CODES, PreprocessorStats, assign_splits, continue_training,
+                         find_appended_rows, incremental_method, load_manifest, rebase_model,
+                         split_assignments, write_manifest)
+import instrumentation
+from evaluation import (PredictionCache, confusion, probability_metrics, render_plots,
+                        report_from_confusion, wait_for_plots)
+from stacking import OOFCollector, build_ensembles
+from sample_tuning import make_tuning_sample, rank_agreement, ranked_configs, top_k_grid
+from feature_attribution import (TreePathAttribution, feature_groups, feature_map, importance_key,
+                                 permutation_importance, save_importance, tree_path_importance)
 
 # Set random seed for reproducibility
 RANDOM_STATE = 42
 np.random.seed(RANDOM_STATE)
 
-# Visualization setup
-sns.set_style("whitegrid")
-plt.rcParams['figure.figsize'] = (10, 6)
+# Cross-validation folds shared by every search
+CV_FOLDS = 5
+
+# Validation accuracy the pipeline aims for
+TARGET_ACCURACY = 0.85
+
+# Previous validation/test rows sampled to score an incremental update
+INCREMENTAL_EVAL_ROWS = 20_000
+
+# Targets the front end asks for that the dataset does not record: outputs of
+# the rule-based triage scorer (triage_rules.score_triage column per target).
+# They are deterministic functions of the patient features, so a model would
+# only replicate the rule; they are served by the scorer and never trained
+DERIVED_TARGETS = {'Risk Level': 'risk_level', 'Department': 'primary_department'}
+
+# --targets front-end: risk level, department and comorbidity
+FRONT_END_TARGETS = ['Risk Level', 'Department', 'Pre-Existing Conditions']
+
+# Estimators, XGBoost and the plotting stack are imported by the stages that
+# use them, so runs that only load data or update a model start quickly
+# (see import_budget.py).
+
+
+@functools.cache
+def xgboost_classifier():
+    """Return XGBClassifier, or None (with a note) when XGBoost is not installed."""
+    try:
+        from xgboost import XGBClassifier
+    except ImportError:
+        print("Note: XGBoost not available, using sklearn's HistGradientBoostingClassifier instead")
+        return None
+    return XGBClassifier
 
 
 def print_section(title):
@@ -50,18 +101,25 @@ def print_section(title):
     print("=" * 80)
 
 
-def load_and_explore_data(filepath):
+def load_and_explore_data(filepath, use_cache=True):
     """
     Load the dataset and perform initial exploration.
     
+    Args:
+        filepath: Patient CSV path
+        use_cache: Serve the parsed columns from the memory-mapped dataset cache
+    
     Returns:
         df: Loaded DataFrame
         target_col: Name of the target column
     """
     print_section("STEP 1: DATA LOADING & EXPLORATION")
     
-    # Load data
-    df = pd.read_csv(filepath)
+    # Load data (typed schema, chunked) and profile it in the same pass
+    if use_cache:
+        df, profile = cached_patient_data(filepath)
+    else:
+        df, profile = load_patient_data(filepath)
     print(f"\n✓ Loaded dataset: {df.shape[0]} rows × {df.shape[1]} columns")
     
     # Display basic info
@@ -69,42 +127,150 @@ def load_and_explore_data(filepath):
     print(f"\nData types:\n{df.dtypes}")
     
     # Check missing values
-    missing = df.isnull().sum()
+    missing = profile.missing()
     if missing.sum() > 0:
         print(f"\nMissing values found:")
         print(missing[missing > 0])
     else:
         print("\n✓ No missing values detected")
     
+    # The data-quality rules ran in the same pass as the profile
+    if profile.validation.ok:
+        print(f"✓ Data quality: all {profile.rows} rows pass the validation rules")
+    else:
+        print(f"\n⚠ Data quality: {profile.validation.format()}")
+    
     # Display sample
     print(f"\nSample data (first 3 rows):")
     print(df.head(3).to_string())
     
     # Identify target column
+    target_col = identify_target_column(profile, df.columns)
+    
+    return df, target_col
+
+
+def identify_target_column(profile, columns):
+    """
+    Pick the target: the last non-ID column with 2-10 distinct values.
+    
+    Args:
+        profile: StreamingProfile of the dataset
+        columns: Dataset columns in file order
+    
+    Returns:
+        target_col: Name of the target column
+    """
     print("\n\nAnalyzing columns to identify target...")
     target_col = None
-    for col in df.columns:
+    for col in columns:
         if col not in ['Patient_ID', 'patient_id', 'ID', 'id']:
-            n_unique = df[col].nunique()
+            n_unique = profile[col].n_unique
             if 2 <= n_unique <= 10:  # Likely categorical target
                 print(f"\n  Candidate: {col}")
                 print(f"    - Unique values: {n_unique}")
-                print(f"    - Distribution:\n{df[col].value_counts()}")
+                print(f"    - Distribution:\n{profile[col].value_counts()}")
                 
                 # Use the last categorical column as target (common convention)
                 target_col = col
     
     if target_col is None:
         # If no clear target found, use the last column (common convention)
-        target_col = df.columns[-1]
+        target_col = columns[-1]
         print(f"\n⚠ No clear categorical target found. Using last column: {target_col}")
     else:
         print(f"\n✓ Identified target column: '{target_col}'")
     
-    return df, target_col
+    return target_col
+
+
+def resolve_targets(spec, columns, default_target):
+    """
+    Target columns of a run.
+    
+    Args:
+        spec: None (the identified target only), 'front-end' (FRONT_END_TARGETS)
+              or comma-separated column names; DERIVED_TARGETS names are allowed
+        columns: Dataset columns
+        default_target: Target picked by identify_target_column
+    
+    Returns:
+        List of distinct target names, the default target first when included
+    """
+    if spec is None:
+        return [default_target]
+    names = FRONT_END_TARGETS if spec == 'front-end' else [n.strip() for n in spec.split(',') if n.strip()]
+    unknown = [n for n in names if n not in columns and n not in DERIVED_TARGETS]
+    if unknown:
+        raise ValueError(f"Unknown target column(s) {unknown}. Choose dataset columns or "
+                         f"{list(DERIVED_TARGETS)}")
+    return sorted(dict.fromkeys(names), key=lambda name: name != default_target)
+
+
+def rule_targets(targets, columns):
+    """
+    Requested DERIVED_TARGETS the dataset does not label: served by the
+    triage rules, not trained.
+    """
+    return [t for t in targets if t in DERIVED_TARGETS and t not in columns]
+
+
+def group_targets(df, targets):
+    """
+    Group targets labelled on exactly the same rows.
+    
+    Targets of a group share one train/validation/test split, one fitted
+    preprocessor and one CV fold cache.
+    
+    Returns:
+        List of target lists, in ``targets`` order
+    """
+    groups = []
+    for target in targets:
+        labelled = df[target].notna().to_numpy()
+        for mask, members in groups:
+            if np.array_equal(mask, labelled):
+                members.append(target)
+                break
+        else:
+            groups.append((labelled, [target]))
+    return [members for _, members in groups]
+
+
+def joint_strata(df, targets, min_count=CV_FOLDS):
+    """
+    Stratification labels of a group of targets: their joint label.
+    
+    Label combinations with fewer than ``min_count`` rows fall back to the
+    first target's label, so every stratum can still be spread over the CV
+    folds. A single target is stratified on itself.
+    """
+    if len(targets) == 1:
+        return df[targets[0]]
+    first = df[targets[0]].astype(str)
+    joint = first
+    for target in targets[1:]:
+        joint = joint + ' | ' + df[target].astype(str)
+    counts = joint.map(joint.value_counts())
+    return joint.where(counts >= min_count, first)
+
+
+def target_artifact_path(artifact_path, target_col, default_target):
+    """Artifact of one target: ``artifact_path`` for the default target, else suffixed by the target."""
+    if target_col == default_target:
+        return artifact_path
+    root, ext = os.path.splitext(artifact_path)
+    slug = re.sub(r'[^0-9a-z]+', '_', target_col.lower()).strip('_')
+    return f"{root}.{slug}{ext}"
 
 
-def create_preprocessing_pipeline(X_train, numerical_features, categorical_features):
+def make_cv():
+    """Return the stratified K-fold splitter used by every hyperparameter search."""
+    return StratifiedKFold(n_splits=CV_FOLDS, shuffle=True, random_state=RANDOM_STATE)
+
+
+def create_preprocessing_pipeline(X_train, numerical_features, categorical_features,
+                                  sparse_output=False, verbose=True):
     """
     Create a preprocessing pipeline with no data leakage.
     
@@ -112,14 +278,16 @@ def create_preprocessing_pipeline(X_train, numerical_features, categorical_featu
         X_train: Training features
         numerical_features: List of numerical column names
         categorical_features: List of categorical column names
+        sparse_output: Emit a CSR matrix instead of a dense array
+        verbose: Print the pipeline banner and feature lists
     
     Returns:
         preprocessor: Fitted ColumnTransformer
     """
-    print_section("STEP 2: PREPROCESSING PIPELINE")
-    
-    print(f"\nNumerical features ({len(numerical_features)}): {numerical_features}")
-    print(f"Categorical features ({len(categorical_features)}): {categorical_features}")
+    if verbose:
+        print_section("STEP 2: PREPROCESSING PIPELINE")
+        print(f"\nNumerical features ({len(numerical_features)}): {numerical_features}")
+        print(f"Categorical features ({len(categorical_features)}): {categorical_features}")
     
     # Create transformers for different feature types
     numerical_transformer = Pipeline(steps=[
@@ -129,35 +297,66 @@ def create_preprocessing_pipeline(X_train, numerical_features, categorical_featu
     
     categorical_transformer = Pipeline(steps=[
         ('imputer', SimpleImputer(strategy='constant', fill_value='unknown')),
-        ('onehot', OneHotEncoder(handle_unknown='ignore', sparse_output=False))
+        ('onehot', OneHotEncoder(handle_unknown='ignore', sparse_output=sparse_output))
     ])
     
-    # Combine transformers
+    # Combine transformers (sparse_threshold=1.0 keeps the stacked output CSR in sparse mode)
     preprocessor = ColumnTransformer(
         transformers=[
             ('num', numerical_transformer, numerical_features),
             ('cat', categorical_transformer, categorical_features)
-        ])
+        ],
+        sparse_threshold=1.0 if sparse_output else 0.0)
     
-    print("\n✓ Preprocessing pipeline created:")
-    print("  - Numerical: Median imputation → StandardScaler")
-    print("  - Categorical: 'unknown' imputation → One-hot encoding")
-    print("  - ⚡ No data leakage: fit only on training data")
+    if verbose:
+        print("\n✓ Preprocessing pipeline created:")
+        print("  - Numerical: Median imputation → StandardScaler")
+        print("  - Categorical: 'unknown' imputation → One-hot encoding"
+              + (" (sparse CSR)" if sparse_output else ""))
+        print("  - ⚡ No data leakage: fit only on training data")
     
     return preprocessor
 
 
-def split_data(df, target_col, test_size=0.15, val_size=0.15):
+def matrix_footprint(X):
+    """
+    Return (density, bytes) of a dense array or sparse matrix.
+    
+    Density is the fraction of stored non-zero entries.
+    """
+    n_cells = max(X.shape[0] * X.shape[1], 1)
+    if sparse.issparse(X):
+        nbytes = X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+        return X.nnz / n_cells, nbytes
+    return np.count_nonzero(X) / n_cells, X.nbytes
+
+
+def ensure_supported_input(model, X):
+    """Densify a sparse matrix (or fold matrix) for estimators that cannot consume sparse input."""
+    if get_tags(model).input_tags.sparse:
+        return X
+    if isinstance(X, FoldMatrix):
+        return X.densified()
+    if sparse.issparse(X):
+        return X.toarray()
+    return X
+
+
+def split_data(df, target_col, test_size=0.15, val_size=0.15, drop=(), strata=None):
     """
     Split data into train/validation/test sets with stratification.
     
+    Args:
+        drop: Other target columns, excluded from the features
+        strata: Labels to stratify on, indexed like ``df`` (default: the target)
+    
     Returns:
         X_train, X_val, X_test, y_train, y_val, y_test
     """
     print_section("STEP 3: TRAIN/VALIDATION/TEST SPLIT")
     
     # Separate features and target
-    X = df.drop(columns=[target_col])
+    X = df.drop(columns=[target_col, *drop])
     y = df[target_col]
     
     # Remove ID columns from features
@@ -174,7 +373,8 @@ def split_data(df, target_col, test_size=0.15, val_size=0.15):
         y = y[valid_indices]
     
     # Check if stratification is possible
-    stratify = y if y.nunique() < len(y) else None
+    strata = y if strata is None else strata.loc[y.index]
+    stratify = strata if strata.nunique() < len(strata) else None
     
     # First split: separate test set
     X_temp, X_test, y_temp, y_test = train_test_split(
@@ -183,7 +383,7 @@ def split_data(df, target_col, test_size=0.15, val_size=0.15):
     
     # Second split: separate train and validation
     val_ratio = val_size / (1 - test_size)
-    stratify_temp = y_temp if stratify is not None else None
+    stratify_temp = strata.loc[y_temp.index] if stratify is not None else None
     X_train, X_val, y_train, y_val = train_test_split(
         X_temp, y_temp, test_size=val_ratio, random_state=RANDOM_STATE, stratify=stratify_temp
     )
@@ -202,7 +402,45 @@ def split_data(df, target_col, test_size=0.15, val_size=0.15):
     return X_train, X_val, X_test, y_train, y_val, y_test
 
 
-def train_model_with_erm(model, X_train, y_train, X_val, y_val, param_grid, model_name):
+def identify_feature_types(X_train, X_val, X_test):
+    """
+    Split feature columns into numerical and categorical by content, not just dtype.
+    
+    String columns that fully parse as numbers are coerced to numeric in all
+    three splits (in place).
+    
+    Returns:
+        numerical_features, categorical_features: Lists of column names
+    """
+    numerical_features = []
+    categorical_features = []
+    
+    for col in X_train.columns:
+        # Typed numeric columns (ingest schema, engineered features) need no parse check
+        if pd.api.types.is_numeric_dtype(X_train[col].dtype):
+            numerical_features.append(col)
+            continue
+        # Try to convert to numeric
+        try:
+            # Check if the column can be converted to numeric
+            converted = pd.to_numeric(X_train[col], errors='raise')
+        except (ValueError, TypeError):
+            # Cannot convert to numeric, so it's categorical
+            categorical_features.append(col)
+            continue
+        # String column that can be converted to numeric
+        X_train[col] = converted
+        X_val[col] = pd.to_numeric(X_val[col], errors='coerce')
+        X_test[col] = pd.to_numeric(X_test[col], errors='coerce')
+        numerical_features.append(col)
+    
+    return numerical_features, categorical_features
+
+
+def train_model_with_erm(model, X_train, y_train, X_val, y_val, param_grid, model_name,
+                         search='exhaustive', budget=None, resource='n_samples', planner=None,
+                         fold_cache=None, queue=None, store=None, predictions=None, oof=None,
+                         tuning=None, preprocessor=None):
     """
     Train a model using Empirical Risk Minimization with hyperparameter tuning.
     
@@ -212,6 +450,19 @@ def train_model_with_erm(model, X_train, y_train, X_val, y_val, param_grid, mode
         X_val, y_val: Validation data
         param_grid: Dictionary of hyperparameters to search
         model_name: Name for logging
+        search: Search strategy ('exhaustive', 'halving', 'random', 'adaptive', 'distributed')
+        budget: SearchBudget limiting fits / wall-clock for sampled strategies
+        resource: Resource grown by successive halving ('n_samples', 'n_estimators' or 'max_iter')
+        fold_cache: FoldFeatureCache of preprocessed CV folds
+        queue: QueueConfig of the work queue used by the distributed strategy
+        store: ResultStore; CV cells already stored are reused instead of refitted
+        predictions: PredictionCache receiving the train/validation predictions
+        oof: OOFCollector; the CV fits' held-out probabilities of the best
+             configuration are kept for the ensemble stage
+        tuning: TuningSample; the search explores on the sample and only its
+                top configurations are scored on the full training data
+        preprocessor: Fitted preprocessor that produced X_train / X_val; gives
+                      histogram boosting its native categorical layout
     
     Returns:
         best_model: Trained model with best hyperparameters
@@ -228,73 +479,286 @@ def train_model_with_erm(model, X_train, y_train, X_val, y_val, param_grid, mode
     else:
         print(f"Loss function: Log loss (cross-entropy) for classification")
     
-    # Perform grid search with cross-validation
-    cv = StratifiedKFold(n_splits=5, shuffle=True, random_state=RANDOM_STATE)
-    grid_search = GridSearchCV(
-        estimator=model,
-        param_grid=param_grid,
-        cv=cv,
-        scoring='accuracy',
-        n_jobs=-1,
-        verbose=0
-    )
+    # The caller's matrices identify the cached train/validation predictions
+    # (X_train / X_val may be re-encoded or densified below)
+    sources = {'train': X_train, 'val': X_val}
+    
+    # Perform hyperparameter search with cross-validation
+    if fold_cache is not None:
+        cv, X_search, y_search = fold_cache.cv, fold_cache.X, fold_cache.y
+    else:
+        cv, X_search, y_search = make_cv(), X_train, y_train
+    
+    # Histogram boosting bins its input itself on every fit, so it gets the
+    # preprocessed features unbinned, with each one-hot block folded back into
+    # a native categorical column (missing / unseen categories as NaN). The
+    # fold matrices use each fold's own preprocessor layout.
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    
+    categoricals = None
+    if isinstance(model, HistGradientBoostingClassifier):
+        if preprocessor is not None:
+            categoricals = NativeCategoricals(preprocessor).fit()
+            if fold_cache is not None:
+                fold_cache = fold_cache.with_step(NativeCategoricals())
+                X_search, y_search = fold_cache.X, fold_cache.y
+            X_train, X_val = categoricals.transform(X_train), categoricals.transform(X_val)
+            model = clone(model).set_params(categorical_features=categoricals.categorical_mask_)
+            print(f"Input: {len(categoricals.numeric_)} numeric + {len(categoricals.blocks_)} native "
+                  f"categorical features (missing values passed through), binned by the model per fit")
+    
+    # The tuning sample gets the same categorical layout as the full-data folds
+    if tuning is not None:
+        if tuning.fold_cache is not None:
+            sample_cache = tuning.fold_cache
+            if categoricals is not None:
+                sample_cache = sample_cache.with_step(NativeCategoricals())
+            sample_cv, X_sample, y_sample = sample_cache.cv, sample_cache.X, sample_cache.y
+        else:
+            sample_cv, X_sample, y_sample = make_cv(), X_train[tuning.rows], np.asarray(y_train)[tuning.rows]
+    
+    # Estimators without sparse support get a dense copy of the CSR matrices
+    dense_search = ensure_supported_input(model, X_search)
+    if dense_search is not X_search:
+        print(f"Input: densifying sparse features ({model.__class__.__name__} needs dense input)")
+    X_search = dense_search
+    X_train = ensure_supported_input(model, X_train)
+    X_val = ensure_supported_input(model, X_val)
+    if tuning is not None:
+        X_sample = ensure_supported_input(model, X_sample)
+    
+    # Split the core budget between CV workers and the estimator's own threads
+    planner = planner or ParallelismPlanner()
+    n_configs = len(ParameterGrid(param_grid))
+    plan = planner.plan(n_configs * cv.get_n_splits())
+    if 'n_jobs' in model.get_params():
+        # On a copy: the caller's estimator keeps its own setting
+        model = clone(model).set_params(n_jobs=plan.inner_threads)
+    
+    # Route every CV fit through the result store, so finished cells survive a crash;
+    # each search matrix is hashed once and its folds are keyed by row positions
+    search_model, search_grid, search_resource = model, param_grid, resource
+    fit_params, sample_fit_params = {}, {}
+    if store is not None:
+        search_key = store.data_key(X_search, y_search)
+        search_model = StoredFit(model, store, data_key=search_key,
+                                 run=f"{model_name}-{uuid.uuid4().hex[:8]}".replace(' ', '_'))
+        search_grid = prefix_params(param_grid)
+        if resource != 'n_samples':
+            search_resource = PARAM_PREFIX + resource
+        fit_params = {'row_ids': np.arange(len(y_search))}
+        if tuning is not None:
+            sample_key = store.data_key(X_sample, y_sample)
+            sample_fit_params = {'row_ids': np.arange(len(y_sample))}
     
     print(f"\nHyperparameter search space: {param_grid}")
-    print(f"Cross-validation: 5-fold stratified")
+    print(f"Search strategy: {search}" + (f" (resource: {resource})" if search == 'halving' else ""))
+    if budget is not None and search in ('halving', 'random', 'adaptive'):
+        limits = [f"{budget.max_fits} CV fits" if budget.max_fits is not None else None,
+                  f"{budget.max_seconds:g}s" if budget.max_seconds is not None and search != 'halving' else None]
+        print(f"Search budget: {', '.join(l for l in limits if l) or f'{budget.max_share:.0%} of the grid'}")
+    print(f"Cross-validation: {cv.get_n_splits()}-fold stratified"
+          + (" (per-fold preprocessing cache)" if fold_cache is not None else ""))
+    if search == 'distributed':
+        print(f"Parallelism: work queue {queue.directory} "
+              f"({queue.local_workers} local worker(s) + any remote workers)")
+    else:
+        print(f"Parallelism: {plan.describe()}")
+    
+    metrics = instrumentation.get()
+    
+    # Explore on the sample, then score only its best configurations on full data
+    full_search, full_grid = search, search_grid
+    if tuning is not None:
+        sample_search = build_search(
+            search_model, search_grid, sample_cv, strategy=search, budget=budget,
+            resource=search_resource, n_jobs=plan.outer_jobs, random_state=RANDOM_STATE,
+            refit=False, queue=queue
+        )
+        print(f"Tuning sample: {len(tuning.rows)} of {len(y_train)} training rows explore the grid, "
+              + ("then the full search runs too (verification)" if tuning.verify else
+                 f"then the top {tuning.top_k} configurations are scored on every row"))
+        with metrics.span('search', model=model_name, strategy=search, stage='sample'):
+            with plan.activate(), CpuMeter(plan.cores) as sample_meter:
+                if store is not None:
+                    search_model.set_params(data_key=sample_key)
+                sample_search.fit(X_sample, y_sample, **sample_fit_params)
+                if store is not None:
+                    search_model.set_params(data_key=search_key)
+        n_sample_fits = count_fits(sample_search, sample_cv.get_n_splits())
+        sample_ranked = ranked_configs(sample_search, resource)
+        if not tuning.verify:
+            full_search, full_grid = ('distributed' if search == 'distributed' else 'exhaustive',
+                                      top_k_grid(sample_ranked, tuning.top_k))
+            plan = planner.plan(min(tuning.top_k, len(sample_ranked)) * cv.get_n_splits())
+            if 'n_jobs' in model.get_params():
+                # A copy: the estimator may be the caller's
+                model = clone(model).set_params(n_jobs=plan.inner_threads)
+                if store is not None:
+                    search_model.set_params(estimator=model)
+                else:
+                    search_model = model
+    
+    grid_search = build_search(
+        search_model, full_grid, cv,
+        strategy=full_search,
+        budget=budget,
+        resource=search_resource,
+        n_jobs=plan.outer_jobs,
+        random_state=RANDOM_STATE,
+        refit=fold_cache is None and store is None,
+        queue=queue,
+        scoring=oof.scorer() if oof is not None else 'accuracy'
+    )
     
     # Train
-    grid_search.fit(X_train, y_train)
+    with metrics.span('search', model=model_name, strategy=full_search):
+        with plan.activate(), CpuMeter(plan.cores) as meter:
+            grid_search.fit(X_search, y_search, **fit_params)
+    reuse = store.pop_tally(search_model.run) if store is not None else None
+    n_fits = count_fits(grid_search, cv.get_n_splits())
+    n_pruned = count_pruned(grid_search if full_search == search else sample_search, n_configs)
+    best_params = unprefix_params(grid_search.best_params_)
+    
+    agreement = None
+    if tuning is not None:
+        agreement = rank_agreement(sample_ranked, ranked_configs(grid_search, resource))
+        metrics.event('sample_tuning', model=model_name, sample_rows=len(tuning.rows),
+                      sample_fits=n_sample_fits, full_fits=n_fits, verify=tuning.verify, **agreement)
+    
+    # Held-out probabilities the CV fits already produced, for stacking
+    n_oof_fits = 0
+    if oof is not None:
+        if fold_cache is not None:
+            row_folds = [test for _, test in fold_cache.raw_splits]
+        else:
+            row_folds = [test for _, test in cv.split(np.zeros(len(y_train)), y_train)]
+        n_oof_fits = oof.collect(model_name, search_model, grid_search.best_params_,
+                                 X_search, np.asarray(y_search), cv, row_folds, len(y_train),
+                                 fit_params=fit_params)
+    
+    if metrics.enabled:
+        metrics.count('fits_total', n_fits, model=model_name)
+        metrics.count('configs_pruned_total', n_pruned, model=model_name)
+        record_cv_fits(metrics, grid_search, model_name, cv.get_n_splits())
     
     # Get best model
-    best_model = grid_search.best_estimator_
+    if fold_cache is not None or store is not None:
+        best_model = clone(model).set_params(**best_params)
+        with metrics.span('refit', model=model_name), plan.activate():
+            best_model.fit(X_train, y_train)
+    else:
+        best_model = grid_search.best_estimator_
     
-    # Evaluate on training and validation sets
-    train_pred = best_model.predict(X_train)
-    val_pred = best_model.predict(X_val)
+    # Evaluate on training and validation sets (cached for the evaluation stage)
+    if predictions is None:
+        predictions = PredictionCache()
+    fitted = predictions.get_many(model_name, best_model, {'train': X_train, 'val': X_val}, sources)
     
-    train_acc = accuracy_score(y_train, train_pred)
-    val_acc = accuracy_score(y_val, val_pred)
+    train_acc = accuracy_score(y_train, fitted['train'].labels)
+    val_acc = accuracy_score(y_val, fitted['val'].labels)
     
     print(f"\n✓ Training completed!")
-    print(f"  Best hyperparameters: {grid_search.best_params_}")
+    print(f"  Best hyperparameters: {best_params}")
     print(f"  Training accuracy:    {train_acc:.4f} ({train_acc*100:.2f}%)")
     print(f"  Validation accuracy:  {val_acc:.4f} ({val_acc*100:.2f}%)")
     print(f"  Best CV score:        {grid_search.best_score_:.4f}")
+    print(f"  CV fits performed:    {n_fits}" + (f" ({n_pruned} configs pruned)" if n_pruned else ""))
+    if agreement is not None:
+        print(f"  Sample tuning:        {n_sample_fits} CV fits on {len(tuning.rows)} rows "
+              f"in {sample_meter.wall:.1f}s, then {n_fits} on full data")
+        best_rank = agreement['best_sample_rank']
+        best = (f"full-data best ranked #{best_rank} on the sample" if best_rank else
+                "full-data best not evaluated on the sample")
+        if np.isnan(agreement['spearman']):
+            # Too few configurations re-scored for a rank correlation to mean anything
+            print(f"  Sample ranking:       {best} (top {agreement['n_configs']} re-scored; "
+                  f"use --verify-sample for rank agreement over the grid)")
+        else:
+            print(f"  Rank agreement:       Spearman {agreement['spearman']:.2f}, "
+                  f"Kendall {agreement['kendall']:.2f} over {agreement['n_configs']} config(s); {best}")
+    if oof is not None and model_name in oof.oof:
+        print(f"  Out-of-fold probs:    kept for stacking"
+              + (f" ({n_oof_fits} fold(s) refitted on full data)" if n_oof_fits else " (no extra fits)"))
+    if reuse is not None:
+        print(f"  Result store:         {reuse['reused']} of {reuse['reused'] + reuse['computed']} "
+              f"CV fits reused, {reuse['computed']} computed")
+    print(f"  Search wall time:     {meter.wall:.1f}s "
+          f"({meter.wall * plan.outer_jobs / max(n_fits, 1):.2f}s per fit per worker)")
+    if search == 'distributed':
+        print(f"  Workers:              {len(grid_search.workers_)} ({', '.join(grid_search.workers_)})")
+    else:
+        print(f"  CPU utilisation:      {meter.utilisation*100:.0f}% of {plan.cores} cores")
+    
+    if categoricals is not None:
+        # Callers pass the preprocessed (one-hot) features
+        best_model = Pipeline([('categoricals', categoricals), ('hgb', best_model)])
     
     return best_model, val_acc
 
 
-def train_all_models(X_train, y_train, X_val, y_val):
+def record_cv_fits(metrics, search, model_name, n_splits):
     """
-    Train multiple models and compare their performance.
+    Emit one 'cv_fit' event per evaluated configuration of a fitted search.
     
-    Returns:
-        models_dict: Dictionary of trained models
-        results_df: DataFrame with comparison results
+    scikit-learn only keeps fit times aggregated over the folds of a
+    configuration, so each event carries the mean/std fit and score time.
     """
-    print_section("STEP 4: ERM-BASED MODEL TRAINING")
-    
-    models_dict = {}
-    results = []
-    
-    # Check for class imbalance
-    class_counts = pd.Series(y_train).value_counts()
+    results = search.cv_results_
+    optional = ['mean_fit_time', 'std_fit_time', 'mean_score_time', 'iter', 'n_resources']
+    for i, params in enumerate(results['params']):
+        fields = {key: results[key][i].item() for key in optional if key in results}
+        metrics.event('cv_fit', model=model_name, params=unprefix_params(params), n_splits=n_splits,
+                      mean_test_score=float(results['mean_test_score'][i]), **fields)
+
+
+# Search strategy per model: (strategy, halving resource)
+DEFAULT_SEARCH_STRATEGIES = {
+    'Logistic Regression': ('exhaustive', 'n_samples'),
+    'Random Forest': ('halving', 'n_estimators'),
+    'Histogram Gradient Boosting': ('halving', 'max_iter'),
+    'XGBoost': ('halving', 'n_estimators'),
+}
+
+
+def detect_class_weight(y_train, verbose=True):
+    """Return 'balanced' when the majority/minority class ratio exceeds 2, else None."""
+    return class_weight_from_counts(pd.Series(y_train).value_counts(), verbose)
+
+
+def class_weight_from_counts(class_counts, verbose=True):
+    """``detect_class_weight`` for precomputed class counts (a Series indexed by class)."""
+    class_counts = class_counts[class_counts > 0]
     imbalance_ratio = class_counts.max() / class_counts.min()
     
     if imbalance_ratio > 2:
-        print(f"\n⚠ Class imbalance detected (ratio: {imbalance_ratio:.2f})")
-        print(f"  Using class_weight='balanced' for applicable models")
-        class_weight = 'balanced'
-    else:
-        class_weight = None
+        if verbose:
+            print(f"\n⚠ Class imbalance detected (ratio: {imbalance_ratio:.2f})")
+            print(f"  Using class_weight='balanced' for applicable models")
+        return 'balanced'
+    return None
+
+
+def build_model_specs(y_train, class_weight=None):
+    """
+    Build the candidate models and their hyperparameter grids.
+    
+    Args:
+        y_train: Training target (used for XGBoost's scale_pos_weight)
+        class_weight: None or 'balanced'
+    
+    Returns:
+        specs: List of (title, model_name, model, param_grid) in training order
+    """
+    from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    
+    XGBClassifier = xgboost_classifier()
+    specs = []
     
     # ========================================
     # Model 1: Logistic Regression (Baseline)
     # ========================================
-    print("\n" + "=" * 80)
-    print("MODEL 1: LOGISTIC REGRESSION (Baseline)")
-    print("=" * 80)
-    
     lr_model = LogisticRegression(
         max_iter=1000,
         random_state=RANDOM_STATE,
@@ -305,24 +769,14 @@ def train_all_models(X_train, y_train, X_val, y_val):
         'C': [0.01, 0.1, 1, 10, 100],  # Regularization strength
         'solver': ['lbfgs', 'saga']
     }
-    
-    lr_best, lr_acc = train_model_with_erm(
-        lr_model, X_train, y_train, X_val, y_val, lr_params, "Logistic Regression"
-    )
-    models_dict['Logistic Regression'] = lr_best
-    results.append({'Model': 'Logistic Regression', 'Validation Accuracy': lr_acc})
+    specs.append(("MODEL 1: LOGISTIC REGRESSION (Baseline)", "Logistic Regression", lr_model, lr_params))
     
     # ========================================
     # Model 2: Random Forest
     # ========================================
-    print("\n" + "=" * 80)
-    print("MODEL 2: RANDOM FOREST")
-    print("=" * 80)
-    
     rf_model = RandomForestClassifier(
         random_state=RANDOM_STATE,
-        class_weight=class_weight,
-        n_jobs=-1
+        class_weight=class_weight
     )
     
     rf_params = {
@@ -331,24 +785,12 @@ def train_all_models(X_train, y_train, X_val, y_val):
         'min_samples_split': [2, 5],
         'min_samples_leaf': [1, 2]
     }
-    
-    rf_best, rf_acc = train_model_with_erm(
-        rf_model, X_train, y_train, X_val, y_val, rf_params, "Random Forest"
-    )
-    models_dict['Random Forest'] = rf_best
-    results.append({'Model': 'Random Forest', 'Validation Accuracy': rf_acc})
+    specs.append(("MODEL 2: RANDOM FOREST", "Random Forest", rf_model, rf_params))
     
     # ========================================
-    # Model 3: XGBoost / Gradient Boosting
+    # Model 3: XGBoost / Histogram Gradient Boosting
     # ========================================
-    print("\n" + "=" * 80)
-    if XGBOOST_AVAILABLE:
-        print("MODEL 3: XGBOOST")
-    else:
-        print("MODEL 3: GRADIENT BOOSTING")
-    print("=" * 80)
-    
-    if XGBOOST_AVAILABLE:
+    if XGBClassifier is not None:
         # Calculate scale_pos_weight for imbalanced classes
         if class_weight == 'balanced':
             scale_pos_weight = (y_train.value_counts()[0] / y_train.value_counts()[1] 
@@ -362,7 +804,6 @@ def train_all_models(X_train, y_train, X_val, y_val):
             use_label_encoder=False,
             eval_metric='logloss'
         )
-        
         gb_params = {
             'n_estimators': [100, 200],
             'max_depth': [3, 5, 7],
@@ -370,23 +811,77 @@ def train_all_models(X_train, y_train, X_val, y_val):
             'subsample': [0.8, 1.0]
         }
     else:
-        gb_model = GradientBoostingClassifier(
-            random_state=RANDOM_STATE
+        # Multithreaded histogram boosting with native categorical splits (see
+        # NativeCategoricals). max_iter is the halving resource, max_features
+        # stands in for XGBoost's subsample (feature rather than row subsampling).
+        gb_model = HistGradientBoostingClassifier(
+            random_state=RANDOM_STATE,
+            early_stopping=False,
+            class_weight=class_weight
         )
-        
         gb_params = {
-            'n_estimators': [100, 200],
+            'max_iter': [100, 200],
             'max_depth': [3, 5, 7],
             'learning_rate': [0.01, 0.1, 0.3],
-            'subsample': [0.8, 1.0]
+            'max_features': [0.8, 1.0]
         }
+    model_name = "XGBoost" if XGBClassifier is not None else "Histogram Gradient Boosting"
+    specs.append((f"MODEL 3: {model_name.upper()}", model_name, gb_model, gb_params))
     
-    model_name = "XGBoost" if XGBOOST_AVAILABLE else "Gradient Boosting"
-    gb_best, gb_acc = train_model_with_erm(
-        gb_model, X_train, y_train, X_val, y_val, gb_params, model_name
-    )
-    models_dict[model_name] = gb_best
-    results.append({'Model': model_name, 'Validation Accuracy': gb_acc})
+    return specs
+
+
+def train_all_models(X_train, y_train, X_val, y_val, search_strategies=None, budget=None,
+                     planner=None, fold_cache=None, queue=None, store=None, predictions=None,
+                     oof=None, tuning=None, preprocessor=None):
+    """
+    Train multiple models and compare their performance.
+    
+    Args:
+        X_train, y_train: Training data
+        X_val, y_val: Validation data
+        search_strategies: Optional {model_name: (strategy, resource)} overrides
+                           of DEFAULT_SEARCH_STRATEGIES
+        budget: SearchBudget shared by the sampled search strategies
+        planner: ParallelismPlanner owning the core budget for all searches
+        fold_cache: FoldFeatureCache shared by every model's search
+        queue: QueueConfig; when given, every model uses the distributed search
+        store: ResultStore shared by every model's search
+        predictions: PredictionCache receiving every model's train/validation predictions
+        oof: OOFCollector keeping every model's out-of-fold probabilities
+        tuning: TuningSample every model's search explores on
+        preprocessor: Fitted preprocessor that produced X_train / X_val
+    
+    Returns:
+        models_dict: Dictionary of trained models
+        results_df: DataFrame with comparison results
+    """
+    print_section("STEP 4: ERM-BASED MODEL TRAINING")
+    
+    models_dict = {}
+    results = []
+    strategies = {**DEFAULT_SEARCH_STRATEGIES, **(search_strategies or {})}
+    if queue is not None:
+        strategies = {name: ('distributed', 'n_samples') for name in strategies}
+    planner = planner or ParallelismPlanner()
+    
+    # Check for class imbalance
+    class_weight = detect_class_weight(y_train)
+    
+    for title, model_name, model, param_grid in build_model_specs(y_train, class_weight):
+        print("\n" + "=" * 80)
+        print(title)
+        print("=" * 80)
+        
+        search, resource = strategies[model_name]
+        best_model, val_acc = train_model_with_erm(
+            model, X_train, y_train, X_val, y_val, param_grid, model_name,
+            search=search, budget=budget, resource=resource, planner=planner,
+            fold_cache=fold_cache, queue=queue, store=store, predictions=predictions, oof=oof,
+            tuning=tuning, preprocessor=preprocessor
+        )
+        models_dict[model_name] = best_model
+        results.append({'Model': model_name, 'Validation Accuracy': val_acc})
     
     # Create results DataFrame
     results_df = pd.DataFrame(results).sort_values('Validation Accuracy', ascending=False)
@@ -394,30 +889,122 @@ def train_all_models(X_train, y_train, X_val, y_val):
     return models_dict, results_df
 
 
+def train_ensembles(models_dict, results_df, oof, y_train, X_val, y_val, predictions):
+    """
+    Add stacking and soft-voting ensembles of the trained models.
+    
+    The meta-learner is trained on the out-of-fold probabilities the CV fits
+    produced and validated on the cached validation predictions, so no base
+    model is refitted or re-run.
+    
+    Returns:
+        models_dict, results_df including the ensembles
+    """
+    print_section("STEP 4b: ENSEMBLES FROM OUT-OF-FOLD PREDICTIONS")
+    
+    ensembles = build_ensembles(models_dict, oof, y_train, X_val, y_val, predictions,
+                                random_state=RANDOM_STATE)
+    if not ensembles:
+        print("\n⚠ Ensembles skipped: fewer than two models with out-of-fold probabilities")
+        return models_dict, results_df
+    
+    members = ', '.join(name for name, _ in next(iter(ensembles.values()))[0].estimators)
+    print(f"\nBase models: {members}")
+    print(f"Meta-learner: logistic regression on {len(y_train)} out-of-fold probability rows")
+    rows = []
+    for name, (ensemble, val_acc) in ensembles.items():
+        models_dict[name] = ensemble
+        rows.append({'Model': name, 'Validation Accuracy': val_acc})
+        print(f"  {name:24s} validation accuracy: {val_acc:.4f} ({val_acc*100:.2f}%)")
+    
+    results_df = pd.concat([results_df, pd.DataFrame(rows)], ignore_index=True)
+    return models_dict, results_df.sort_values('Validation Accuracy', ascending=False)
+
+
+def report_attribution(model, X, y, encoded_features):
+    """
+    Print permutation importance (and tree-path attribution for tree models)
+    per patient column.
+    
+    Returns:
+        {cache key: importance table}, for save_importance
+    """
+    print(f"\n{'─' * 80}")
+    print("Feature Attribution (validation set, per patient column):")
+    print(f"{'─' * 80}")
+    
+    groups = feature_groups(encoded_features, level='raw')
+    tables = {}
+    params = {'n_repeats': 5}
+    table = permutation_importance(model, X, y, groups, random_state=RANDOM_STATE, **params)
+    tables[importance_key('permutation', X, y, **params)] = table
+    columns = {'importance': 'Accuracy drop', 'std': '± std'}
+    
+    if TreePathAttribution.supports(model):
+        path_table = tree_path_importance(model, X, groups)
+        tables[importance_key('tree_path', X, y)] = path_table
+        table = table.join(path_table.rename(columns={'importance': 'tree_path'}))
+        columns['tree_path'] = 'Mean |path contribution|'
+    
+    widths = {c: len(label) + 4 for c, label in columns.items()}
+    print(f"\n  {'Column':20s}" + ''.join(f"{label:>{widths[c]}s}" for c, label in columns.items()))
+    for column, row in table.iterrows():
+        print(f"  {column:20s}" + ''.join(f"{row[c]:{widths[c]}.4f}" for c in columns))
+    return tables
+
+
 def evaluate_best_model(best_model, model_name, X_train, X_val, X_test, 
-                       y_train, y_val, y_test, feature_names):
+                       y_train, y_val, y_test, feature_names, predictions=None, plots='background',
+                       preprocessor=None, plot_suffix=''):
     """
     Comprehensive evaluation of the best model on test set.
+    
+    All metrics come from one batched prediction pass per split; splits
+    already predicted during model selection are taken from ``predictions``.
+    
+    Args:
+        predictions: PredictionCache shared with train_all_models
+        plots: 'background' (render on a worker thread; see wait_for_plots),
+               'sync' or 'off'
+        preprocessor: Fitted ColumnTransformer; names the encoded columns and
+                      maps attributions back to the patient columns
+        plot_suffix: Appended to the PNG names (one set of plots per target)
+    
+    Returns:
+        evaluation: Dict of accuracies and, for probabilistic models, log loss
+                    and Brier score per split; with a preprocessor, 'importance'
+                    holds {cache key: table} for the model artifact
     """
     print_section("STEP 5: FINAL MODEL EVALUATION")
     
     print(f"\n🏆 Best Model: {model_name}")
     print(f"{'─' * 80}")
     
-    # Predictions
-    train_pred = best_model.predict(X_train)
-    val_pred = best_model.predict(X_val)
-    test_pred = best_model.predict(X_test)
-    
-    # Accuracies
-    train_acc = accuracy_score(y_train, train_pred)
-    val_acc = accuracy_score(y_val, val_pred)
-    test_acc = accuracy_score(y_test, test_pred)
+    # Predictions (one predict_proba per split, missing splits in parallel)
+    if predictions is None:
+        predictions = PredictionCache()
+    splits = {'train': (X_train, y_train), 'val': (X_val, y_val), 'test': (X_test, y_test)}
+    predicted = predictions.get_many(
+        model_name, best_model, {name: ensure_supported_input(best_model, X) for name, (X, _) in splits.items()},
+        sources={name: X for name, (X, _) in splits.items()})
+    
+    # Accuracies and probability metrics
+    evaluation = {}
+    for name, (_, y) in splits.items():
+        evaluation[f"{name}_accuracy"] = accuracy_score(y, predicted[name].labels)
+        for metric, value in probability_metrics(y, predicted[name]).items():
+            evaluation[f"{name}_{metric}"] = value
+    train_acc, val_acc, test_acc = (evaluation[f"{name}_accuracy"] for name in splits)
     
     print(f"\nAccuracy Summary:")
     print(f"  Training:   {train_acc:.4f} ({train_acc*100:.2f}%)")
     print(f"  Validation: {val_acc:.4f} ({val_acc*100:.2f}%)")
     print(f"  Test:       {test_acc:.4f} ({test_acc*100:.2f}%)")
+    if 'test_log_loss' in evaluation:
+        print(f"\nProbability Metrics (lower is better):")
+        print(f"  {'':12s}{'Log loss':>10s}{'Brier':>10s}")
+        for name, label in (('train', 'Training'), ('val', 'Validation'), ('test', 'Test')):
+            print(f"  {label + ':':12s}{evaluation[f'{name}_log_loss']:10.4f}{evaluation[f'{name}_brier']:10.4f}")
     
     # Check for overfitting/underfitting
     if train_acc - test_acc > 0.1:
@@ -431,25 +1018,19 @@ def evaluate_best_model(best_model, model_name, X_train, X_val, X_test,
     print(f"\n{'─' * 80}")
     print("Classification Report (Test Set):")
     print(f"{'─' * 80}")
-    print(classification_report(y_test, test_pred))
+    # Confusion Matrix (one pass; the report is derived from it)
+    cm, labels = confusion(y_test, predicted['test'].labels)
+    print(report_from_confusion(cm, labels))
     
-    # Confusion Matrix
-    cm = confusion_matrix(y_test, test_pred)
     print(f"\nConfusion Matrix (Test Set):")
     print(cm)
     
     # Visualize confusion matrix
-    plt.figure(figsize=(8, 6))
-    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', 
-                xticklabels=np.unique(y_test),
-                yticklabels=np.unique(y_test))
-    plt.title(f'Confusion Matrix - {model_name}')
-    plt.ylabel('True Label')
-    plt.xlabel('Predicted Label')
-    plt.tight_layout()
-    plt.savefig('confusion_matrix.png', dpi=150, bbox_inches='tight')
-    print("\n✓ Confusion matrix saved to: confusion_matrix.png")
-    plt.close()
+    plot_jobs = [('plot_confusion_matrix', (cm, labels, model_name, f'confusion_matrix{plot_suffix}.png'))]
+    
+    # Name the one-hot expanded columns ('Gender=Male') instead of the raw feature list
+    if preprocessor is not None:
+        feature_names, encoded_features = feature_map(preprocessor)
     
     # Feature importance (if available)
     if hasattr(best_model, 'feature_importances_'):
@@ -474,18 +1055,8 @@ def evaluate_best_model(best_model, model_name, X_train, X_val, X_test,
             print(f"  {i:2d}. {feat:30s} {imp:.4f}")
         
         # Plot feature importance
-        plt.figure(figsize=(10, 6))
-        features_to_plot = [f[0] for f in top_features]
-        importances_to_plot = [f[1] for f in top_features]
-        
-        plt.barh(range(len(features_to_plot)), importances_to_plot)
-        plt.yticks(range(len(features_to_plot)), features_to_plot)
-        plt.xlabel('Importance')
-        plt.title(f'Top 15 Feature Importances - {model_name}')
-        plt.tight_layout()
-        plt.savefig('feature_importance.png', dpi=150, bbox_inches='tight')
-        print("\n✓ Feature importance plot saved to: feature_importance.png")
-        plt.close()
+        plot_jobs.append(('plot_feature_importance',
+                          (top_features, model_name, f'feature_importance{plot_suffix}.png')))
     
     elif hasattr(best_model, 'coef_'):
         print(f"\n{'─' * 80}")
@@ -507,75 +1078,177 @@ def evaluate_best_model(best_model, model_name, X_train, X_val, X_test,
         for i, (feat, coef) in enumerate(top_features, 1):
             print(f"  {i:2d}. {feat:30s} {coef:+.4f}")
     
-    return test_acc
+    # Model-agnostic attribution on the validation set, per patient column
+    if preprocessor is not None:
+        evaluation['importance'] = report_attribution(best_model, X_val, y_val, encoded_features)
+    
+    if plots == 'off':
+        print("\n✓ Plots skipped (--no-plots)")
+    elif plots == 'background':
+        render_plots(plot_jobs, background=True)
+        print(f"\n✓ Rendering {len(plot_jobs)} plot(s) in the background")
+    else:
+        for path in render_plots(plot_jobs, background=False):
+            print(f"\n✓ Plot saved to: {path}")
+    
+    return evaluation
 
 
-def main():
-    """Main execution function."""
+@dataclass
+class SharedFeatures:
+    """Split, fitted preprocessor and CV fold cache shared by a group of targets."""
+    X_train: pd.DataFrame
+    X_val: pd.DataFrame
+    X_test: pd.DataFrame
+    numerical_features: list
+    categorical_features: list
+    preprocessor: ColumnTransformer
+    X_train_processed: object
+    X_val_processed: object
+    X_test_processed: object
+    fold_cache: FoldFeatureCache
+
+
+def prepare_features(df, group, other_targets, sparse_output=False, metrics=None):
+    """
+    Split, preprocess and build the CV fold cache for one group of targets.
     
-    print("\n")
-    print("╔" + "═" * 78 + "╗")
-    print("║" + " " * 78 + "║")
-    print("║" + "  Empirical Risk Minimization (ERM) Machine Learning Pipeline".center(78) + "║")
-    print("║" + "  Target: ~85% Validation Accuracy".center(78) + "║")
-    print("║" + " " * 78 + "║")
-    print("╚" + "═" * 78 + "╝")
+    Args:
+        group: Targets labelled on the same rows; the split and the CV folds
+               are stratified on their joint label (see ``joint_strata``)
+        other_targets: Every other target of the run, excluded from the features
     
-    # ========================================
-    # 1. Load and explore data
-    # ========================================
-    df, target_col = load_and_explore_data('patient_dataset_5000_realistic.csv')
+    Returns:
+        SharedFeatures
+    """
+    metrics = metrics or instrumentation.get()
+    target_col = group[0]
+    strata = joint_strata(df, group)
+    if len(group) > 1:
+        print(f"\n✓ Split and CV folds stratified on the joint label of {group} "
+              f"({strata.nunique()} strata)")
     
     # ========================================
     # 2. Split data
     # ========================================
-    X_train, X_val, X_test, y_train, y_val, y_test = split_data(df, target_col)
+    with metrics.span('stage', stage='split', target=target_col):
+        X_train, X_val, X_test, y_train, y_val, y_test = split_data(
+            df, target_col, drop=[t for t in group[1:] + list(other_targets) if t != target_col],
+            strata=strata)
     
     # ========================================
     # 3. Identify feature types
     # ========================================
     # Important: Detect feature types AFTER removing ID columns
     # and check actual content, not just dtype
-    numerical_features = []
-    categorical_features = []
-    
-    for col in X_train.columns:
-        # Try to convert to numeric
-        try:
-            # Check if the column can be converted to numeric
-            pd.to_numeric(X_train[col], errors='raise')
-            # If successful and not all same value, it's numerical
-            if X_train[col].dtype in ['int64', 'float64'] or X_train[col].dtype.name.startswith('int') or X_train[col].dtype.name.startswith('float'):
-                numerical_features.append(col)
-            else:
-                # String column that can be converted to numeric
-                X_train[col] = pd.to_numeric(X_train[col], errors='coerce')
-                X_val[col] = pd.to_numeric(X_val[col], errors='coerce')
-                X_test[col] = pd.to_numeric(X_test[col], errors='coerce')
-                numerical_features.append(col)
-        except (ValueError, TypeError):
-            # Cannot convert to numeric, so it's categorical
-            categorical_features.append(col)
+    numerical_features, categorical_features = identify_feature_types(X_train, X_val, X_test)
     
     # ========================================
     # 4. Create and fit preprocessing pipeline
     # ========================================
-    preprocessor = create_preprocessing_pipeline(X_train, numerical_features, categorical_features)
+    preprocessor = create_preprocessing_pipeline(X_train, numerical_features, categorical_features,
+                                                 sparse_output=sparse_output)
     
     # Fit and transform
-    X_train_processed = preprocessor.fit_transform(X_train)
-    X_val_processed = preprocessor.transform(X_val)
-    X_test_processed = preprocessor.transform(X_test)
+    with metrics.span('stage', stage='preprocess', target=target_col):
+        X_train_processed = preprocessor.fit_transform(X_train)
+        X_val_processed = preprocessor.transform(X_val)
+        X_test_processed = preprocessor.transform(X_test)
     
     print(f"\n✓ Preprocessing completed")
     print(f"  - Training features shape: {X_train_processed.shape}")
+    density, nbytes = matrix_footprint(X_train_processed)
+    layout = "sparse CSR" if sparse.issparse(X_train_processed) else "dense"
+    print(f"  - Matrix layout: {layout}, density {density*100:.2f}%, "
+          f"{nbytes / 1024**2:.2f} MB (dense equivalent: "
+          f"{X_train_processed.shape[0] * X_train_processed.shape[1] * 8 / 1024**2:.2f} MB)")
+    
+    # Per-fold preprocessing for CV: fit on each fold's training rows, shared by all searches
+    fold_cache = FoldFeatureCache(preprocessor, X_train, y_train, make_cv(),
+                                  strata=strata.loc[X_train.index])
+    with metrics.span('stage', stage='fold_cache', target=target_col):
+        fold_cache.build()
+    print(f"  - CV fold cache: {fold_cache.cv.get_n_splits()} fold preprocessors fitted "
+          f"in {fold_cache.build_seconds:.2f}s (no leakage across folds); fold matrices "
+          f"transformed on demand, one fold of {len(y_train)} × {fold_cache.X.shape[1]} held at a time")
+    
+    return SharedFeatures(X_train, X_val, X_test, numerical_features, categorical_features,
+                          preprocessor, X_train_processed, X_val_processed, X_test_processed,
+                          fold_cache)
+
+
+def search_overrides(strategy):
+    """{model_name: (strategy, resource)} running every model with ``strategy`` (None: the defaults)."""
+    if strategy is None:
+        return None
+    return {name: (strategy, resource) for name, (_, resource) in DEFAULT_SEARCH_STRATEGIES.items()}
+
+
+def search_budget(args):
+    """SearchBudget from --max-fits / --max-seconds (None when neither is given)."""
+    if args.max_fits is None and args.max_seconds is None:
+        return None
+    return SearchBudget(max_fits=args.max_fits, max_seconds=args.max_seconds)
+
+
+def train_target(df, target_col, features, fold_cache, args, metrics, data_path, raw_columns,
+                 artifact_path, planner, queue=None, store=None, plot_suffix=''):
+    """
+    Train, compare, evaluate and export the models of one target.
+    
+    Args:
+        df: Engineered patient DataFrame holding every target column
+        features: SharedFeatures of the target's group
+        fold_cache: The group's fold cache, labelled with this target
+        artifact_path: Where to export this target's best model
+        planner, queue, store: Shared by every target of the run
+        plot_suffix: Appended to this target's PNG names
+    
+    Returns:
+        Summary dict: target, model, accuracies, probability metrics and artifact
+    """
+    y_train, y_val, y_test = (df.loc[X.index, target_col]
+                              for X in (features.X_train, features.X_val, features.X_test))
+    X_train_processed = features.X_train_processed
+    X_val_processed = features.X_val_processed
+    X_test_processed = features.X_test_processed
     
     # ========================================
     # 5. Train models using ERM
     # ========================================
-    models_dict, results_df = train_all_models(
-        X_train_processed, y_train, X_val_processed, y_val
-    )
+    # Train/validation predictions made during selection are reused by the evaluation
+    predictions = PredictionCache()
+    # Out-of-fold probabilities go where every search worker can write them;
+    # one directory per target, since the targets' folds share feature matrices
+    oof = None
+    if not args.no_ensemble:
+        directory = None
+        if queue is not None:
+            directory = os.path.join(queue.directory, f"oof-{os.path.basename(artifact_path)}")
+        oof = OOFCollector(directory)
+    # Hyperparameters are explored on a stratified sample (target × Gender × age band)
+    tuning = None
+    if args.tune_sample:
+        tuning = make_tuning_sample(features.X_train, y_train, args.tune_sample, make_cv(),
+                                    preprocessor=features.preprocessor, top_k=args.tune_top_k,
+                                    verify=args.verify_sample, random_state=RANDOM_STATE)
+        print(f"\n✓ Tuning sample: {len(tuning.rows)} of {len(y_train)} training rows, stratified "
+              f"by target × Gender × age band")
+    try:
+        with metrics.span('stage', stage='train', target=target_col):
+            models_dict, results_df = train_all_models(
+                X_train_processed, y_train, X_val_processed, y_val,
+                search_strategies=search_overrides(args.search), budget=search_budget(args), planner=planner,
+                fold_cache=fold_cache, queue=queue, store=store, predictions=predictions, oof=oof,
+                tuning=tuning, preprocessor=features.preprocessor
+            )
+        if oof is not None:
+            with metrics.span('stage', stage='ensemble', target=target_col):
+                models_dict, results_df = train_ensembles(models_dict, results_df, oof, y_train,
+                                                          X_val_processed, y_val, predictions)
+    finally:
+        if oof is not None:
+            oof.cleanup()
     
     # ========================================
     # 6. Compare models
@@ -590,7 +1263,7 @@ def main():
     
     # Check if target is met
     best_acc = results_df.iloc[0]['Validation Accuracy']
-    target_acc = 0.85
+    target_acc = TARGET_ACCURACY
     
     if best_acc >= target_acc:
         print(f"\n🎯 ✓ Target achieved! Best validation accuracy: {best_acc*100:.2f}% ≥ {target_acc*100:.0f}%")
@@ -599,8 +1272,6 @@ def main():
         print(f"\n⚠ Target not achieved. Best: {best_acc*100:.2f}%, Target: {target_acc*100:.0f}% (gap: {gap:.2f}%)")
         print(f"\nPossible improvements:")
         print(f"  - Feature engineering (polynomial features, interactions)")
-        print(f"  - Advanced text processing for 'Symptoms' column")
-        print(f"  - Ensemble methods (stacking, voting)")
         print(f"  - More hyperparameter tuning iterations")
         print(f"  - Address class imbalance with SMOTE/ADASYN")
     
@@ -609,13 +1280,454 @@ def main():
     # ========================================
     best_model_name = results_df.iloc[0]['Model']
     best_model = models_dict[best_model_name]
+    numerical_features, categorical_features = features.numerical_features, features.categorical_features
+    
+    with metrics.span('stage', stage='evaluate', target=target_col):
+        evaluation = evaluate_best_model(
+            best_model, best_model_name,
+            X_train_processed, X_val_processed, X_test_processed,
+            y_train, y_val, y_test,
+            numerical_features + categorical_features,
+            predictions=predictions, plots='off' if args.no_plots else 'background',
+            preprocessor=features.preprocessor, plot_suffix=plot_suffix
+        )
+    importance = evaluation.pop('importance', {})
+    test_acc = evaluation['test_accuracy']
+    probability = {name: float(evaluation[name]) for name in ('val_log_loss', 'val_brier',
+                                                              'test_log_loss', 'test_brier')
+                   if name in evaluation}
+    
+    # Export the fitted preprocessor and best model for the predict module
+    with metrics.span('stage', stage='export', target=target_col):
+        metadata = export_artifact(
+            artifact_path, features.preprocessor, best_model, best_model_name, target_col,
+            raw_columns=raw_columns,
+            numerical_features=numerical_features,
+            categorical_features=categorical_features,
+            features_version=FEATURES_VERSION,
+            metrics={'validation_accuracy': float(best_acc), 'test_accuracy': float(test_acc),
+                     **probability},
+            # Reference row for per-patient explanations at scoring time
+            extra={'explanation': {'background': np.asarray(X_train_processed.mean(axis=0)).ravel().tolist()}}
+        )
+        for key, table in importance.items():
+            save_importance(artifact_path, metadata['model_version'], key, table)
+    print(f"\n✓ Model artifact exported: {artifact_path} (version {metadata['model_version']})")
+    
+    # Record the rows, splits and preprocessor statistics for --incremental runs
+    write_manifest(artifact_path, data_path, target_col,
+                   split_assignments(len(df), features.X_train.index, features.X_val.index,
+                                     features.X_test.index),
+                   PreprocessorStats(numerical_features, categorical_features).update(features.X_train),
+                   blocks=None if args.no_dataset_cache else source_blocks(data_path))
+    
+    return {'target': target_col, 'model': best_model_name, 'artifact': artifact_path,
+            'validation_accuracy': float(best_acc), 'test_accuracy': float(test_acc), **probability}
+
+
+def retrain_incremental(data_path, artifact_path):
+    """
+    Update the exported model with the rows appended to the CSV since it was trained.
     
-    test_acc = evaluate_best_model(
-        best_model, best_model_name,
-        X_train_processed, X_val_processed, X_test_processed,
-        y_train, y_val, y_test,
-        numerical_features + categorical_features
+    New rows are parsed on their own, assigned to train/validation/test by a
+    hash of their ID (stratified by target within the batch), folded into
+    the preprocessor statistics, and used to continue the existing model
+    (partial_fit / warm start) with the hyperparameters found by the last
+    full run. Work is proportional to the new rows: previous rows are only
+    touched as a bounded replay sample and evaluation sample.
+    
+    Returns:
+        metadata: Metadata of the updated artifact, or None when a full
+                  retrain is required
+    """
+    print_section("INCREMENTAL RETRAINING")
+    
+    loaded = load_manifest(artifact_path)
+    if loaded is None or not os.path.exists(artifact_path):
+        print("\n⚠ No manifest from a previous run; falling back to a full retrain")
+        return None
+    manifest, old_splits = loaded
+    appended = find_appended_rows(manifest, data_path)
+    if appended is None:
+        print(f"\n⚠ {data_path} was rewritten, not appended to; falling back to a full retrain")
+        return None
+    offset, blocks = appended
+    digest = combine_digests(blocks)
+    record_source_blocks(data_path, blocks)
+    
+    artifact = load_artifact(artifact_path)
+    metadata, preprocessor, model = artifact['metadata'], artifact['preprocessor'], artifact['model']
+    if offset == os.path.getsize(data_path):
+        print(f"\n✓ No new rows since model version {metadata['model_version']}; nothing to do")
+        return metadata
+    if incremental_method(model) is None:
+        print(f"\n⚠ {type(model).__name__} cannot be updated incrementally; falling back to a full retrain")
+        return None
+    
+    # Parse only the appended rows; extend the cached columns instead of re-parsing the file
+    typed, raw = zip(*iter_appended_chunks(data_path, offset, raw=True))
+    new_rows = concat_chunks(typed).reset_index(drop=True)
+    new_features = engineer_clinical_features(new_rows)
+    cached = extend_cached_data(data_path, manifest['digest'], digest, new_rows,
+                                raw=pd.concat(raw, ignore_index=True))
+    features = extend_cached_table(data_path, manifest['digest'], digest,
+                                   f"clinical-v{FEATURES_VERSION}", new_features)
+    if cached is None or features is None:
+        print("\n⚠ Previous dataset version is not cached; falling back to a full retrain")
+        return None
+    print(f"\n✓ {len(new_rows)} appended rows (previous run: {manifest['rows']} rows)")
+    
+    target_col = manifest['target']
+    schema = metadata['schema']
+    numerical_features, categorical_features = schema['numerical_features'], schema['categorical_features']
+    
+    def rows_of(rows):
+        """Features and target of some rows of the grown file (only those rows are converted)."""
+        X = features.iloc[rows][numerical_features + categorical_features].reset_index(drop=True)
+        X[numerical_features] = X[numerical_features].apply(pd.to_numeric, errors='coerce')
+        return X, features[target_col].iloc[rows].to_numpy()
+    
+    ids = new_rows['Patient_ID'] if 'Patient_ID' in new_rows else pd.Series(range(offset, offset + len(new_rows)))
+    labelled = new_rows[target_col].notna().to_numpy()
+    new_splits = np.full(len(new_rows), -1, dtype=np.int8)
+    new_splits[labelled] = assign_splits(ids[labelled], y=new_rows[target_col][labelled])
+    splits = np.concatenate([old_splits, new_splits])
+    n_old = len(old_splits)
+    new_train = n_old + np.flatnonzero(new_splits == SPLIT_CODES['train'])
+    X_train_new, y_train_new = rows_of(new_train)
+    
+    # Preprocessor statistics: add the new training rows, then rebase the model onto them
+    stats = PreprocessorStats.from_dict(manifest['stats'])
+    n_seen = stats.rows
+    stats.update(X_train_new)
+    unseen = stats.new_categories(preprocessor)
+    if unseen:
+        print(f"\n⚠ New categories {unseen} change the feature layout; falling back to a full retrain")
+        return None
+    old_mean, old_scale, new_mean, new_scale = stats.apply(preprocessor)
+    rebase_model(model, preprocessor.output_indices_['num'], old_mean, old_scale, new_mean, new_scale,
+                 supports=stats.supports(numerical_features))
+    print(f"✓ Preprocessor statistics updated: {n_seen} → {stats.rows} training rows")
+    
+    rng = np.random.default_rng(RANDOM_STATE)
+    old_train = np.flatnonzero(old_splits == SPLIT_CODES['train'])
+    
+    def history(n):
+        X_old, y_old = rows_of(np.sort(rng.choice(old_train, size=min(n, len(old_train)), replace=False)))
+        return ensure_supported_input(model, preprocessor.transform(X_old)), y_old
+    
+    X_new = ensure_supported_input(model, preprocessor.transform(X_train_new))
+    how = continue_training(model, X_new, y_train_new, history, n_seen)
+    if how is None:
+        print("\n⚠ New rows cannot be absorbed by the current model; falling back to a full retrain")
+        return None
+    print(f"✓ {metadata['model_name']} updated: {how}")
+    
+    # Score every new held-out row plus a fixed-size sample of the previous ones
+    accuracies = {}
+    for name in ('val', 'test'):
+        old_rows = np.flatnonzero(old_splits == SPLIT_CODES[name])
+        old_rows = rng.choice(old_rows, size=min(INCREMENTAL_EVAL_ROWS, len(old_rows)), replace=False)
+        rows = np.sort(np.concatenate([old_rows, n_old + np.flatnonzero(new_splits == SPLIT_CODES[name])]))
+        X_eval, y_eval = rows_of(rows)
+        pred = model.predict(ensure_supported_input(model, preprocessor.transform(X_eval)))
+        accuracies[name] = accuracy_score(y_eval, pred)
+        accuracies[f"{name}_rows"] = len(rows)
+    print(f"  Validation accuracy:  {accuracies['val']:.4f} ({accuracies['val']*100:.2f}%, "
+          f"{accuracies['val_rows']} rows)")
+    print(f"  Test accuracy:        {accuracies['test']:.4f} ({accuracies['test']*100:.2f}%, "
+          f"{accuracies['test_rows']} rows)")
+    
+    updated = export_artifact(
+        artifact_path, preprocessor, model, metadata['model_name'], target_col,
+        raw_columns=schema['raw_columns'],
+        numerical_features=numerical_features,
+        categorical_features=categorical_features,
+        features_version=schema['features_version'],
+        metrics={'validation_accuracy': float(accuracies['val']),
+                 'test_accuracy': float(accuracies['test'])},
+        extra={'incremental': {'base_model_version': metadata['model_version'],
+                               'rows_added': int(len(new_rows)), 'update': how},
+               **{key: metadata[key] for key in ('explanation',) if key in metadata}}
     )
+    write_manifest(artifact_path, data_path, target_col, splits, stats, blocks=blocks)
+    print(f"\n✓ Model artifact updated: {artifact_path} (version {updated['model_version']})")
+    return updated
+
+
+def train_out_of_core(data_path, model_kind='sgd', artifact_path=DEFAULT_ARTIFACT_PATH,
+                      memory_gb=8.0, epochs=5, chunksize=100_000):
+    """
+    Train without loading the dataset: two streamed passes over the CSV, then
+    training from memory-mapped, preprocessed splits.
+    
+    Args:
+        data_path: Patient CSV (may be larger than memory)
+        model_kind: 'sgd' (partial_fit logistic regression on float32 features)
+                    or 'hist_gb' (histogram boosting on uint8 bin codes)
+        artifact_path: Where to export the model artifact
+        memory_gb: Memory budget for the in-memory booster sample
+        epochs: Passes over the training split for 'sgd'
+        chunksize: Rows per streamed chunk
+    
+    Returns:
+        metadata: Metadata of the exported artifact
+    """
+    print_section("OUT-OF-CORE TRAINING")
+    metrics = instrumentation.get()
+    
+    # Target from the streaming profile (cached after the first run)
+    profile = cached_profile(data_path)
+    raw_columns = list(profile.columns)
+    target_col = identify_target_column(profile, raw_columns)
+    raw_columns.remove(target_col)
+    
+    # Pass 1: split assignment, preprocessing statistics and class counts
+    stats = None
+    class_counts = Counter()
+    label_counts = Counter()
+    split_counts = Counter()
+    with metrics.span('stage', stage='ooc_statistics'):
+        for features, splits in iter_engineered_chunks(data_path, target_col, chunksize):
+            if stats is None:
+                X = features.drop(columns=[target_col])
+                X = X.drop(columns=[c for c in X.columns if 'id' in c.lower() or 'patient' in c.lower()])
+                numerical_features, categorical_features = identify_feature_types(X.copy(), X.iloc[:0].copy(),
+                                                                                  X.iloc[:0].copy())
+                stats = PreprocessorStats(numerical_features, categorical_features)
+            train = np.flatnonzero(splits == SPLIT_CODES['train'])
+            stats.update(select_features(features.iloc[train], numerical_features, categorical_features))
+            class_counts.update(features[target_col].iloc[train].astype(str).value_counts().to_dict())
+            label_counts.update(features[target_col].dropna().astype(str).value_counts().to_dict())
+            split_counts.update({name: int(np.sum(splits == code)) for name, code in SPLIT_CODES.items()})
+    
+    counts = {name: split_counts[name] for name in SPLIT_CODES}
+    # Every label of any split gets a code; one never seen in training is reported
+    classes = np.array(sorted(label_counts), dtype=object)
+    print(f"\n✓ Streamed {sum(counts.values())} labelled rows: "
+          + ", ".join(f"{name} {n}" for name, n in counts.items()))
+    print(f"  Class counts (train): {dict(class_counts)}")
+    held_out_only = sorted(set(label_counts) - set(class_counts))
+    if held_out_only:
+        print(f"  ⚠ Classes only in validation/test (never predicted): {held_out_only}")
+    
+    preprocessor = create_preprocessing_pipeline(None, numerical_features, categorical_features, verbose=False)
+    stats.fit_preprocessor(preprocessor)
+    class_weight = class_weight_from_counts(pd.Series(class_counts))
+    
+    # Pass 2: transform chunks into per-split memory maps
+    binner = FeatureBinner(bin_edges(stats, preprocessor)).fit(None) if model_kind == 'hist_gb' else None
+    directory = os.path.join(OOC_DIR, model_kind)
+    with metrics.span('stage', stage='ooc_transform'):
+        data = write_splits(data_path, target_col, preprocessor, numerical_features, categorical_features,
+                            classes, counts, directory, binner=binner, chunksize=chunksize)
+    layout = "uint8 bin codes" if binner is not None else "float32 features"
+    print(f"\n✓ Preprocessed splits memory-mapped in {directory} ({layout}, "
+          f"{sum(x.nbytes for x in data.X.values()) / 1024**2:.1f} MB on disk)")
+    
+    with metrics.span('stage', stage='ooc_train', model=model_kind):
+        if model_kind == 'sgd':
+            weights = None
+            if class_weight == 'balanced':
+                total = sum(class_counts.values())
+                weights = {c: total / (len(classes) * n) for c, n in class_counts.items()}
+            model = fit_sgd(data, classes, class_weight=weights, epochs=epochs, block_rows=chunksize,
+                            random_state=RANDOM_STATE)
+            scorer, model_name = model, "SGD Logistic Regression"
+            print(f"✓ SGD logistic regression: {epochs} partial_fit epochs over {counts['train']} rows")
+        else:
+            max_rows = max(int(memory_gb * 1024**3 / (data.X['train'].shape[1] * 8 * 3)), 1)
+            model = fit_hist_gb(data, classes, binner, max_rows, class_weight=class_weight,
+                                random_state=RANDOM_STATE)
+            scorer, model_name = model.named_steps['hgb'], "Histogram Gradient Boosting"
+            print(f"✓ Histogram gradient boosting on {min(max_rows, counts['train'])} of "
+                  f"{counts['train']} training rows ({scorer.n_iter_} iterations)")
+    
+    val_acc = streamed_accuracy(scorer, data, 'val', classes, chunksize)
+    test_acc = streamed_accuracy(scorer, data, 'test', classes, chunksize)
+    print(f"  Validation accuracy:  {val_acc:.4f} ({val_acc*100:.2f}%)")
+    print(f"  Test accuracy:        {test_acc:.4f} ({test_acc*100:.2f}%)")
+    
+    metadata = export_artifact(
+        artifact_path, preprocessor, model, model_name, target_col,
+        raw_columns=raw_columns,
+        numerical_features=numerical_features,
+        categorical_features=categorical_features,
+        features_version=FEATURES_VERSION,
+        metrics={'validation_accuracy': float(val_acc), 'test_accuracy': float(test_acc)},
+        extra={'out_of_core': {'model': model_kind, 'rows': counts}}
+    )
+    print(f"\n✓ Model artifact exported: {artifact_path} (version {metadata['model_version']})")
+    return metadata
+
+
+def parse_args(argv=None):
+    """Parse command-line options for the training pipeline."""
+    parser = argparse.ArgumentParser(description="ERM-based patient model training pipeline")
+    parser.add_argument('--cores', type=int, default=None,
+                        help="Core budget shared by CV workers and estimator threads (default: all)")
+    parser.add_argument('--backend', choices=list(BACKENDS), default='loky',
+                        help="Parallel backend for the CV workers")
+    parser.add_argument('--sparse', action='store_true',
+                        help="Keep one-hot features as CSR matrices end to end")
+    parser.add_argument('--no-dataset-cache', action='store_true',
+                        help="Re-parse the CSV instead of using the columnar dataset cache")
+    parser.add_argument('--artifact', default=DEFAULT_ARTIFACT_PATH,
+                        help="Where to export the best model artifact")
+    parser.add_argument('--targets', default=None,
+                        help="Comma-separated target columns trained in one run (sharing parsing, "
+                             f"splits, fold caches and workers), or 'front-end' for risk level, "
+                             "department and comorbidity. Targets other than the identified one are "
+                             f"exported next to --artifact with the target in the file name. "
+                             f"{list(DERIVED_TARGETS)} come from the triage rules: they are reported "
+                             "as rule-served and not trained")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Update the exported model with rows appended since the last run "
+                             "instead of retraining (falls back to a full retrain when not possible)")
+    parser.add_argument('--out-of-core', choices=OOC_MODELS, default=None,
+                        help="Stream the CSV instead of loading it and train this model from "
+                             "memory-mapped splits")
+    parser.add_argument('--memory-gb', type=float, default=8.0,
+                        help="Memory budget for the out-of-core hist_gb training sample")
+    parser.add_argument('--search', choices=[s for s in SEARCH_STRATEGIES if s != 'distributed'], default=None,
+                        help="Search strategy for every model (default: per model, see DEFAULT_SEARCH_STRATEGIES)")
+    parser.add_argument('--max-fits', type=int, default=None,
+                        help="CV fit budget per model search (random, adaptive and halving strategies)")
+    parser.add_argument('--max-seconds', type=float, default=None,
+                        help="Wall-clock budget per model search (random and adaptive strategies)")
+    parser.add_argument('--search-queue', default=None,
+                        help="Distribute the CV fits through this work-queue directory (shared "
+                             "with workers started by `python distributed_search.py --queue DIR`)")
+    parser.add_argument('--local-workers', type=int, default=0,
+                        help="Queue workers to start on this host for --search-queue")
+    parser.add_argument('--result-store', default=RESULT_STORE_DIR,
+                        help="Content-addressed store of CV fold results; re-runs only fit new cells")
+    parser.add_argument('--no-result-store', action='store_true',
+                        help="Fit every CV cell, without reading or writing the result store")
+    parser.add_argument('--store-models', action='store_true',
+                        help="Also keep fitted fold models in the result store")
+    parser.add_argument('--tune-sample', default=None,
+                        help="Explore hyperparameters on a stratified sample of the training rows "
+                             "(a fraction ≤ 1 or a row count), then score only the top configurations "
+                             "on the full data")
+    parser.add_argument('--tune-top-k', type=int, default=3,
+                        help="Configurations of the sample search scored on the full data")
+    parser.add_argument('--verify-sample', action='store_true',
+                        help="With --tune-sample, also run the full search and report how the sample "
+                             "ranking agrees with it over the whole grid")
+    parser.add_argument('--no-ensemble', action='store_true',
+                        help="Skip the stacking / voting ensembles built from out-of-fold predictions")
+    parser.add_argument('--no-plots', action='store_true',
+                        help="Skip the confusion-matrix and feature-importance PNGs")
+    parser.add_argument('--metrics-jsonl', default=None,
+                        help="Append stage/search timings, peak memory and counters as JSON lines")
+    parser.add_argument('--metrics-prom', default=None,
+                        help="Write run metrics as a Prometheus textfile (node_exporter textfile collector)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Main execution function."""
+    args = parse_args(argv)
+    metrics = instrumentation.configure(args.metrics_jsonl, args.metrics_prom)
+    
+    print("\n")
+    print("╔" + "═" * 78 + "╗")
+    print("║" + " " * 78 + "║")
+    print("║" + "  Empirical Risk Minimization (ERM) Machine Learning Pipeline".center(78) + "║")
+    print("║" + "  Target: ~85% Validation Accuracy".center(78) + "║")
+    print("║" + " " * 78 + "║")
+    print("╚" + "═" * 78 + "╝")
+    
+    # ========================================
+    # 1. Load and explore data
+    # ========================================
+    data_path = 'patient_dataset_5000_realistic.csv'
+    if args.out_of_core:
+        train_out_of_core(data_path, args.out_of_core, args.artifact, memory_gb=args.memory_gb)
+        metrics.close()
+        return
+    
+    if args.incremental and args.targets is not None:
+        print("\nNote: --incremental updates a single-target artifact; retraining every target")
+    elif args.incremental:
+        with metrics.span('stage', stage='incremental'):
+            updated = retrain_incremental(data_path, args.artifact)
+        if updated is not None:
+            metrics.close()
+            return
+    
+    with metrics.span('stage', stage='load'):
+        df, default_target = load_and_explore_data(data_path, use_cache=not args.no_dataset_cache)
+    try:
+        targets = resolve_targets(args.targets, df.columns, default_target)
+    except ValueError as exc:
+        raise SystemExit(f"✗ {exc}")
+    
+    # Rule outputs are not learned: a model of them would only replicate triage_rules
+    served_by_rules = rule_targets(targets, df.columns)
+    targets = [t for t in targets if t not in served_by_rules]
+    for target in served_by_rules:
+        print(f"\nℹ '{target}' is a deterministic output of the triage rules "
+              f"(triage_rules.score_triage → '{DERIVED_TARGETS[target]}'): served by the rule "
+              f"scorer, not trained or exported as a model")
+    if not targets:
+        print("\n✓ No labelled targets to train")
+        metrics.close()
+        return
+    raw_columns = [col for col in df.columns if col not in targets]
+    
+    # Vectorized clinical features: BP → systolic/diastolic, Symptoms → multi-hot
+    with metrics.span('stage', stage='features'):
+        if args.no_dataset_cache:
+            df = engineer_clinical_features(df)
+        else:
+            df = cached_table(data_path, f"clinical-v{FEATURES_VERSION}",
+                              lambda: engineer_clinical_features(df))
+    print(f"\n✓ Clinical features engineered: {df.shape[1]} columns "
+          f"(Blood Pressure → systolic/diastolic, Symptoms → multi-hot)")
+    # Targets labelled on the same rows share the split, preprocessing and fold cache
+    groups = group_targets(df, targets)
+    if len(targets) > 1:
+        print_section("TARGETS")
+        for group in groups:
+            for target in group:
+                print(f"  - {target:25s} {df[target].nunique():2d} classes, "
+                      f"{df[target].notna().sum()} labelled rows")
+            if len(group) > 1:
+                print(f"    ↳ share one split, preprocessor and CV fold cache")
+    
+    planner = ParallelismPlanner(cores=args.cores, backend=args.backend)
+    print(f"\n✓ Core budget: {planner.cores} cores, backend: {planner.backend}")
+    queue = None
+    if args.search_queue:
+        queue = QueueConfig(args.search_queue, local_workers=args.local_workers)
+        print(f"✓ Distributed search: work queue {queue.directory}, {queue.local_workers} local worker(s)")
+        if not queue.local_workers:
+            print(f"  Waiting for remote workers; a search fails after {queue.idle_timeout:.0f}s "
+                  f"without any task claimed")
+    store = None
+    if not args.no_result_store:
+        store = ResultStore(args.result_store, save_models=args.store_models)
+        print(f"✓ Result store: {store.directory} ({store.count_cells()} CV fits stored)")
+    
+    summaries = []
+    # Local queue workers are started once and serve every search of every target
+    with (local_worker_pool(queue) if queue is not None else contextlib.nullcontext()) as pool:
+        for group in groups:
+            features = prepare_features(df, group, [t for t in targets if t not in group],
+                                        sparse_output=args.sparse, metrics=metrics)
+            for target_col in group:
+                fold_cache = features.fold_cache
+                if target_col != group[0]:
+                    fold_cache = fold_cache.with_target(df.loc[features.X_train.index, target_col])
+                if len(targets) > 1:
+                    print_section(f"TARGET: {target_col}")
+                summaries.append(train_target(
+                    df, target_col, features, fold_cache, args, metrics, data_path, raw_columns,
+                    artifact_path=target_artifact_path(args.artifact, target_col, default_target),
+                    planner=planner, queue=pool, store=store,
+                    plot_suffix='' if target_col == default_target else f".{len(summaries)}"))
     
     # ========================================
     # 8. Final summary
@@ -624,10 +1736,17 @@ def main():
     
     print(f"\n✅ Model Training Complete!")
     print(f"\n📊 Results:")
-    print(f"  - Best Model:         {best_model_name}")
-    print(f"  - Validation Accuracy: {best_acc*100:.2f}%")
-    print(f"  - Test Accuracy:      {test_acc*100:.2f}%")
-    print(f"  - Target:             {target_acc*100:.0f}%")
+    for summary in summaries:
+        if len(summaries) > 1:
+            print(f"\n  [{summary['target']}] → {summary['artifact']}")
+        print(f"  - Best Model:         {summary['model']}")
+        print(f"  - Validation Accuracy: {summary['validation_accuracy']*100:.2f}%")
+        print(f"  - Test Accuracy:      {summary['test_accuracy']*100:.2f}%")
+        if 'test_log_loss' in summary:
+            print(f"  - Test Log Loss:      {summary['test_log_loss']:.4f} (Brier {summary['test_brier']:.4f})")
+    for target in served_by_rules:
+        print(f"\n  [{target}] → served by the triage rules (not a learned model)")
+    print(f"  - Target:             {TARGET_ACCURACY*100:.0f}%")
     
     print(f"\n🔬 ERM Approach:")
     print(f"  - Loss Function: Cross-entropy (log loss) for classification")
@@ -636,7 +1755,8 @@ def main():
     print(f"  - Validation: 5-fold stratified cross-validation")
     
     print(f"\n📈 What the model does:")
-    print(f"  The {best_model_name} predicts the target variable ('{target_col}')")
+    for summary in summaries:
+        print(f"  The {summary['model']} predicts the target variable ('{summary['target']}')")
     print(f"  based on patient features. It minimizes classification error on the")
     print(f"  training data while using regularization and cross-validation to")
     print(f"  ensure good generalization to unseen data.")
@@ -644,13 +1764,28 @@ def main():
     print(f"\n🚀 Suggested Improvements:")
     print(f"  1. Feature engineering: Create interaction features, polynomial terms")
     print(f"  2. Text processing: Use TF-IDF or embeddings for symptom descriptions")
-    print(f"  3. Ensemble methods: Combine multiple models via stacking/voting")
+    print(f"  3. Ensembles: Add more diverse base models to the stacking stage")
     print(f"  4. Advanced tuning: Use Optuna or Bayesian optimization")
     print(f"  5. Deep learning: Try neural networks if >5000 samples available")
     
     print(f"\n{'═' * 80}")
     print(f"  🎉 Pipeline execution completed successfully!")
     print(f"{'═' * 80}\n")
+    
+    try:
+        for path in wait_for_plots():
+            print(f"✓ Plot saved to: {path}")
+    except Exception as exc:
+        print(f"⚠ Plot rendering failed: {exc}")
+    
+    for summary in summaries:
+        metrics.event('result', target=summary['target'], model=summary['model'],
+                      validation_accuracy=summary['validation_accuracy'],
+                      test_accuracy=summary['test_accuracy'])
+    metrics.close()
+    if args.metrics_jsonl or args.metrics_prom:
+        print("✓ Run metrics written to: "
+              + ", ".join(p for p in (args.metrics_jsonl, args.metrics_prom) if p))
 
 
 if __name__ == "__main__":
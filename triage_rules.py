@@ -0,0 +1,442 @@
+"""
+Rule-Based Triage Scoring
+=========================
+
+Vectorized Python port of ``analyzeTriageData`` (services/geminiService.ts),
+the rule-based risk score the front end computes one patient at a time:
+
+- risk points from temperature, SpO2, systolic BP, pulse and severity
+  thresholds, capped at 100, and the risk level bands derived from them;
+- department and diagnosis matching by keyword against the diagnoses of
+  ``CLINICAL_KNOWLEDGE_BASE`` (the first matching diagnosis wins; with no
+  match, the suggested diagnoses fall back to one nonspecific entry);
+- the derived fields (deterioration, ICU and surgery likelihood, length of
+  stay, treatment cost, financial risk).
+
+``score_triage`` scores a whole DataFrame in one pass: the threshold rules
+are NumPy comparisons over the vital columns, and keyword matching runs
+once per distinct symptom list and is gathered back by code.
+``analyze_triage_reference`` is a line-by-line transliteration of the
+TypeScript for one patient; ``check_parity`` compares the two, and
+``TS_PARITY_CASES`` pins outputs worked out from the TypeScript by hand.
+
+Vitals the dataset does not record (SpO2, severity, insurance) are treated
+like an undefined field in the TypeScript: every comparison with them is
+false, so they add no risk points. An insurance provider counts as recorded
+only when it is truthy in JavaScript, so an empty string does not.
+
+Usage:
+    python triage_rules.py records.csv --output triage_scores.csv
+    python triage_rules.py --check
+    python triage_rules.py --compare-artifact artifacts/model.joblib
+"""
+
+import argparse
+import math
+
+import numpy as np
+import pandas as pd
+
+from clinical_features import split_blood_pressure
+from ingest import iter_patient_chunks
+
+# Department / RiskLevel enum values (types.ts)
+EMERGENCY = 'Emergency'
+CARDIOLOGY = 'Cardiology'
+NEUROLOGY = 'Neurology'
+GENERAL_MEDICINE = 'General Medicine'
+SURGERY = 'Surgery'
+ICU = 'ICU'
+
+RISK_LEVELS = ('Low', 'Medium', 'High', 'Critical')
+
+# CLINICAL_KNOWLEDGE_BASE.diagnoses, in matching order
+DIAGNOSES = [
+    {'keywords': ('chest pain', 'pressure', 'heart'), 'name': 'Acute Coronary Syndrome',
+     'icd': 'I21.9', 'dept': CARDIOLOGY},
+    {'keywords': ('abdominal pain', 'stomach', 'vomiting'), 'name': 'Acute Appendicitis',
+     'icd': 'K35.80', 'dept': SURGERY},
+    {'keywords': ('headache', 'weakness', 'speech', 'stroke'), 'name': 'Ischemic Stroke',
+     'icd': 'I63.9', 'dept': NEUROLOGY},
+    {'keywords': ('cough', 'fever', 'chills', 'breath'), 'name': 'Pneumonia',
+     'icd': 'J18.9', 'dept': GENERAL_MEDICINE},
+]
+
+# CLINICAL_KNOWLEDGE_BASE.billing base amounts
+BILLING_BASE = {
+    CARDIOLOGY: 8500,
+    SURGERY: 12000,
+    EMERGENCY: 2500,
+    ICU: 15000,
+    GENERAL_MEDICINE: 4000,
+}
+
+UNMATCHED_DIAGNOSIS = 'Undifferentiated acute illness'
+
+# The single suggested diagnosis when no keyword matches
+FALLBACK_DIAGNOSIS = 'Nonspecific Viral Syndrome'
+
+# (threshold rule, points), as in analyzeTriageData
+RISK_RULES = {
+    'temp': (lambda t: (t > 38.5) | (t < 36.0), 20),
+    'spo2': (lambda s: s < 94, 30),
+    'bp_sys': (lambda b: (b > 160) | (b < 90), 25),
+    'pulse': (lambda p: (p > 100) | (p < 50), 15),
+    'severity': (lambda s: s > 7, 10),
+}
+
+# Dataset column feeding each TypeScript vital (SpO2 and severity are not in the CSV)
+DATASET_COLUMNS = {
+    'temp': 'Temperature',
+    'spo2': 'SpO2',
+    'bp_sys': 'Systolic BP',
+    'pulse': 'Heart Rate',
+    'severity': 'Severity',
+}
+
+OUTPUT_COLUMNS = [
+    'risk_score', 'risk_level', 'deterioration_prob', 'icu_likelihood', 'surgery_likelihood',
+    'primary_department', 'primary_diagnosis', 'n_diagnoses', 'est_length_of_stay',
+    'est_treatment_cost', 'financial_risk_score',
+]
+
+# TriageResponse field for each output column (parity with the TypeScript)
+TS_FIELDS = {
+    'risk_score': 'riskScore',
+    'risk_level': 'riskLevel',
+    'deterioration_prob': 'deteriorationProb',
+    'icu_likelihood': 'icuLikelihood',
+    'surgery_likelihood': 'surgeryLikelihood',
+    'primary_department': 'primaryDepartment',
+    'est_length_of_stay': 'estLengthOfStay',
+    'est_treatment_cost': 'estTreatmentCost',
+    'financial_risk_score': 'financialRiskScore',
+}
+
+
+def _js_round(x):
+    """JavaScript ``Math.round`` (halves round up, unlike NumPy's half-to-even)."""
+    return np.floor(np.asarray(x, dtype=np.float64) + 0.5).astype(np.int64)
+
+
+def _risk_level(score):
+    return np.select([score > 75, score > 50, score > 25], list(RISK_LEVELS[:0:-1]), RISK_LEVELS[0])
+
+
+def _match_symptom_lists(symptom_lists):
+    """
+    Keyword matches for distinct symptom lists.
+
+    Returns:
+        (first matching diagnosis index or -1, number of matching diagnoses,
+         whether any symptom mentions 'pain') per list
+    """
+    first = np.full(len(symptom_lists), -1, dtype=np.int8)
+    n_matches = np.zeros(len(symptom_lists), dtype=np.int8)
+    pain = np.zeros(len(symptom_lists), dtype=bool)
+    for i, symptoms in enumerate(symptom_lists):
+        lowered = [s.lower() for s in symptoms]
+        for d, diagnosis in enumerate(DIAGNOSES):
+            if any(k in s for s in lowered for k in diagnosis['keywords']):
+                n_matches[i] += 1
+                if first[i] < 0:
+                    first[i] = d
+        pain[i] = any('pain' in s for s in lowered)
+    return first, n_matches, pain
+
+
+def _split_symptoms(text):
+    return [s.strip() for s in text.split(',')] if isinstance(text, str) and text else []
+
+
+def triage_inputs(df):
+    """
+    The TypeScript inputs from patient dataset columns.
+
+    Returns:
+        DataFrame with float 'temp', 'spo2', 'bp_sys', 'pulse', 'severity'
+        (NaN where not recorded) and a boolean 'insured' (a non-empty provider,
+        as JavaScript truthiness would have it)
+    """
+    inputs = pd.DataFrame(index=df.index)
+    systolic = split_blood_pressure(df['Blood Pressure'])['Systolic BP'] if 'Blood Pressure' in df else None
+    for vital, column in DATASET_COLUMNS.items():
+        if column == 'Systolic BP' and systolic is not None:
+            values = systolic
+        elif column in df:
+            values = df[column]
+        else:
+            inputs[vital] = np.nan
+            continue
+        inputs[vital] = pd.to_numeric(values, errors='coerce').astype(np.float64)
+    if 'Insurance Provider' in df:
+        provider = df['Insurance Provider']
+        inputs['insured'] = provider.notna() & provider.astype(object).ne('')
+    else:
+        inputs['insured'] = False
+    return inputs
+
+
+def score_triage(df):
+    """
+    Rule-based triage scores for every row of a patient DataFrame, in one pass.
+
+    Args:
+        df: Patient records (dataset columns, see ``DATASET_COLUMNS``)
+
+    Returns:
+        DataFrame with ``OUTPUT_COLUMNS``, indexed like ``df``
+    """
+    inputs = triage_inputs(df)
+    with np.errstate(invalid='ignore'):
+        points = sum(np.where(rule(inputs[vital].to_numpy()), weight, 0)
+                     for vital, (rule, weight) in RISK_RULES.items())
+    score = np.minimum(100, points).astype(np.int64)
+    level = _risk_level(score)
+
+    symptoms = df['Symptoms'] if 'Symptoms' in df else pd.Series(np.nan, index=df.index, dtype=object)
+    codes, uniques = pd.factorize(symptoms, use_na_sentinel=True)
+    first, n_matches, pain = _match_symptom_lists([_split_symptoms(u) for u in uniques] + [[]])
+    rows = np.where(codes < 0, len(uniques), codes)
+    first, n_matches, pain = first[rows], n_matches[rows], pain[rows]
+
+    # Index -1 (no match) picks the trailing Emergency / undifferentiated entry
+    departments = np.array([d['dept'] for d in DIAGNOSES] + [EMERGENCY], dtype=object)
+    names = np.array([d['name'] for d in DIAGNOSES] + [UNMATCHED_DIAGNOSIS], dtype=object)
+    base = np.array([BILLING_BASE.get(d, BILLING_BASE[EMERGENCY]) for d in departments], dtype=np.int64)
+
+    return pd.DataFrame({
+        'risk_score': score,
+        'risk_level': level,
+        'deterioration_prob': _js_round(score * 0.8),
+        'icu_likelihood': np.where(score > 60, _js_round(score * 0.5), 5),
+        'surgery_likelihood': np.where(pain, 45, 10),
+        'primary_department': departments[first],
+        'primary_diagnosis': names[first],
+        # Entries of suggestedDiagnoses: the matches, or the one fallback diagnosis
+        'n_diagnoses': np.maximum(n_matches, 1),
+        'est_length_of_stay': np.where(level == 'Critical', 7, 2),
+        'est_treatment_cost': base[first] + score * 100,
+        'financial_risk_score': np.where(inputs['insured'].to_numpy(dtype=bool), 20, 85),
+    }, index=df.index)
+
+
+def analyze_triage_reference(patient):
+    """
+    ``analyzeTriageData`` for one patient, transliterated from the TypeScript.
+
+    Args:
+        patient: dict with 'vitals' ({'temp', 'spo2', 'bp_sys', 'pulse'}),
+                 'severity', 'symptoms' (list) and optionally 'insurance'
+
+    Returns:
+        dict of TriageResponse fields used for parity
+    """
+    def defined(value):
+        return value is not None and not (isinstance(value, float) and math.isnan(value))
+
+    def gt(value, threshold):
+        return defined(value) and value > threshold
+
+    def lt(value, threshold):
+        return defined(value) and value < threshold
+
+    risk_points = 0
+    v = patient['vitals']
+
+    if gt(v.get('temp'), 38.5) or lt(v.get('temp'), 36.0): risk_points += 20
+    if lt(v.get('spo2'), 94): risk_points += 30
+    if gt(v.get('bp_sys'), 160) or lt(v.get('bp_sys'), 90): risk_points += 25
+    if gt(v.get('pulse'), 100) or lt(v.get('pulse'), 50): risk_points += 15
+    if gt(patient.get('severity'), 7): risk_points += 10
+
+    score = min(100, risk_points)
+    level = ('Critical' if score > 75 else 'High' if score > 50 else
+             'Medium' if score > 25 else 'Low')
+
+    matches = [d for d in DIAGNOSES
+               if any(any(k in s.lower() for k in d['keywords']) for s in patient['symptoms'])]
+
+    primary_dept = matches[0]['dept'] if matches else EMERGENCY
+    billing_base = BILLING_BASE.get(primary_dept, BILLING_BASE[EMERGENCY])
+
+    return {
+        'riskScore': score,
+        'riskLevel': level,
+        'deteriorationProb': math.floor(score * 0.8 + 0.5),
+        'icuLikelihood': math.floor(score * 0.5 + 0.5) if score > 60 else 5,
+        'surgeryLikelihood': 45 if any('pain' in s.lower() for s in patient['symptoms']) else 10,
+        'primaryDepartment': primary_dept,
+        'primaryDiagnosis': matches[0]['name'] if matches else UNMATCHED_DIAGNOSIS,
+        'suggestedDiagnoses': [m['name'] for m in matches] if matches else [FALLBACK_DIAGNOSIS],
+        'estLengthOfStay': 7 if level == 'Critical' else 2,
+        'estTreatmentCost': billing_base + score * 100,
+        'financialRiskScore': 20 if (patient.get('insurance') or {}).get('provider') else 85,
+    }
+
+
+# INITIAL_PATIENTS (constants.ts) and threshold edge cases, with the
+# TriageResponse worked out from analyzeTriageData by hand
+TS_PARITY_CASES = [
+    ({'vitals': {'temp': 37.2, 'bp_sys': 165, 'pulse': 92, 'spo2': 94}, 'severity': 8,
+      'symptoms': ['Chest Pain', 'Shortness of breath']},
+     {'riskScore': 35, 'riskLevel': 'Medium', 'deteriorationProb': 28, 'icuLikelihood': 5,
+      'surgeryLikelihood': 45, 'primaryDepartment': CARDIOLOGY, 'estLengthOfStay': 2,
+      'estTreatmentCost': 12000, 'financialRiskScore': 85}),
+    ({'vitals': {'temp': 38.8, 'bp_sys': 110, 'pulse': 105, 'spo2': 96}, 'severity': 9,
+      'symptoms': ['Acute Abdominal Pain', 'Vomiting']},
+     {'riskScore': 45, 'riskLevel': 'Medium', 'deteriorationProb': 36, 'icuLikelihood': 5,
+      'surgeryLikelihood': 45, 'primaryDepartment': SURGERY, 'estLengthOfStay': 2,
+      'estTreatmentCost': 16500, 'financialRiskScore': 85}),
+    ({'vitals': {'temp': 35.9, 'bp_sys': 85, 'pulse': 45, 'spo2': 90}, 'severity': 10,
+      'symptoms': ['Headache'], 'insurance': {'provider': 'Acme'}},
+     {'riskScore': 100, 'riskLevel': 'Critical', 'deteriorationProb': 80, 'icuLikelihood': 50,
+      'surgeryLikelihood': 10, 'primaryDepartment': NEUROLOGY, 'estLengthOfStay': 7,
+      'estTreatmentCost': 12500, 'financialRiskScore': 20}),
+    ({'vitals': {'temp': 38.5, 'bp_sys': 160, 'pulse': 100, 'spo2': 94}, 'severity': 7,
+      'symptoms': ['Rash']},
+     {'riskScore': 0, 'riskLevel': 'Low', 'deteriorationProb': 0, 'icuLikelihood': 5,
+      'surgeryLikelihood': 10, 'primaryDepartment': EMERGENCY, 'estLengthOfStay': 2,
+      'estTreatmentCost': 2500, 'financialRiskScore': 85,
+      'suggestedDiagnoses': [FALLBACK_DIAGNOSIS]}),
+    ({'vitals': {'temp': 39.0, 'bp_sys': 170, 'pulse': 120, 'spo2': 95}, 'severity': 5,
+      'symptoms': ['Cough', 'Chest pain']},
+     {'riskScore': 60, 'riskLevel': 'High', 'deteriorationProb': 48, 'icuLikelihood': 5,
+      'surgeryLikelihood': 45, 'primaryDepartment': CARDIOLOGY, 'estLengthOfStay': 2,
+      'estTreatmentCost': 14500, 'financialRiskScore': 85}),
+    ({'vitals': {'temp': 37.0, 'bp_sys': 120, 'pulse': 80, 'spo2': 98}, 'severity': 3,
+      'symptoms': ['Fever'], 'insurance': {'provider': ''}},
+     {'riskScore': 0, 'riskLevel': 'Low', 'deteriorationProb': 0, 'icuLikelihood': 5,
+      'surgeryLikelihood': 10, 'primaryDepartment': GENERAL_MEDICINE, 'estLengthOfStay': 2,
+      'estTreatmentCost': 4000, 'financialRiskScore': 85}),
+]
+
+
+def _cases_frame(patients):
+    """Patients (TypeScript shape) as a DataFrame with the dataset columns."""
+    return pd.DataFrame({
+        'Temperature': [p['vitals'].get('temp', np.nan) for p in patients],
+        'SpO2': [p['vitals'].get('spo2', np.nan) for p in patients],
+        'Blood Pressure': [f"{p['vitals']['bp_sys']:.0f}/{p['vitals'].get('bp_dia', 80):.0f}"
+                           if p['vitals'].get('bp_sys') is not None else np.nan for p in patients],
+        'Heart Rate': [p['vitals'].get('pulse', np.nan) for p in patients],
+        'Severity': [p.get('severity', np.nan) for p in patients],
+        'Symptoms': [', '.join(p['symptoms']) for p in patients],
+        'Insurance Provider': [(p.get('insurance') or {}).get('provider') for p in patients],
+    })
+
+
+def _frame_patients(df):
+    """Dataset rows as patients in the TypeScript shape (the reference's input)."""
+    inputs = triage_inputs(df)
+    symptoms = df['Symptoms'] if 'Symptoms' in df else pd.Series(np.nan, index=df.index)
+    return [{'vitals': {'temp': r.temp, 'spo2': r.spo2, 'bp_sys': r.bp_sys, 'pulse': r.pulse},
+             'severity': r.severity, 'symptoms': _split_symptoms(s),
+             'insurance': {'provider': 'recorded'} if r.insured else None}
+            for r, s in zip(inputs.itertuples(), symptoms)]
+
+
+def check_parity(df=None):
+    """
+    Compare ``score_triage`` with the per-patient reference.
+
+    Checks the hand-worked ``TS_PARITY_CASES`` against both implementations,
+    then (when ``df`` is given) every row of ``df``.
+
+    Returns:
+        List of mismatch descriptions (empty when both agree everywhere)
+    """
+    mismatches = []
+    patients, expected = zip(*TS_PARITY_CASES)
+    scored = score_triage(_cases_frame(patients))
+    for i, (patient, want) in enumerate(TS_PARITY_CASES):
+        reference = analyze_triage_reference(patient)
+        for field, value in want.items():
+            if reference[field] != value:
+                mismatches.append(f"case {i}: reference {field}={reference[field]!r}, TypeScript {value!r}")
+        for column, field in TS_FIELDS.items():
+            if scored[column].iloc[i] != want[field]:
+                mismatches.append(f"case {i}: vectorized {field}={scored[column].iloc[i]!r}, "
+                                  f"TypeScript {want[field]!r}")
+        if 'suggestedDiagnoses' in want and scored['n_diagnoses'].iloc[i] != len(want['suggestedDiagnoses']):
+            mismatches.append(f"case {i}: vectorized n_diagnoses={scored['n_diagnoses'].iloc[i]!r}, "
+                              f"TypeScript {len(want['suggestedDiagnoses'])} suggested diagnoses")
+
+    if df is not None:
+        scored = score_triage(df)
+        reference = pd.DataFrame([analyze_triage_reference(p) for p in _frame_patients(df)], index=df.index)
+        fields = dict(TS_FIELDS, primary_diagnosis='primaryDiagnosis')
+        for column, field in fields.items():
+            differ = scored[column].to_numpy() != reference[field].to_numpy()
+            if differ.any():
+                row = df.index[np.argmax(differ)]
+                mismatches.append(f"{field}: {differ.sum()} of {len(df)} rows differ "
+                                  f"(first: row {row}, vectorized {scored.at[row, column]!r}, "
+                                  f"reference {reference.at[row, field]!r})")
+        n_suggested = reference['suggestedDiagnoses'].map(len).to_numpy()
+        if (scored['n_diagnoses'].to_numpy() != n_suggested).any():
+            mismatches.append("suggestedDiagnoses: entry counts differ")
+    return mismatches
+
+
+def score_csv(input_path, output_path, chunksize=500_000):
+    """Score a patient CSV chunk by chunk; returns the number of rows written."""
+    written = 0
+    for i, chunk in enumerate(iter_patient_chunks(input_path, chunksize)):
+        out = score_triage(chunk)
+        if 'Patient_ID' in chunk:
+            out.insert(0, 'Patient_ID', chunk['Patient_ID'])
+        out.to_csv(output_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        written += len(out)
+    return written
+
+
+def compare_with_model(df, artifact_path):
+    """Cross-tabulate the rule-based risk level against the ML model's predictions."""
+    from predict import Predictor
+
+    predictor = Predictor(artifact_path)
+    target = predictor.metadata['target']
+    features = df.drop(columns=[target], errors='ignore')
+    rules = score_triage(df)
+    table = pd.crosstab(pd.Categorical(rules['risk_level'], categories=RISK_LEVELS),
+                        predictor.predict(features), rownames=['Rule risk level'],
+                        colnames=[f"Model: {target}"], dropna=False)
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rule-based triage scores (port of analyzeTriageData)")
+    parser.add_argument('input', nargs='?', default='patient_dataset_5000_realistic.csv',
+                        help="Patient CSV to score")
+    parser.add_argument('--output', default='triage_scores.csv', help="Where to write the scores")
+    parser.add_argument('--check', action='store_true',
+                        help="Check parity with the TypeScript logic on the input instead of scoring")
+    parser.add_argument('--compare-artifact', default=None,
+                        help="Cross-tabulate risk levels against this model artifact's predictions")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        df = next(iter_patient_chunks(args.input, 200_000))
+        mismatches = check_parity(df)
+        if mismatches:
+            print(f"✗ {len(mismatches)} parity mismatch(es):")
+            for mismatch in mismatches:
+                print(f"  - {mismatch}")
+            return 1
+        print(f"✓ Vectorized scores match the TypeScript logic "
+              f"({len(TS_PARITY_CASES)} reference cases, {len(df)} dataset rows)")
+        return 0
+
+    if args.compare_artifact:
+        df = pd.concat(iter_patient_chunks(args.input))
+        print(compare_with_model(df, args.compare_artifact))
+        return 0
+
+    n = score_csv(args.input, args.output)
+    print(f"✓ Scored {n} records → {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())